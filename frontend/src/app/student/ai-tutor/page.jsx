@@ -241,7 +241,7 @@ const AiTutor = () => {
                     
                     if (done) break;
                     
-                    const chunk = decoder.decode(value);
+                    const chunk = decoder.decode(value, { stream: true });
                     buffer += chunk;
                     
                     // Split by lines and process each complete line
@@ -295,6 +295,18 @@ const AiTutor = () => {
                                     
                                     aiResponse.content += data.content;
                                     setMessages(prev => [...prev.slice(0, -1), { ...aiResponse }]);
+                                } else if (data.type === 'image_progress') {
+                                    // Show the generation status, then the thumbnail, until the full image URL arrives
+                                    aiResponse.isImageResponse = true;
+                                    aiResponse.content = data.thumbnail
+                                        ? `![Generated Image](${data.thumbnail})`
+                                        : `_${data.message}_`;
+                                    if (isFirstChunk) {
+                                        setMessages(prev => [...prev, aiResponse]);
+                                        isFirstChunk = false;
+                                    } else {
+                                        setMessages(prev => [...prev.slice(0, -1), { ...aiResponse }]);
+                                    }
                                 } else if (data.type === 'done') {
                                     break;
                                 } else if (data.type === 'error') {
@@ -320,7 +320,7 @@ const VoiceCoach = () => {
                     
                     if (done) break;
                     
-                    const chunk = decoder.decode(value);
+                    const chunk = decoder.decode(value, { stream: true });
                     buffer += chunk;
                     
                     const lines = buffer.split('\n');
@@ -338,8 +338,24 @@ const VoiceCoach = () => {
                                         isFirstChunk = false;
                                     }
                                     
-                                    aiResponse.content += data.content;
+                                    if (data.content.startsWith('__IMAGE_RESPONSE__')) {
+                                        // The generated image replaces the progress placeholder
+                                        aiResponse.content = data.content.replace('__IMAGE_RESPONSE__', '');
+                                    } else {
+                                        aiResponse.content += data.content;
+                                    }
                                     setMessages(prev => [...prev.slice(0, -1), { ...aiResponse }]);
+                                } else if (data.type === 'image_progress') {
+                                    // Show the generation status, then the thumbnail, until the full image URL arrives
+                                    aiResponse.content = data.thumbnail
+                                        ? `![Generated Image](${data.thumbnail})`
+                                        : `_${data.message}_`;
+                                    if (isFirstChunk) {
+                                        setMessages(prev => [...prev, aiResponse]);
+                                        isFirstChunk = false;
+                                    } else {
+                                        setMessages(prev => [...prev.slice(0, -1), { ...aiResponse }]);
+                                    }
                                 } else if (data.type === 'done') {
                                     break;
                                 } else if (data.type === 'error') {
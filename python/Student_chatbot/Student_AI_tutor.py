@@ -5,12 +5,11 @@ import base64
 import asyncio
 from io import BytesIO
 from datetime import datetime
-from typing import List, Optional, Tuple, Dict, Union, AsyncGenerator, TypedDict, Annotated, Any
+from typing import List, Optional, Tuple, Dict, Union, AsyncGenerator, TypedDict, Annotated, Any, Callable
 from dataclasses import field, dataclass
 import concurrent.futures
 import inspect
 from functools import wraps
-import tempfile
 import shutil
 
 from PIL import Image
@@ -18,13 +17,10 @@ from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from langchain.tools import tool, Tool
 import time
-from langchain_google_genai import ChatGoogleGenerativeAI
 import langchain
 from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -44,48 +40,46 @@ from langchain_core.runnables import RunnablePassthrough
 
 # Add error handling for retriever imports
 try:
-    from langchain_community.retrievers import BM25Retriever
     from langchain.retrievers import EnsembleRetriever
     RETRIEVER_AVAILABLE = True
 except ImportError:
     RETRIEVER_AVAILABLE = False
-    logging.warning("BM25Retriever or EnsembleRetriever not available. Hybrid search will be disabled.")
+    logging.warning("EnsembleRetriever not available. Hybrid search will be disabled.")
 
-from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 
 from langsmith import traceable
 
-from langchain_community.document_loaders import (
-    PDFPlumberLoader, Docx2txtLoader, BSHTMLLoader, TextLoader, UnstructuredURLLoader, JSONLoader
-)
+from langchain_community.document_loaders import UnstructuredURLLoader
 
 # Import the web search tool
 from websearch_code import PerplexityWebSearchTool
+from agent_executor import stream_tool_calling_turn
+from query_router import SUMMARY_ROLE, build_rephrase_route_chain, format_chat_history
+from intent_classifier.classifier import get_intent_classifier
+from image_delivery import progress_chunk
+from bm25_index import IncrementalBM25Index, IncrementalBM25Retriever
+from chunking import DocumentChunker
+from content_cache import content_hash_from_key, get_parsed_content_cache
+from document_parsing import SUPPORTED_EXTENSIONS, get_document_parser
+from embedding_cache import cached_embeddings
+from embedding_pipeline import EmbeddingBatchError, EmbeddingProgress, ProgressCallback, get_embedding_scheduler
+from fast_path import (
+    FAST_PATH_MARKER, FILLER_KINDS, answers_open_question, filler_kind, normalize_short_message, templated_reply
+)
+from model_clients import GOOGLE, OPENAI, get_model_registry
+from prompt_cache import SystemPromptCache, render_volatile_suffix
+from semantic_cache import cache_scope, get_semantic_answer_cache, replay_answer, shared_profile
 
 import json
+import uuid
 import re
-from enum import Enum
 from typing import Literal
 from langgraph.prebuilt.tool_node import ToolNode
 from media_toolkit.image_generation_model import ImageGenerator
 
-# Add import for LangGraph streaming
-from langgraph.config import get_stream_writer
-
-# Define the orchestrator state
-class OrchestratorState(TypedDict):
-    """State for the orchestrator agent."""
-    messages: Annotated[list, add_messages]
-    action: Optional[str]
-    image_generation_params: Optional[dict]
-    student_details: Optional[dict]
-    history: Optional[list] # MODIFICATION: Added to track conversation history
-
-# Define the action types
-class ActionType(str, Enum):
-    USE_LLM_WITH_TOOLS = "use_llm_with_tools"
-    GENERATE_IMAGE = "generate_image"
+# The orchestrator graph is compiled once per process and shared by every tutor session
+from tutor_graph import ActionType, get_orchestrator_graph, tutor_run_config
 
 # Image generation tool function
 @tool
@@ -129,6 +123,19 @@ LANGSMITH_PROJECT="Vamshi-test"
 QDRANT_VECTOR_PARAMS = VectorParams(size=1536, distance=Distance.COSINE)
 CONTENT_PAYLOAD_KEY = "page_content"
 METADATA_PAYLOAD_KEY = "metadata"
+# In shared-collection mode every point is tagged with its session under metadata.session_id.
+SESSION_PAYLOAD_KEY = "session_id"
+SESSION_PAYLOAD_FIELD = f"{METADATA_PAYLOAD_KEY}.{SESSION_PAYLOAD_KEY}"
+# Shared collections this process has already created and indexed, so later sessions skip those round trips.
+_ready_shared_collections = set()
+
+
+def _session_index_schema():
+    """Tenant keyword index (qdrant >= 1.11 stores each session's points together); plain keyword index otherwise."""
+    try:
+        return models.KeywordIndexParams(type="keyword", is_tenant=True)
+    except Exception:
+        return models.PayloadSchemaType.KEYWORD
 
 default_qdrant_url = os.getenv("QDRANT_URL", "https://10067e95-a74b-4089-8dc9-db01db8d01f5.eu-west-2-0.aws.cloud.qdrant.io:6333")
 default_qdrant_api_key = os.getenv("QDRANT_API_KEY")
@@ -173,18 +180,32 @@ def async_error_handler(func):
         return coroutine_wrapper
 
 class VectorStoreManager:
-    """Manages the Qdrant vector store operations."""
+    """
+    Manages the Qdrant vector store operations.
+
+    By default every session has its own collection, `qdrant_collection_name`.
+    When `qdrant_shared_collection` is set (QDRANT_SHARED_COLLECTION), all sessions
+    write to that one collection instead: `qdrant_collection_name` then only names
+    the session's partition, stored on each point as metadata.session_id with a
+    payload index. Searches filter on it and clearing a session is a filtered delete.
+    """
     def __init__(self, config):
         self.config = config
         self.qdrant_client = None
         self.vector_store = None
+        self.shared_collection = getattr(config, "qdrant_shared_collection", None)
         
         logging.info(f"VectorStoreManager: Initializing with embedding_model={self.config.embedding_model}")
         logging.info(f"VectorStoreManager: QDRANT_AVAILABLE={QDRANT_AVAILABLE}")
         
-        self.embeddings = OpenAIEmbeddings(
-            model=self.config.embedding_model,
-            openai_api_key=self.config.openai_api_key
+        # Shared, connection-pooled embeddings client (one per model per process);
+        # chunks embedded before (in any session) are served from the embedding cache.
+        self.embeddings = cached_embeddings(
+            get_model_registry().embeddings(
+                model=self.config.embedding_model,
+                api_key=self.config.openai_api_key
+            ),
+            self.config.embedding_model
         )
         
         if QDRANT_AVAILABLE:
@@ -216,21 +237,25 @@ class VectorStoreManager:
             raise ValueError("Cannot initialize collection without a name.")
             
         try:
-            logging.info("Getting collections from Qdrant...")
-            collections = await asyncio.to_thread(self.qdrant_client.get_collections)
-            collection_names = [col.name for col in collections.collections]
-            logging.info(f"Existing collections: {collection_names}")
-
-            if target_collection not in collection_names:
-                logging.info(f"Creating Qdrant collection: {target_collection}")
-                await asyncio.to_thread(
-                    self.qdrant_client.create_collection,
-                    collection_name=target_collection,
-                    vectors_config=QDRANT_VECTOR_PARAMS
-                )
-                logging.info(f"Collection {target_collection} created successfully")
+            if self.shared_collection:
+                await self._ensure_shared_collection()
+                target_collection = self.shared_collection
             else:
-                logging.info(f"Collection {target_collection} already exists")
+                logging.info("Getting collections from Qdrant...")
+                collections = await asyncio.to_thread(self.qdrant_client.get_collections)
+                collection_names = [col.name for col in collections.collections]
+                logging.info(f"Existing collections: {collection_names}")
+
+                if target_collection not in collection_names:
+                    logging.info(f"Creating Qdrant collection: {target_collection}")
+                    await asyncio.to_thread(
+                        self.qdrant_client.create_collection,
+                        collection_name=target_collection,
+                        vectors_config=QDRANT_VECTOR_PARAMS
+                    )
+                    logging.info(f"Collection {target_collection} created successfully")
+                else:
+                    logging.info(f"Collection {target_collection} already exists")
             
             logging.info("Creating QdrantVectorStore...")
             self.vector_store = QdrantVectorStore(
@@ -247,18 +272,92 @@ class VectorStoreManager:
             logging.error(f"Failed to initialize Qdrant collection: {e}")
             self.vector_store = None
             raise
+
+    async def _ensure_shared_collection(self):
+        """Creates the shared collection and its session index, once per process."""
+        name = self.shared_collection
+        if name in _ready_shared_collections:
+            return
+        if not await asyncio.to_thread(self.qdrant_client.collection_exists, name):
+            try:
+                await asyncio.to_thread(
+                    self.qdrant_client.create_collection,
+                    collection_name=name,
+                    vectors_config=QDRANT_VECTOR_PARAMS,
+                    # Searches always filter by session, so per-session HNSW graphs replace the global one.
+                    hnsw_config=models.HnswConfigDiff(payload_m=16, m=0)
+                )
+                logging.info(f"Created shared Qdrant collection: {name}")
+            except Exception:
+                # Another worker may have created it in the meantime.
+                if not await asyncio.to_thread(self.qdrant_client.collection_exists, name):
+                    raise
+        await asyncio.to_thread(
+            self.qdrant_client.create_payload_index,
+            collection_name=name,
+            field_name=SESSION_PAYLOAD_FIELD,
+            field_schema=_session_index_schema()
+        )
+        _ready_shared_collections.add(name)
+
+    def _session_filter(self):
+        """Filter selecting this session's points in shared mode (None in per-session mode)."""
+        if not self.shared_collection:
+            return None
+        return models.Filter(must=[models.FieldCondition(
+            key=SESSION_PAYLOAD_FIELD, match=models.MatchValue(value=self.config.qdrant_collection_name)
+        )])
+
+    async def _delete_session_points(self):
+        await asyncio.to_thread(
+            self.qdrant_client.delete,
+            collection_name=self.shared_collection,
+            points_selector=models.FilterSelector(filter=self._session_filter())
+        )
             
     def get_retriever(self, k: int):
         """Gets a retriever from the initialized vector store."""
         if not self.vector_store:
             raise RuntimeError("Vector store is not initialized. Call initialize_collection first.")
-        return self.vector_store.as_retriever(search_kwargs={"k": k})
+        search_kwargs = {"k": k}
+        if self.shared_collection:
+            search_kwargs["filter"] = self._session_filter()
+        return self.vector_store.as_retriever(search_kwargs=search_kwargs)
         
-    async def aadd_documents(self, documents: List[Document]):
-        """Asynchronously adds documents to the vector store."""
+    async def aadd_documents(self, documents: List[Document], progress: Optional[ProgressCallback] = None) -> int:
+        """
+        Embeds and stores documents in token-sized batches through the shared embedding
+        scheduler (bounded concurrency, backoff on rate limits); each batch is upserted
+        as soon as it is embedded. Raises EmbeddingBatchError if a batch gives up.
+        """
         if not self.vector_store:
             raise RuntimeError("Vector store is not initialized. Call initialize_collection first.")
-        await self.vector_store.aadd_documents(documents)
+        if self.shared_collection:
+            documents = [
+                Document(page_content=doc.page_content,
+                         metadata={**doc.metadata, SESSION_PAYLOAD_KEY: self.config.qdrant_collection_name})
+                for doc in documents
+            ]
+        return await get_embedding_scheduler().run(
+            documents, self.embeddings.aembed_documents, self._upsert_embedded, progress
+        )
+
+    async def _upsert_embedded(self, documents: List[Document], vectors: List[List[float]]):
+        """Writes one embedded batch with the payload layout QdrantVectorStore reads back."""
+        points = [
+            PointStruct(
+                id=uuid.uuid4().hex,
+                vector=vector,
+                payload={CONTENT_PAYLOAD_KEY: doc.page_content, METADATA_PAYLOAD_KEY: doc.metadata}
+            )
+            for doc, vector in zip(documents, vectors)
+        ]
+        await asyncio.to_thread(
+            self.qdrant_client.upsert,
+            collection_name=self.shared_collection or self.config.qdrant_collection_name,
+            points=points,
+            wait=True
+        )
     
 
     @async_error_handler
@@ -272,6 +371,11 @@ class VectorStoreManager:
 
         target_collection = self.config.qdrant_collection_name
         logging.warning(f"Clearing all documents from Qdrant collection: {target_collection}")
+
+        if self.shared_collection:
+            # Only this session's points go; the shared collection itself stays.
+            await self._delete_session_points()
+            return
         
         try:
             await asyncio.to_thread(
@@ -287,6 +391,54 @@ class VectorStoreManager:
             logging.error(f"Error during collection clearing for {target_collection}, attempting to re-initialize. Error: {e}")
             await self.initialize_collection()
 
+    async def load_documents_async(self, batch_size: int = 256) -> List[Document]:
+        """Reads every stored chunk back from the collection, e.g. to rebuild the BM25 index."""
+        if not self.qdrant_client or not self.config.qdrant_collection_name:
+            return []
+        documents, offset = [], None
+        try:
+            while True:
+                points, offset = await asyncio.to_thread(
+                    self.qdrant_client.scroll,
+                    collection_name=self.shared_collection or self.config.qdrant_collection_name,
+                    scroll_filter=self._session_filter(),
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                for point in points:
+                    payload = point.payload or {}
+                    documents.append(Document(
+                        page_content=payload.get(CONTENT_PAYLOAD_KEY, ""),
+                        metadata=payload.get(METADATA_PAYLOAD_KEY) or {}
+                    ))
+                if offset is None:
+                    break
+        except Exception as e:
+            logging.error(f"Error reading collection {self.config.qdrant_collection_name}: {e}")
+            return []
+        return documents
+
+    async def delete_collection_async(self):
+        """Deletes the session's collection (or its points in shared mode) for good, when the session is torn down."""
+        if not self.qdrant_client or not self.config.qdrant_collection_name:
+            return
+        try:
+            if self.shared_collection:
+                await self._delete_session_points()
+                logging.info(f"Deleted points of session {self.config.qdrant_collection_name} from {self.shared_collection}")
+                return
+            await asyncio.to_thread(
+                self.qdrant_client.delete_collection,
+                collection_name=self.config.qdrant_collection_name
+            )
+            logging.info(f"Deleted collection: {self.config.qdrant_collection_name}")
+        except Exception as e:
+            logging.error(f"Error deleting collection {self.config.qdrant_collection_name}: {e}")
+        finally:
+            self.vector_store = None
+
 class TutorState(TypedDict):
     """State for the AI tutor agent."""
     messages: Annotated[list, add_messages]
@@ -301,22 +453,48 @@ class RAGTutorConfig:
     temperature: float = 0.2
     max_tokens: int = 2000
     embedding_model: str = "text-embedding-3-small"
-    chunk_size: int = 1000
-    chunk_overlap: int = 200
+    # Chunk size and overlap in embedding-model tokens (see chunking.DocumentChunker)
+    chunk_size: int = 400
+    chunk_overlap: int = 50
     retrieval_k: int = 5
     image_extensions: Tuple[str, ...] = field(default_factory=lambda: (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp"))
     max_workers: int = 2
     qdrant_url: str = field(default_factory=lambda: default_qdrant_url)
     qdrant_api_key: Optional[str] = field(default_factory=lambda: default_qdrant_api_key)
     qdrant_collection_name: Optional[str] = None
+    # One collection for all sessions, partitioned by a session_id payload (see VectorStoreManager).
+    qdrant_shared_collection: Optional[str] = field(default_factory=lambda: os.getenv("QDRANT_SHARED_COLLECTION") or None)
     web_search_enabled: bool = True
+    # When True, rephrasing and routing share one structured-output LLM call instead of two serial calls.
+    fused_rephrase_routing: bool = field(default_factory=lambda: os.getenv("TUTOR_FUSED_ROUTING", "true").lower() == "true")
+    # Local keyword + hashed n-gram classifier that skips the LLM router for clear non-visual queries.
+    intent_preclassifier_enabled: bool = True
+    intent_classifier_path: Optional[str] = None  # Defaults to intent_classifier/artifacts/intent_router_v1.json
+    # Latency budgets (seconds) for tool calls, which run concurrently. A tool that exceeds its
+    # budget is cancelled and the model is told it timed out instead of stalling the turn.
+    tool_timeouts: Dict[str, float] = field(default_factory=lambda: {
+        "knowledge_base_retriever": float(os.getenv("TUTOR_KB_TOOL_TIMEOUT", "8")),
+        "perplexity_search": float(os.getenv("TUTOR_WEB_SEARCH_TOOL_TIMEOUT", "15")),
+    })
+    default_tool_timeout: float = 20.0
+    # Greetings and fillers skip rephrase/routing/tools and are answered by a cheap model (or a template if None).
+    fast_path_enabled: bool = True
+    fast_path_model: Optional[str] = "gpt-4o-mini"
+    fast_path_persona: str = "You are a friendly and encouraging AI Learning Coach for students."
+    # Opt-in cache of follow-up answers to questions asked without a knowledge base and answered without tools.
+    # Shared by all sessions; answers are only reused within the same grade and language, and an
+    # answer that may be cached is generated with the student's grade only, not the full profile.
+    # With TUTOR_FUSED_ROUTING=false only queries the intent pre-classifier routes locally use it.
+    semantic_cache_enabled: bool = field(default_factory=lambda: os.getenv("TUTOR_SEMANTIC_CACHE", "false").lower() == "true")
+    semantic_cache_threshold: float = field(default_factory=lambda: float(os.getenv("TUTOR_SEMANTIC_CACHE_THRESHOLD", "0.95")))
+    semantic_cache_ttl_seconds: float = field(default_factory=lambda: float(os.getenv("TUTOR_SEMANTIC_CACHE_TTL", "86400")))
+    semantic_cache_max_entries: int = field(default_factory=lambda: int(os.getenv("TUTOR_SEMANTIC_CACHE_SIZE", "2000")))
     
     # MODIFICATION: Split the system prompt into initial and follow-up versions.
+    # Both are a stable, cacheable prefix (persona, rules, profile). The current time and
+    # session status are appended per turn by prompt_cache.render_volatile_suffix.
     initial_system_prompt: str = """You are an expert AI Learning Coach. Your mission is to be a friendly and encouraging guide for students, helping them understand their assignments and learn effectively.
 
-**Student Details:**
-{student_details_schema}
-
 **Your Coaching Persona & Philosophy:**
 - **Be Friendly & Encouraging**: Use a positive and supportive tone. Act as their personal coach. Use bullet points, numbered lists, and bold text to break up information and make it easy to scan.
 - **Understand the Goal**: Your primary goal is to help the student *learn*, not just to give them answers.
@@ -347,14 +525,12 @@ class RAGTutorConfig:
 
 Your ultimate goal is to empower the student to learn and grow. Be the best coach you can be!
 
-**🕒 Current Time**: {current_time}
+**Student Details:**
+{student_details_schema}
 """
 
     follow_up_system_prompt: str = """You are an expert AI Learning Coach. Your mission is to be a friendly and encouraging guide for students, helping them understand their assignments and learn effectively.
 
-**Student Details:**
-{student_details_schema}
-
 **Your Coaching Persona & Philosophy:**
 - **Be Friendly & Encouraging**: Use a positive and supportive tone. Act as their personal coach. Use bullet points, numbered lists, and bold text to break up information and make it easy to scan.
 - **Understand the Goal**: Your primary goal is to help the student *learn*, not just to give them answers.
@@ -384,7 +560,8 @@ Your ultimate goal is to empower the student to learn and grow. Be the best coac
 
 Your ultimate goal is to empower the student to learn and grow. Be the best coach you can be!
 
-**🕒 Current Time**: {current_time}
+**Student Details:**
+{student_details_schema}
 """
 
     @classmethod
@@ -393,30 +570,36 @@ Your ultimate goal is to empower the student to learn and grow. Be the best coac
         return cls()
 
 class AsyncRAGTutor:
+    # State key that carries this tutor's profile through the shared orchestrator graph
+    profile_state_key = "student_details"
+
     def __init__(self, storage_manager: Any, config: Optional[RAGTutorConfig] = None):
         self.config = config or RAGTutorConfig()
         
-        unique_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
-        self.config.qdrant_collection_name = f"rag_session_{unique_id}"
+        if not self.config.qdrant_collection_name:
+            # A session restored from the session-state store keeps its existing collection.
+            self.config.qdrant_collection_name = f"rag_session_{uuid.uuid4().hex}"
         logging.info(f"Initialized new tutor instance with collection: {self.config.qdrant_collection_name}")
 
         try:
             logging.info("Initializing response through OpenAI's API model ( GPT-4o).")
-            self.llm = ChatOpenAI(
+            self.llm = get_model_registry().chat(
+                OPENAI,
                 model=self.config.llm_model,
                 temperature=self.config.temperature,
                 max_tokens=self.config.max_tokens,
                 streaming=self.config.streaming,
-                openai_api_key=self.config.openai_api_key,
+                api_key=self.config.openai_api_key,
             )
         except Exception as e:
             logging.error(f"Error initializing ChatOpenAI: {e}")
-            self.llm = ChatGoogleGenerativeAI(
+            self.llm = get_model_registry().chat(
+                GOOGLE,
                 model="gemini-2.5-flash-lite",
                 temperature=self.config.temperature,
                 max_tokens=self.config.max_tokens,
-                google_api_key=self.config.google_api_key,
-                streaming=self.config.streaming
+                streaming=self.config.streaming,
+                api_key=self.config.google_api_key,
             )
         
         self.storage_manager = storage_manager
@@ -457,15 +640,19 @@ class AsyncRAGTutor:
             tools=[image_generation_tool]
         )
         
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.config.chunk_size,
-            chunk_overlap=self.config.chunk_overlap
-        )
+        self.chunker = DocumentChunker(self.config.chunk_size, self.config.chunk_overlap)
         
         self.vectorstore_manager = VectorStoreManager(self.config) if QDRANT_AVAILABLE else None
         self.ensemble_retriever = None
+        # Lexical index over every chunk ingested in this session (uploads append to it)
+        self.bm25_index = IncrementalBM25Index()
+        # Hashes of the chunks already in the knowledge base, so re-uploaded content is not embedded twice
+        self.chunk_hashes = set()
         self.graph = None
-        self.short_responses = ["ok", "okay", "thanks", "thank you", "great", "good", "cool","hello", "hi", "hey", "greetings", "yo", "sup", "good morning", "good afternoon", "good evening"]
+        # Version of the persisted session state this instance reflects (see session_state.py)
+        self.session_state_version: Optional[int] = None
+        self.short_responses = [phrase for phrases in FILLER_KINDS.values() for phrase in phrases]
+        self.system_prompt_cache = SystemPromptCache()
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.config.max_workers)
 
         self.rephrase_prompt = PromptTemplate.from_template(
@@ -528,6 +715,29 @@ For regular queries that don't need image generation, simply respond with "use_l
         
         self.router_chain = self.router_prompt | self.llm | StrOutputParser()
 
+        # Single-call replacement for rephrase_chain + router_chain (see config.fused_rephrase_routing)
+        self.rephrase_route_chain = build_rephrase_route_chain(self.llm)
+        self.intent_classifier = get_intent_classifier(self.config.intent_classifier_path) if self.config.intent_preclassifier_enabled else None
+
+        self.semantic_cache = None
+        if self.config.semantic_cache_enabled:
+            self.semantic_cache = get_semantic_answer_cache(self.config.semantic_cache_max_entries, self.config.semantic_cache_ttl_seconds)
+            self.cache_embeddings = get_model_registry().embeddings(self.config.embedding_model, api_key=self.config.openai_api_key)
+
+        self.fast_path_llm = None
+        if self.config.fast_path_enabled and self.config.fast_path_model:
+            try:
+                self.fast_path_llm = get_model_registry().chat(
+                    OPENAI,
+                    model=self.config.fast_path_model,
+                    temperature=0.5,
+                    max_tokens=150,
+                    streaming=True,
+                    api_key=self.config.openai_api_key,
+                )
+            except Exception as e:
+                logging.warning(f"Fast-path model unavailable, fillers will use templated replies: {e}")
+
     @async_error_handler
     async def clear_knowledge_base_async(self):
         """Public method to clear the knowledge base and reset the retriever."""
@@ -535,6 +745,8 @@ For regular queries that don't need image generation, simply respond with "use_l
         if self.vectorstore_manager:
             await self.vectorstore_manager.clear_collection_async()
         self.ensemble_retriever = None
+        self.bm25_index = IncrementalBM25Index()
+        self.chunk_hashes = set()
 
     async def knowledge_base_retrieval_tool(self, query: str) -> str:
         """Use this tool to answer questions by retrieving relevant information from the knowledge base."""
@@ -579,15 +791,41 @@ For regular queries that don't need image generation, simply respond with "use_l
 
     def _is_greeting_or_short_response(self, query: str) -> bool:
         """Checks if the query is a simple greeting or a short, common response."""
-        normalized_query = query.strip().lower()
+        normalized_query = normalize_short_message(query)
         return normalized_query in self.short_responses
 
+    async def _fast_path_response_async(self, query: str, history: List[Dict[str, Any]], name: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """Answers a greeting or filler without rephrasing, routing or tools."""
+        kind = filler_kind(query) or "acknowledgement"
+        streamed = False
+        if self.fast_path_llm:
+            try:
+                name_note = f" Their name is {name}." if name else ""
+                messages = [SystemMessage(content=(
+                    f"{self.config.fast_path_persona}{name_note} The student just sent a short conversational message ({kind}). "
+                    "Reply warmly in one or two short sentences and invite them to continue. Do not start a new topic."
+                ))]
+                recent = [msg for msg in (history or []) if msg.get("role") != SUMMARY_ROLE]
+                for msg in recent[-2:]:
+                    if msg.get("role") in ["assistant", "ai"]:
+                        messages.append(AIMessage(content=msg.get("content", "")))
+                    else:
+                        messages.append(HumanMessage(content=msg.get("content", "")))
+                messages.append(HumanMessage(content=query))
+                async for chunk in (self.fast_path_llm | StrOutputParser()).astream(messages):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                logging.warning(f"Fast-path model failed, using a templated reply: {e}")
+        if not streamed:
+            yield templated_reply(kind, audience="student", name=name)
+
     @staticmethod
-    async def encode_image_async(image_path: str) -> str:
-        """Convert image to base64 string asynchronously."""
+    async def encode_image_async(image: Union[str, bytes]) -> str:
+        """Convert an image (file path or raw bytes) to a base64 string asynchronously."""
         loop = asyncio.get_event_loop()
         def _encode_image():
-            with Image.open(image_path) as img:
+            with Image.open(image if isinstance(image, str) else BytesIO(image)) as img:
                 buffer = BytesIO()
                 img_format = img.format if img.format in ['JPEG', 'PNG'] else 'JPEG'
                 img.save(buffer, format=img_format)
@@ -598,11 +836,23 @@ For regular queries that don't need image generation, simply respond with "use_l
         """Format documents for the prompt."""
         if not docs:
             return "No relevant documents found in the knowledge base."
-        return "\n\n".join(f"Source: {doc.metadata.get('source', 'N/A')}\nContent: {doc.page_content}" for doc in docs)
+        return "\n\n".join(f"Source: {self._format_source(doc.metadata)}\nContent: {doc.page_content}" for doc in docs)
+
+    @staticmethod
+    def _format_source(metadata: Dict[str, Any]) -> str:
+        """'file.pdf (page 3)': loaders number pages from 0."""
+        source = metadata.get('source', 'N/A')
+        if isinstance(metadata.get('page'), int):
+            source += f" (page {metadata['page'] + 1})"
+        return source
 
     @traceable(name="initialize_vectorstore")
-    async def initialize_vectorstore_async(self, documents: List[Document]):
-        """Initialize the vector store with documents."""
+    async def initialize_vectorstore_async(self, documents: List[Document], progress: Optional[ProgressCallback] = None):
+        """
+        Initialize the vector store with documents. Every embedded batch is indexed as soon
+        as it is stored, so the knowledge base answers from the first batch on;
+        `progress` receives embedding progress after each batch.
+        """
         try:
             logging.info("=== STARTING initialize_vectorstore_async ===")
             
@@ -619,8 +869,7 @@ For regular queries that don't need image generation, simply respond with "use_l
             # FIXED: Check if we need to create the VectorStoreManager or just initialize the collection
             if self.vectorstore_manager is None:
                 if self.config.qdrant_collection_name is None:
-                    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
-                    self.config.qdrant_collection_name = f"rag_session_{timestamp}"
+                    self.config.qdrant_collection_name = f"rag_session_{uuid.uuid4().hex}"
                 
                 logging.info(f"Creating VectorStoreManager with collection: {self.config.qdrant_collection_name}")
                 
@@ -632,6 +881,7 @@ For regular queries that don't need image generation, simply respond with "use_l
                         self.qdrant_url = config.qdrant_url
                         self.qdrant_api_key = config.qdrant_api_key
                         self.qdrant_collection_name = config.qdrant_collection_name
+                        self.qdrant_shared_collection = config.qdrant_shared_collection
                 
                 vector_config = VectorConfig(self.config)
                 
@@ -689,81 +939,208 @@ For regular queries that don't need image generation, simply respond with "use_l
                 return False
                 
             logging.info("Adding documents to vector store...")
-            await self.vectorstore_manager.aadd_documents(documents)
+
+            async def _index_batch(update: EmbeddingProgress):
+                self._build_retrievers(update.batch)
+                if progress is not None:
+                    result = progress(update)
+                    if inspect.isawaitable(result):
+                        await result
+
+            try:
+                await self.vectorstore_manager.aadd_documents(documents, _index_batch)
+            except EmbeddingBatchError as e:
+                # Batches stored before the failure are already indexed and stay searchable.
+                logging.error(f"Error adding documents to vector store: {e}")
+                return False
             logging.info("Documents added successfully")
-            
-            logging.info("Getting retriever...")
-            self.retriever = self.vectorstore_manager.get_retriever(k=self.config.retrieval_k)
-            logging.info("Retriever obtained successfully")
-            
-            if RETRIEVER_AVAILABLE:
-                try:
-                    logging.info("Setting up ensemble retriever...")
-                    bm25_retriever = BM25Retriever.from_documents(
-                        documents, preprocess_func=lambda text: text.split()
-                    )
-                    bm25_retriever.k = self.config.retrieval_k
-                    
-                    self.ensemble_retriever = EnsembleRetriever(
-                        retrievers=[self.retriever, bm25_retriever],
-                        weights=[0.7, 0.3]
-                    )
-                    logging.info("Ensemble retriever configured with vector + BM25")
-                except Exception as e:
-                    logging.error(f"Error setting up hybrid retriever: {e}. Falling back to vector retriever.")
-                    self.ensemble_retriever = self.retriever
-            else:
-                self.ensemble_retriever = self.retriever
-            
+
             logging.info("=== COMPLETED initialize_vectorstore_async ===")
             return True
         except Exception as e:
             logging.error(f"Error initializing vector store: {e}")
             return False
 
+    def _build_retrievers(self, documents: List[Document]):
+        """
+        Adds the new chunks to the session's BM25 index and builds the vector retriever and,
+        when available, the hybrid vector + BM25 retriever over everything ingested so far.
+        """
+        logging.info("Getting retriever...")
+        self.retriever = self.vectorstore_manager.get_retriever(k=self.config.retrieval_k)
+        logging.info("Retriever obtained successfully")
+        self.bm25_index.add_documents(documents)
+        
+        if RETRIEVER_AVAILABLE:
+            try:
+                logging.info("Setting up ensemble retriever...")
+                bm25_retriever = IncrementalBM25Retriever(index=self.bm25_index, k=self.config.retrieval_k)
+                
+                self.ensemble_retriever = EnsembleRetriever(
+                    retrievers=[self.retriever, bm25_retriever],
+                    weights=[0.7, 0.3]
+                )
+                logging.info("Ensemble retriever configured with vector + BM25")
+            except Exception as e:
+                logging.error(f"Error setting up hybrid retriever: {e}. Falling back to vector retriever.")
+                self.ensemble_retriever = self.retriever
+        else:
+            self.ensemble_retriever = self.retriever
+
+    async def rehydrate_async(self, storage_keys: List[str], filenames: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Rebuilds the knowledge base of a session that was persisted by another worker
+        (or before a restart): reuses its Qdrant collection and rebuilds BM25 from the
+        stored chunks. The original files are re-ingested only if the collection is gone.
+        """
+        if not storage_keys or not self.vectorstore_manager:
+            return False
+        # The stored chunks (or the re-ingested files) are the whole corpus, so BM25 starts over.
+        self.bm25_index = IncrementalBM25Index()
+        self.chunk_hashes = set()
+        documents = await self.vectorstore_manager.load_documents_async()
+        if not documents:
+            logging.warning(f"Collection {self.config.qdrant_collection_name} is empty or missing; re-ingesting {len(storage_keys)} file(s).")
+            return await self.ingest_async(storage_keys, filenames=filenames)
+        self.chunk_hashes = {doc.metadata["chunk_hash"] for doc in documents if "chunk_hash" in doc.metadata}
+        try:
+            await self.vectorstore_manager.initialize_collection()
+        except Exception as e:
+            logging.error(f"Error reopening collection {self.config.qdrant_collection_name}: {e}")
+            return False
+        self._build_retrievers(documents)
+        logging.info(f"Rehydrated knowledge base from {len(documents)} stored chunks in {self.config.qdrant_collection_name}")
+        return True
+
     @async_error_handler
-    async def ingest_async(self, storage_keys: List[str]) -> bool:
-        """Concurrently ingests documents from storage keys, now with image support."""
+    async def ingest_async(self, storage_keys: List[str], on_stage: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                           filenames: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Concurrently ingests documents from storage keys, now with image support.
+
+        `filenames` maps storage keys to the names this session uploaded them under;
+        documents are cited by that name. A deduplicated upload's key carries the name
+        of whoever stored the content first, so the key's own name is only a fallback.
+
+        `on_stage` receives per-file progress events: {"stage": "parsed" | "failed" |
+        "chunked" | "embedded" | "indexed", "key": storage_key, ...} and one
+        {"stage": "queryable"} once the first batch is searchable.
+        """
         if not storage_keys:
             logging.warning("No storage keys provided for ingestion.")
             return False
 
         logging.info(f"Starting concurrent ingestion for {len(storage_keys)} storage keys.")
+        source_names = {key: (filenames or {}).get(key) or os.path.basename(key) for key in storage_keys}
+
+        async def _emit(event: Dict[str, Any]):
+            if on_stage is None:
+                return
+            try:
+                result = on_stage(event)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logging.error(f"Ingestion progress callback failed: {e}")
 
         async def _process_single_key(key: str) -> List[Document]:
             """Fetches a file from storage and processes it as a document or image."""
             try:
+                filename = source_names[key]
+                # Content-addressed uploads parsed before (in any session) skip the download and parsing.
+                digest = content_hash_from_key(key)
+                parsed_cache = get_parsed_content_cache() if digest else None
+                if parsed_cache is not None:
+                    docs = await parsed_cache.get(digest)
+                    if docs:
+                        for doc in docs:
+                            # Cached documents are labelled with the name the content was first parsed under.
+                            previous = doc.metadata.get('source')
+                            doc.metadata['source'] = filename
+                            if 'file_path' in doc.metadata:
+                                doc.metadata['file_path'] = filename
+                            if doc.metadata.get('type') == 'image' and previous:
+                                doc.page_content = doc.page_content.replace(
+                                    f"(from file: {previous})", f"(from file: {filename})", 1
+                                )
+                        logging.info(f"Reusing parsed content of {filename} ({len(docs)} documents)")
+                        await _emit({"stage": "parsed", "key": key, "documents": len(docs), "reused": True})
+                        return docs
+
                 file_content = await self.storage_manager.get_file_content_bytes_async(key)
                 if not file_content:
                     logging.error(f"Failed to get content for key: {key}")
+                    await _emit({"stage": "failed", "key": key, "error": "The stored file could not be read"})
                     return []
 
-                filename = os.path.basename(key)
-                
                 if filename.lower().endswith(self.config.image_extensions):
                     logging.info(f"🖼️ Detected image file: {filename}. Analyzing with vision model.")
                     image_description = await self._process_image_from_bytes_async(file_content, filename)
-                    if image_description:
-                        return [Document(page_content=image_description, metadata={'source': filename, 'type': 'image'})]
+                    docs = [Document(page_content=image_description, metadata={'source': filename, 'type': 'image'})] if image_description else []
                 else:
-                    return await self._process_document_from_bytes_async(file_content, filename)
+                    docs = await self._process_document_from_bytes_async(file_content, filename)
+                if docs:
+                    if parsed_cache is not None:
+                        await parsed_cache.put(digest, docs)
+                    await _emit({"stage": "parsed", "key": key, "documents": len(docs)})
+                    return docs
             except Exception as e:
                 logging.error(f"Exception while processing file for key {key}: {e}", exc_info=True)
+            await _emit({"stage": "failed", "key": key, "error": "No content could be extracted from this file"})
             return []
 
         tasks = [_process_single_key(key) for key in storage_keys]
         results = await asyncio.gather(*tasks, return_exceptions=True)
 
         all_processed_docs = []
-        for res in results:
+        for key, res in zip(storage_keys, results):
             if isinstance(res, list):
+                # Progress is reported per storage key; two uploads can share a file name.
+                for doc in res:
+                    doc.metadata['storage_key'] = key
                 all_processed_docs.extend(res)
             elif isinstance(res, Exception):
                 logging.error(f"Error during concurrent ingestion task: {res}")
 
         if all_processed_docs:
-            logging.info(f"Ingesting {len(all_processed_docs)} processed documents into vector store.")
-            return await self.initialize_vectorstore_async(all_processed_docs)
+            # Embed retrieval-sized chunks rather than whole pages or files.
+            chunks = await asyncio.to_thread(self.chunker.split_documents, all_processed_docs, self.chunk_hashes)
+            parsed_keys = {doc.metadata['storage_key'] for doc in all_processed_docs}
+            totals: Dict[str, int] = {}
+            for chunk in chunks:
+                key = chunk.metadata['storage_key']
+                totals[key] = totals.get(key, 0) + 1
+            for key in parsed_keys:
+                await _emit({"stage": "chunked", "key": key, "chunks": totals.get(key, 0)})
+                if not totals.get(key):
+                    # Everything in it was already in the knowledge base.
+                    await _emit({"stage": "indexed", "key": key, "chunks": 0})
+            if not chunks:
+                logging.info("Every chunk of these documents is already in the knowledge base.")
+                return self.ensemble_retriever is not None
+            logging.info(f"Ingesting {len(chunks)} chunks from {len(all_processed_docs)} processed documents into vector store.")
+
+            done: Dict[str, int] = {}
+
+            async def _on_batch(update: EmbeddingProgress):
+                if update.batches_done == 1:
+                    await _emit({"stage": "queryable", "chunks_indexed": update.documents_done})
+                for doc in update.batch:
+                    key = doc.metadata['storage_key']
+                    done[key] = done.get(key, 0) + 1
+                for key in {doc.metadata['storage_key'] for doc in update.batch}:
+                    await _emit({"stage": "embedded", "key": key, "chunks_done": done[key], "chunks_total": totals[key]})
+                    if done[key] == totals[key]:
+                        await _emit({"stage": "indexed", "key": key, "chunks": totals[key]})
+
+            success = await self.initialize_vectorstore_async(chunks, _on_batch)
+            if not success:
+                # Chunks that were not stored must not count as duplicates when the upload is retried.
+                stored = {doc.metadata.get("chunk_hash") for doc in self.bm25_index.documents}
+                self.chunk_hashes.difference_update(
+                    chunk.metadata["chunk_hash"] for chunk in chunks if chunk.metadata["chunk_hash"] not in stored
+                )
+            return success
         else:
             logging.warning("No documents were successfully processed for ingestion.")
             return False
@@ -780,10 +1157,12 @@ For regular queries that don't need image generation, simply respond with "use_l
 
             try:
                 logging.info(f"Attempting to generate description for '{filename}' with OpenAI's model.")
-                vision_model_openai = ChatOpenAI(
+                vision_model_openai = get_model_registry().chat(
+                    OPENAI,
                     model=self.config.llm_model,
                     max_tokens=1024,
-                    openai_api_key=self.config.openai_api_key
+                    streaming=False,
+                    api_key=self.config.openai_api_key
                     )
                 response = await vision_model_openai.ainvoke([
                     HumanMessage(content=[
@@ -801,17 +1180,21 @@ For regular queries that don't need image generation, simply respond with "use_l
                 # Fallback to OpenAI's model
                 try:
                     logging.info(f"Attempting to generate description for '{filename}' with Google's model.")
-                    vision_model = ChatGoogleGenerativeAI(
+                    registry = get_model_registry()
+                    vision_model = registry.chat(
+                    GOOGLE,
                     model="gemini-2.5-flash-lite",
                     max_tokens=self.config.max_tokens,
-                    google_api_key=self.config.google_api_key,
+                    streaming=False,
+                    api_key=self.config.google_api_key,
                 )
-                    response = await vision_model.ainvoke([
-                    HumanMessage(content=[
-                        {"type": "text", "text": prompt_text},
-                        {"type": "image_url", "image_url": {"url": image_url}}
+                    async with registry.async_slot(GOOGLE):
+                        response = await vision_model.ainvoke([
+                        HumanMessage(content=[
+                            {"type": "text", "text": prompt_text},
+                            {"type": "image_url", "image_url": {"url": image_url}}
+                        ])
                     ])
-                ])
                     description = f"Image Content (from file: {filename}):\n{response.content}"
                     logging.info(f"Successfully generated description for '{filename}' using Google's model.")
                     return description
@@ -826,24 +1209,15 @@ For regular queries that don't need image generation, simply respond with "use_l
             return None
             
     async def _process_document_from_bytes_async(self, file_bytes: bytes, filename: str) -> List[Document]:
-        """Processes a standard document from bytes by writing to a temp file for loading."""
-        temp_file_path = None
+        """
+        Processes a standard document straight from its bytes (no temp file). Parsing runs
+        in the shared parse process pool (large PDFs in parallel page ranges).
+        """
         try:
             file_extension = os.path.splitext(filename)[1].lower()
-            with tempfile.NamedTemporaryFile(suffix=file_extension, delete=False) as temp_file:
-                temp_file.write(file_bytes)
-                temp_file_path = temp_file.name
-            
-            loader = None
-            if file_extension == '.pdf': loader = PDFPlumberLoader(temp_file_path)
-            elif file_extension == '.docx': loader = Docx2txtLoader(temp_file_path)
-            elif file_extension == '.json': loader = JSONLoader(temp_file_path, jq_schema='.[*]', text_content=False)
-            elif file_extension in ['.html', '.htm', '.xhtml']: loader = BSHTMLLoader(temp_file_path)
-            elif file_extension in ['.txt', '.md']: loader = TextLoader(temp_file_path, autodetect_encoding=True)
-            
-            if loader:
+            if file_extension in SUPPORTED_EXTENSIONS:
                 logging.info(f"📄 Loading document: {filename}")
-                docs = await asyncio.to_thread(loader.load)
+                docs = await get_document_parser().parse_bytes(file_bytes, filename)
                 for doc in docs:
                     doc.metadata['source'] = filename 
                 return docs
@@ -852,34 +1226,27 @@ For regular queries that don't need image generation, simply respond with "use_l
 
         except Exception as e:
             logging.error(f"Error processing document {filename}: {e}", exc_info=True)
-        finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
         return []
 
     @async_error_handler
     # MODIFICATION: Added 'history' parameter to the method signature
-    async def _agent_executor_stream_async(self, query: str, formatted_time: str, image_path: Optional[str] = None, is_knowledge_base_ready: bool = False, student_details: Optional[Dict[str, Any]] = None, history: Optional[List[Dict[str, Any]]] = None) -> AsyncGenerator[str, None]:
+    async def _agent_executor_stream_async(self, query: str, formatted_time: str, image_base64: Optional[str] = None, is_knowledge_base_ready: bool = False, student_details: Optional[Dict[str, Any]] = None, history: Optional[List[Dict[str, Any]]] = None, turn_info: Optional[Dict[str, Any]] = None) -> AsyncGenerator[str, None]:
         """Private method to invoke the tool-enabled LLM with a finalized query."""
-        student_details_str = "No student details provided. Please ask the student for their name, class, and subjects."
-        if student_details:
-            try:
-                # Pretty-print the JSON for better readability in the prompt
-                student_details_str = json.dumps(student_details, indent=2)
-            except TypeError:
-                student_details_str = str(student_details)
-
         # MODIFICATION: Logic to select the correct prompt based on conversation history
         if history: # If history is not empty, it's a follow-up message
-            system_prompt_template = self.config.follow_up_system_prompt
+            template_name, system_prompt_template = "follow_up", self.config.follow_up_system_prompt
             logging.info("Using follow-up system prompt.")
         else: # If history is empty, it's the first message
-            system_prompt_template = self.config.initial_system_prompt
+            template_name, system_prompt_template = "initial", self.config.initial_system_prompt
             logging.info("Using initial system prompt.")
 
-        system_prompt_text = system_prompt_template.format(
-            current_time=formatted_time,
-            student_details_schema=student_details_str
+        # The prefix is rendered once per session and profile; only the suffix changes per turn.
+        system_prompt_text = self.system_prompt_cache.prefix(
+            template_name,
+            system_prompt_template,
+            profile_placeholder="student_details_schema",
+            profile=student_details,
+            empty_profile_text="No student details provided. Please ask the student for their name, class, and subjects."
         )
         
         prompt_notes = []
@@ -893,53 +1260,45 @@ For regular queries that don't need image generation, simply respond with "use_l
         else:
             prompt_notes.append("- **Web Search**: DISABLED.")
         
-        if prompt_notes:
-            system_prompt_text += "\n\n**Current Session Status:**\n" + "\n".join(prompt_notes)
+        system_prompt_text += render_volatile_suffix(formatted_time, prompt_notes)
 
         message_content = [{"type": "text", "text": query}]
-        if image_path:
-            logging.info(f"Encoding image {image_path} for direct agent analysis.")
-            base64_image = await self.encode_image_async(image_path)
+        if image_base64:
+            logging.info("Attaching the student's image for direct agent analysis.")
             message_content.append(
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
             )
 
         messages = [SystemMessage(content=system_prompt_text), HumanMessage(content=message_content)]
-        ai_response_with_tool = await self.llm_with_tools.ainvoke(messages)
-        
-
-        # **FIXED LOGIC STARTS HERE**
-        if not ai_response_with_tool.tool_calls:
-            # Scenario 1: The LLM decided to answer directly.
-            # To ensure a consistent streaming experience, we will re-invoke the LLM
-            # in streaming mode to deliver the final answer.
-            logging.info("LLM provided a direct answer without tool usage. Invoking a new stream for the response.")
-            final_chain = self.llm | StrOutputParser()
-            # `messages` already contains the System and Human messages that led to this decision.
-            async for chunk in final_chain.astream(messages):
-                yield chunk
-            return
-
-        messages.append(ai_response_with_tool)
-        # Scenario 2: The LLM decided to call one or more tools.
-        for tool_call in ai_response_with_tool.tool_calls:
-            tool_name = tool_call["name"]
-            logging.info(f"LLM decided to call tool: {tool_name} with args {tool_call['args']}")
-            if tool_name in self.tool_map:
-                selected_tool = self.tool_map[tool_name]
-                tool_output = await selected_tool.ainvoke(tool_call["args"])
-            else:
-                tool_output = f"Error: Tool '{tool_name}' not found."
-            messages.append(ToolMessage(content=str(tool_output), tool_call_id=tool_call["id"]))
 
-        # Now, invoke the model again with the tool results to get the final answer.
-        final_chain = self.llm | StrOutputParser()
-        async for chunk in final_chain.astream(messages):
+        # Stream the tool-bound call directly; a second call is only made if a tool was requested.
+        async for chunk in stream_tool_calling_turn(
+            self.llm,
+            self.llm_with_tools,
+            messages,
+            self.tool_map,
+            tool_timeouts=self.config.tool_timeouts,
+            default_tool_timeout=self.config.default_tool_timeout,
+            turn_info=turn_info
+        ):
             yield chunk
 
+    def _preclassify_query(self, query: str) -> Optional[ActionType]:
+        """Returns an action when the local pre-classifier is confident, otherwise None."""
+        if not self.intent_classifier:
+            return None
+        prediction = self.intent_classifier.classify(query)
+        if prediction.action == ActionType.USE_LLM_WITH_TOOLS.value:
+            logging.info(f"Intent pre-classifier routed query locally (p_image={prediction.image_probability:.3f}).")
+            return ActionType.USE_LLM_WITH_TOOLS
+        logging.info(f"Intent pre-classifier deferred to the LLM router ({prediction.reason}, p_image={prediction.image_probability:.3f}).")
+        return None
+
     # Add this new method to create and parse the routing decision
     async def _route_query(self, query: str) -> dict:
         """Determine which action to take based on the user query."""
+        if self._preclassify_query(query) == ActionType.USE_LLM_WITH_TOOLS:
+            return {"action": ActionType.USE_LLM_WITH_TOOLS}
         try:
             router_response = await self.router_chain.ainvoke({"input": query})
             logging.info(f"Router response: {router_response}")
@@ -1011,169 +1370,172 @@ For regular queries that don't need image generation, simply respond with "use_l
             logging.error(f"Error in route_query: {e}")
             return {"action": ActionType.USE_LLM_WITH_TOOLS}  # Default to standard LLM response
 
-    # Update the setup_langgraph_async method to implement the orchestrator
     async def setup_langgraph_async(self):
-        """Set up the LangGraph orchestrator workflow asynchronously."""
-        
-        # Router node function to decide which path to take
-        async def router_node(state: OrchestratorState) -> dict:
-            """Determine which action to take based on the user query."""
-            last_message = state["messages"][-1]
-            routing_decision = await self._route_query(last_message.content)
-            
-            if routing_decision["action"] == ActionType.GENERATE_IMAGE:
-                return {"action": ActionType.GENERATE_IMAGE, "image_generation_params": routing_decision["parameters"]}
-            else:
-                return {"action": ActionType.USE_LLM_WITH_TOOLS}
-        
-        # LLM with tools node function
-        async def llm_with_tools_node(state: OrchestratorState):
-            """Process the query with the standard LLM and tools using streaming."""
-            from langgraph.config import get_stream_writer
-            
-            last_message = state["messages"][-1]
-            # MODIFICATION: Get history from the state
-            history = state.get("history", [])
-            student_details = state.get("student_details")
-            
-            formatted_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Get the stream writer to send custom data
-            writer = get_stream_writer()
-            
-            # Stream each chunk as it comes in directly to the output stream
-            # MODIFICATION: Pass history to the agent executor
-            async for chunk in self._agent_executor_stream_async(
-                query=last_message.content,
-                formatted_time=formatted_time,
-                is_knowledge_base_ready=(self.ensemble_retriever is not None),
-                student_details=student_details,
-                history=history
-            ):
-                # Stream each chunk directly using the writer
-                writer(chunk)
-            
-            # Return an empty AI message - the content has already been streamed
-            return {"messages": [AIMessage(content="")]}
-        
-        # Define the conditional edge function
-        def route_by_action(state: OrchestratorState):
-            """Route to the next node based on the action determined by the router."""
-            action = state.get("action")
-            if action == ActionType.GENERATE_IMAGE:
-                return "image_generator"
-            else:
-                return "llm_with_tools"
-        
-        # Define the LangGraph workflow
-        workflow = StateGraph(OrchestratorState)
-        
-        # Add the nodes
-        workflow.add_node("router", router_node)
-        workflow.add_node("llm_with_tools", llm_with_tools_node)
-        workflow.add_node("image_generator", image_generator_node)
-        
-        # Add edges
-        workflow.add_edge(START, "router")
-        workflow.add_conditional_edges("router", route_by_action)
-        # workflow.add_edge("llm_with_tools", END)
-        workflow.add_edge("image_generator", END)
-        workflow.add_edge("llm_with_tools", END)
-        
-        self.graph = workflow.compile()
-        logging.info("LangGraph orchestrator workflow created successfully.")
+        """Attach the shared, process-wide orchestrator graph to this tutor."""
+        self.graph = get_orchestrator_graph()
         return self.graph
     
     # Update run_agent_async to use astream instead of ainvoke
     @async_error_handler
-    async def run_agent_async(self, query: str, history: List[Dict[str, Any]], image_storage_key: Optional[str] = None, is_knowledge_base_ready: bool = False, uploaded_files: Optional[List[str]] = None, student_details: Optional[Dict[str, Any]] = None) -> AsyncGenerator[str, None]:
-        """Run the agent with a query and history, using the orchestrator graph with streaming."""
+    async def run_agent_async(self, query: str, history: List[Dict[str, Any]], image_storage_key: Optional[str] = None, is_knowledge_base_ready: bool = False, uploaded_files: Optional[List[str]] = None, student_details: Optional[Dict[str, Any]] = None, raw_query: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """
+        Run the agent with a query and history, using the orchestrator graph with streaming.
+        `raw_query` is the user's message before any context was added to `query`; it is used for fast-path detection.
+        """
         formatted_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        rephrased_query = await self._rephrase_query_with_history_async(query, history, uploaded_files)
-        temp_image_path = None
+        user_message = raw_query or query
+        if (self.config.fast_path_enabled and not image_storage_key and self._is_greeting_or_short_response(user_message)
+                and not answers_open_question(user_message, history)):
+            logging.info(f"Handling conversational filler '{user_message}' on the fast path.")
+            yield FAST_PATH_MARKER
+            async for chunk in self._fast_path_response_async(user_message, history, (student_details or {}).get("name")):
+                yield chunk
+            return
+
+        stage_start = time.perf_counter()
+        routing_decision = None
+        if self.config.fused_rephrase_routing:
+            if not history and not uploaded_files and self._preclassify_query(query) == ActionType.USE_LLM_WITH_TOOLS:
+                # A first message without files has nothing to resolve against, so only routing was needed.
+                routing_decision = {"query": query, "action": ActionType.USE_LLM_WITH_TOOLS}
+            else:
+                routing_decision = await self._rephrase_and_route_async(query, history, uploaded_files)
+        if routing_decision:
+            rephrased_query = routing_decision["query"]
+            logging.info(f"Fused rephrase-and-route stage took {time.perf_counter() - stage_start:.2f}s")
+        else:
+            rephrased_query = await self._rephrase_query_with_history_async(query, history, uploaded_files)
+            logging.info(f"Rephrase stage took {time.perf_counter() - stage_start:.2f}s")
+
+        cache_scope_key, cache_embedding = None, None
+        cache_query = rephrased_query
+        if self._semantic_cache_applies(routing_decision, cache_query, history, image_storage_key,
+                                        is_knowledge_base_ready, uploaded_files, student_details):
+            cache_scope_key = cache_scope(student_details, cache_query)
+            try:
+                cache_embedding = await self.cache_embeddings.aembed_query(cache_query)
+                hit = self.semantic_cache.lookup(cache_scope_key, cache_embedding, self.config.semantic_cache_threshold)
+            except Exception as e:
+                logging.warning(f"Semantic cache lookup failed, answering normally: {e}")
+                cache_embedding, hit = None, None
+            if hit:
+                entry, similarity = hit
+                logging.info(f"Semantic cache hit (similarity {similarity:.3f}) for '{cache_query}' matching '{entry.query}'.")
+                async for token in replay_answer(entry.answer):
+                    yield token
+                return
+        # Shared answers are generated from the standalone question and the scope's grade, never the full profile.
+        shareable = cache_embedding is not None
+        graph_student_details = shared_profile(student_details) if shareable else student_details
+        image_base64 = None
         
         if image_storage_key:
             try:
+                # The image stays in memory and reaches the answer node base64-encoded through the graph state.
                 image_bytes = await self.storage_manager.get_file_content_bytes_async(image_storage_key)
                 if image_bytes:
-                    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(image_storage_key)[1], delete=False) as temp_file:
-                        temp_file.write(image_bytes)
-                        temp_image_path = temp_file.name
+                    image_base64 = await self.encode_image_async(image_bytes)
                     logging.info(f"Loaded image from storage key '{image_storage_key}' for processing.")
                 else:
                     logging.error(f"Failed to load image from storage key: {image_storage_key}")
             except Exception as e:
                 logging.error(f"Error handling image storage key {image_storage_key}: {e}")
 
-        try:
-            # Initialize the graph if it hasn't been created yet
-            if self.graph is None:
-                await self.setup_langgraph_async()
-                
-            # Process the query using the orchestrator graph
-            logging.info(f"Processing query via orchestrator graph: {rephrased_query}")
-            
-            # Invoke the graph with both system and user messages
-            messages = [
-                SystemMessage(content="You are a helpful AI assistant."),
-                HumanMessage(content=rephrased_query)
-            ]
-            
-            # MODIFICATION: Pass the conversation history into the initial state
-            initial_state = {
-                "messages": messages,
-                "student_details": student_details,
-                "history": history
-            }
-
-            # Use astream with custom stream mode for streaming response
-            is_image_response = False
-            
-            # Use custom stream mode to get the streamed chunks
-            async for chunk in self.graph.astream(
-                initial_state,
-                stream_mode="custom"
-            ):
-                # Handle different chunk formats
-                if isinstance(chunk, dict) and "content" in chunk and "exclude_from_history" in chunk:
-                    is_image_response = True
-                    yield f"__IMAGE_RESPONSE__{chunk['content']}"
-                elif isinstance(chunk, dict) and "content" in chunk:
-                    yield chunk["content"]
-                elif isinstance(chunk, str):
-                    yield chunk
-                else:
-                    # Try to convert to string for other types
-                    yield str(chunk)
-                
-        finally:
-            # Clean up temporary files
-            if temp_image_path and os.path.exists(temp_image_path):
-                try:
-                    os.unlink(temp_image_path)
-                    logging.info(f"Cleaned up temporary image file: {temp_image_path}")
-                except Exception as e:
-                    logging.error(f"Error cleaning up temporary image file: {e}")
+        # Initialize the graph if it hasn't been created yet
+        if self.graph is None:
+            await self.setup_langgraph_async()
+        
+        # Process the query using the orchestrator graph
+        logging.info(f"Processing query via orchestrator graph: {rephrased_query}")
+        
+        # Invoke the graph with both system and user messages
+        messages = [
+            SystemMessage(content="You are a helpful AI assistant."),
+            HumanMessage(content=rephrased_query)
+        ]
+        
+        # MODIFICATION: Pass the conversation history into the initial state
+        initial_state = {
+            "messages": messages,
+            "student_details": graph_student_details,
+            "history": history,
+            "action": routing_decision["action"] if routing_decision else None,
+            "image_generation_params": routing_decision.get("parameters") if routing_decision else None,
+            "image": image_base64
+        }
+        
+        # Use astream with custom stream mode for streaming response
+        is_image_response = False
+        turn_info = {}
+        answer_parts = []
+        answer_start = time.perf_counter()
+        
+        # Use custom stream mode to get the streamed chunks
+        async for chunk in self.graph.astream(
+            initial_state,
+            config=tutor_run_config(self, turn_info),
+            stream_mode="custom"
+        ):
+            # Handle different chunk formats
+            if isinstance(chunk, dict) and "content" in chunk and "exclude_from_history" in chunk:
+                is_image_response = True
+                yield f"__IMAGE_RESPONSE__{chunk['content']}"
+                continue
+            elif isinstance(chunk, dict) and "image_progress" in chunk:
+                is_image_response = True
+                yield progress_chunk(chunk["image_progress"])
+                continue
+            elif isinstance(chunk, dict) and "content" in chunk:
+                text = chunk["content"]
+            elif isinstance(chunk, str):
+                text = chunk
+            else:
+                # Try to convert to string for other types
+                text = str(chunk)
+            if shareable:
+                answer_parts.append(text)
+            yield text
+        
+        if shareable and not is_image_response:
+            self._store_in_semantic_cache(
+                cache_scope_key, cache_query, cache_embedding, "".join(answer_parts),
+                turn_info, student_details, time.perf_counter() - answer_start
+            )
+
+    def _semantic_cache_applies(self, routing_decision: Optional[dict], query: str, history: List[Dict[str, Any]],
+                                image_storage_key: Optional[str], is_knowledge_base_ready: bool,
+                                uploaded_files: Optional[List[str]], student_details: Optional[Dict[str, Any]]) -> bool:
+        """
+        The cache is only used for plain follow-up answer turns of students with a known grade, without
+        files. First replies greet the student and open the conversation, so they are neither shared nor
+        served from the cache.
+        """
+        if (self.semantic_cache is None or not history or image_storage_key or is_knowledge_base_ready
+                or uploaded_files or self.ensemble_retriever is not None or shared_profile(student_details) is None):
+            return False
+        if routing_decision:
+            return routing_decision.get("action") == ActionType.USE_LLM_WITH_TOOLS
+        # Without fused routing the graph routes later; an image answer is never stored.
+        return self._preclassify_query(query) == ActionType.USE_LLM_WITH_TOOLS
+
+    def _store_in_semantic_cache(self, scope, cache_query: str, embedding: List[float], answer: str, turn_info: Dict[str, Any],
+                                 student_details: Optional[Dict[str, Any]], generation_seconds: float):
+        """Caches the answer unless it used a tool or may be personal to this student."""
+        if not answer.strip() or turn_info.get("tool_calls", True):
+            return
+        # The rephrased question can still carry the name from the personalization wrapper.
+        name = ((student_details or {}).get("name") or "").split()
+        if name and name[0].lower() in answer.lower():
+            return
+        self.semantic_cache.store(scope, cache_query, embedding, answer, generation_seconds)
 
     @async_error_handler
     async def _rephrase_query_with_history_async(self, query: str, history: List[Dict[str, Any]], uploaded_files: Optional[List[str]] = None) -> str:
         """Rephrase the query using chat history to make it standalone."""
         try:
-            chat_history_str = ""
-            if uploaded_files:
-                files_str = "', '".join(uploaded_files)
-                chat_history_str += f"System Note: The user has just uploaded the following file(s): '{files_str}'. The follow-up question likely refers to these files.\n\n"
-            
-            # Only use the last user message from history
-            history_str_parts = []
-            # Capture the last few messages for better context
-            for msg in history[-4:]: # Takes the last 4 messages, for example
-                role = "AI" if msg.get("role") in ["assistant", "ai"] else "User"
-                content = msg.get("content", "")
-                history_str_parts.append(f"{role}: {content}")
-
-            chat_history_str = "\n".join(history_str_parts)
+            # Includes the uploaded-files note and the rolling summary of older turns, if any.
+            chat_history_str = format_chat_history(history, uploaded_files)
             
             rephrased = await self.rephrase_chain.ainvoke({
                 "chat_history": chat_history_str,
@@ -1185,38 +1547,51 @@ For regular queries that don't need image generation, simply respond with "use_l
             logging.error(f"Error rephrasing query: {e}")
             return query
 
+    async def _rephrase_and_route_async(self, query: str, history: List[Dict[str, Any]], uploaded_files: Optional[List[str]] = None) -> Optional[dict]:
+        """
+        Rephrases the query and decides the action in a single structured-output call.
+        Returns None on failure so the caller can fall back to the two-call path.
+        """
+        try:
+            decision = await self.rephrase_route_chain.ainvoke({
+                "chat_history": format_chat_history(history, uploaded_files),
+                "question": query
+            })
+            standalone_query = decision.standalone_query.strip() or query
+            logging.info(f"Fused stage rephrased '{query}' to '{standalone_query}' with action '{decision.action}'")
+
+            if decision.action == ActionType.GENERATE_IMAGE.value:
+                if decision.image_parameters:
+                    return {
+                        "query": standalone_query,
+                        "action": ActionType.GENERATE_IMAGE,
+                        "parameters": decision.image_parameters.model_dump()
+                    }
+                logging.warning("Fused stage chose generate_image without parameters; deferring to the router.")
+                return {"query": standalone_query, "action": None}
+
+            return {"query": standalone_query, "action": ActionType.USE_LLM_WITH_TOOLS}
+        except Exception as e:
+            logging.error(f"Error in fused rephrase-and-route stage, falling back to separate calls: {e}")
+            return None
+
+    async def aclose(self, delete_collection: bool = False):
+        """
+        Releases the session's resources: stops the thread pool, drops the retrievers
+        and BM25 index and, if requested, deletes the session's Qdrant collection.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.ensemble_retriever = None
+        self.retriever = None
+        self.bm25_index = IncrementalBM25Index()
+        self.chunk_hashes = set()
+        if self.vectorstore_manager:
+            if delete_collection:
+                await self.vectorstore_manager.delete_collection_async()
+            self.vectorstore_manager.vector_store = None
+        logging.info(f"Closed tutor session with collection: {self.config.qdrant_collection_name}")
+
     def __del__(self):
         """Clean up the executor on deletion."""
         if hasattr(self, 'executor'):
             self.executor.shutdown(wait=True)
-
-# Update the image_generation_tool node in setup_langgraph_async method
-async def image_generator_node(state: OrchestratorState):
-    """Generate an image based on the parameters."""
-    writer = get_stream_writer()
-    try:
-        params = state.get("image_generation_params", {})
-        if not params:
-            writer("Error: Missing image generation parameters.")
-            return {"messages": [AIMessage(content="Error: Missing image generation parameters.")]}
-            
-        # Stream status update
-        writer("Generating image based on your specifications...")
-            
-        image_generator = ImageGenerator()
-        image_base64 = image_generator.generate_image_from_schema(params)
-        
-        if image_base64:
-            # Create a markdown image that can be rendered in the chat
-            image_md = f"![Generated Image](data:image/png;base64,{image_base64})"
-            # Stream the image
-            writer({"content": image_md, "exclude_from_history": True})
-            # Add a flag to indicate this is an image response that shouldn't be stored in history
-            return {"messages": [AIMessage(content=image_md)], "exclude_from_history": True}
-        else:
-            writer("Failed to generate image. Please check parameters and try again.")
-            return {"messages": [AIMessage(content="Failed to generate image. Please check parameters and try again.")]}
-    except Exception as e:
-        logging.error(f"Error in image_generator_node: {e}")
-        writer(f"Error generating image: {str(e)}")
-        return {"messages": [AIMessage(content=f"Error generating image: {str(e)}")]}
\ No newline at end of file
@@ -14,6 +14,8 @@ nest_asyncio.apply()
 
 # Import the AI tutor and its config
 from Student_AI_tutor import AsyncRAGTutor, RAGTutorConfig
+from fast_path import FAST_PATH_MARKER
+from image_delivery import IMAGE_PROGRESS_MARKER
 
 # Configure logging
 logging.basicConfig(
@@ -304,6 +306,8 @@ async def get_response_stream_async(query: str, history: List[Dict[str, Any]], i
             uploaded_files=uploaded_files,
             student_details=student_details
         ):
+            if chunk == FAST_PATH_MARKER or chunk.startswith(IMAGE_PROGRESS_MARKER):
+                continue
             yield chunk
     except Exception as e:
         logger.error(f"Error getting response stream: {e}", exc_info=True)
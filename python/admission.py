@@ -0,0 +1,262 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUE, REJECT, CANCEL = "queue", "reject", "cancel"
+SESSION_POLICIES = (QUEUE, REJECT, CANCEL)
+
+# Endpoint classes with their default concurrency limits (ADMISSION_LIMIT_<CLASS> overrides).
+DEFAULT_ADMISSION_LIMITS = {
+    "chat": 64,         # streaming tutor answers
+    "ingest": 8,        # document uploads (parsing + embeddings)
+    "generation": 16,   # assessments, teaching content, slides, images, comics, video, web search
+}
+
+
+class AdmissionRejected(Exception):
+    """The endpoint class is at its concurrency limit; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, endpoint_class: str, retry_after: int):
+        super().__init__(f"Too many concurrent '{endpoint_class}' requests. Retry in {retry_after}s.")
+        self.endpoint_class = endpoint_class
+        self.retry_after = retry_after
+
+
+class SessionBusy(Exception):
+    """Another request of the same session is running (reject policy) or too many are queued."""
+
+    def __init__(self, session_key: str, retry_after: int = 1, reason: str = "busy"):
+        super().__init__(f"Session {session_key} is {reason}; another request for it is still running.")
+        self.session_key = session_key
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+# ---------------------------------------------------------------------------
+# Per-session serialization
+# ---------------------------------------------------------------------------
+
+class SessionTurn:
+    """One request's turn on a session. Under the cancel policy a newer request sets `superseded`."""
+
+    def __init__(self, cancellable: bool = True):
+        self.cancellable = cancellable
+        self.superseded = asyncio.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.superseded.is_set()
+
+
+@dataclass
+class _SessionLane:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    turns: List[SessionTurn] = field(default_factory=list)
+
+
+class SessionGate:
+    """
+    Serializes requests per session so two requests never use one tutor at the same time.
+
+    Policies for a request that arrives while the session is busy:
+    - queue: wait for the running request (at most `max_queued` waiting per session)
+    - reject: fail immediately with SessionBusy
+    - cancel: mark the running and queued requests as superseded and run next; streams
+      check `turn.cancelled` between chunks and stop early. Turns entered with
+      cancellable=False (document ingestion) are never superseded, only waited for.
+    """
+
+    def __init__(self, policy: str = QUEUE, max_queued: int = 4):
+        if policy not in SESSION_POLICIES:
+            raise ValueError(f"Unknown session policy '{policy}', expected one of {SESSION_POLICIES}")
+        self.policy = policy
+        self.max_queued = max_queued
+        self._lanes: Dict[str, _SessionLane] = {}
+        self.stats = {"entered": 0, "waited": 0, "rejected": 0, "superseded": 0}
+
+    def check(self, session_key: str) -> None:
+        """Fails fast (before a response has started) when the request would be rejected."""
+        lane = self._lanes.get(session_key)
+        if lane is None or not lane.lock.locked():
+            return
+        if self.policy == REJECT:
+            self.stats["rejected"] += 1
+            raise SessionBusy(session_key)
+        if self.policy == QUEUE and len(lane.turns) - 1 >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise SessionBusy(session_key, reason="overloaded")
+
+    @asynccontextmanager
+    async def hold(self, session_key: str, cancellable: bool = True) -> AsyncIterator[SessionTurn]:
+        self.check(session_key)
+        lane = self._lanes.setdefault(session_key, _SessionLane())
+        if self.policy == CANCEL:
+            for turn in lane.turns:
+                if turn.cancellable and not turn.cancelled:
+                    turn.superseded.set()
+                    self.stats["superseded"] += 1
+        turn = SessionTurn(cancellable)
+        lane.turns.append(turn)
+        try:
+            if lane.lock.locked():
+                self.stats["waited"] += 1
+            async with lane.lock:
+                if turn.cancelled:
+                    # A newer request arrived while this one was queued.
+                    raise SessionBusy(session_key, reason="superseded")
+                self.stats["entered"] += 1
+                yield turn
+        finally:
+            lane.turns.remove(turn)
+            if not lane.turns:
+                self._lanes.pop(session_key, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "policy": self.policy,
+            "busy_sessions": sum(1 for lane in self._lanes.values() if lane.lock.locked()),
+            "queued": sum(max(0, len(lane.turns) - 1) for lane in self._lanes.values()),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Global admission control
+# ---------------------------------------------------------------------------
+
+class Permit:
+    """A slot in an endpoint class. release() is idempotent."""
+
+    def __init__(self, limiter: "_ClassLimiter"):
+        self._limiter = limiter
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter.release(time.monotonic() - self._started)
+
+
+class _ClassLimiter:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_seconds = 1.0  # moving average of how long a request holds its slot
+
+    def try_acquire(self) -> Optional[Permit]:
+        if self.in_flight >= self.limit:
+            return None
+        self.in_flight += 1
+        self.admitted += 1
+        return Permit(self)
+
+    def release(self, seconds: float) -> None:
+        self.in_flight -= 1
+        self.avg_seconds = 0.9 * self.avg_seconds + 0.1 * seconds
+
+    def retry_after(self) -> int:
+        # With `limit` slots each held ~avg_seconds, a slot frees up about every avg_seconds / limit.
+        return max(1, min(30, math.ceil(self.avg_seconds / max(self.limit, 1))))
+
+
+class _PermitReleasingIterator:
+    """Wraps a response body so its permit is released when the stream ends, fails, is closed or dropped."""
+
+    def __init__(self, iterator, permit: Permit):
+        self._iterator = iterator.__aiter__()
+        self._permit = permit
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._iterator.__anext__()
+        except BaseException:
+            self._permit.release()
+            raise
+
+    async def aclose(self):
+        try:
+            aclose = getattr(self._iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            self._permit.release()
+
+    def __del__(self):
+        # Covers responses whose body was never iterated (client gone before the stream started).
+        self._permit.release()
+
+
+class AdmissionController:
+    """
+    Caps concurrent requests per endpoint class and rejects the excess immediately
+    with AdmissionRejected (served as 429 + Retry-After) instead of queueing coroutines.
+    """
+
+    def __init__(self, limits: Dict[str, int], queue_timeout: float = 0.0):
+        self._limiters = {name: _ClassLimiter(name, limit) for name, limit in limits.items()}
+        self.queue_timeout = queue_timeout
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        limits = {
+            name: int(os.getenv(f"ADMISSION_LIMIT_{name.upper()}", str(default)))
+            for name, default in DEFAULT_ADMISSION_LIMITS.items()
+        }
+        return cls(limits, float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "0")))
+
+    async def acquire(self, endpoint_class: str) -> Permit:
+        limiter = self._limiters[endpoint_class]
+        permit = limiter.try_acquire()
+        deadline = time.monotonic() + self.queue_timeout
+        # Optional short grace period for bursts; 0 (the default) rejects right away.
+        while permit is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            permit = limiter.try_acquire()
+        if permit is None:
+            limiter.rejected += 1
+            raise AdmissionRejected(endpoint_class, limiter.retry_after())
+        return permit
+
+    def admitted(self, endpoint_class: str):
+        """
+        Decorator for endpoints. Streaming responses keep their slot until the
+        stream finishes; other responses release it when the endpoint returns.
+        """
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                permit = await self.acquire(endpoint_class)
+                try:
+                    response = await func(*args, **kwargs)
+                except BaseException:
+                    permit.release()
+                    raise
+                if hasattr(response, "body_iterator"):
+                    response.body_iterator = _PermitReleasingIterator(response.body_iterator, permit)
+                else:
+                    permit.release()
+                return response
+            return wrapper
+        return decorator
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            name: {"limit": l.limit, "in_flight": l.in_flight, "admitted": l.admitted, "rejected": l.rejected,
+                   "avg_seconds": round(l.avg_seconds, 3)}
+            for name, l in self._limiters.items()
+        }
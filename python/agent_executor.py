@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from langchain_core.messages import AIMessageChunk, ToolMessage, message_chunk_to_message
+
+logger = logging.getLogger(__name__)
+
+
+def _chunk_text(chunk: AIMessageChunk) -> str:
+    """Extracts the text delta from a streamed message chunk."""
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    # Some providers (e.g. Gemini) stream a list of content blocks instead of a plain string.
+    parts = []
+    for block in content or []:
+        if isinstance(block, str):
+            parts.append(block)
+        elif isinstance(block, dict) and block.get("type") == "text":
+            parts.append(block.get("text", ""))
+    return "".join(parts)
+
+
+def _log_prompt_usage(stage: str, message: Optional[AIMessageChunk], started: float, first_token: Optional[float]) -> None:
+    """Logs prompt tokens (and how many were served from the provider's prompt cache) and latency."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    ttft = f"{(first_token - started) * 1000:.0f}ms" if first_token else "n/a"
+    logger.info(
+        f"{stage}: prompt_tokens={usage.get('input_tokens', 'n/a')} cached_prompt_tokens={cached} "
+        f"output_tokens={usage.get('output_tokens', 'n/a')} first_token={ttft} "
+        f"total={(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+
+
+async def _run_tool_call(tool_call: Dict[str, Any], tool_map: Dict[str, Any], timeout: Optional[float]) -> ToolMessage:
+    """Runs one tool call, turning errors and timeouts into a degraded ToolMessage."""
+    tool_name = tool_call["name"]
+    logger.info(f"LLM decided to call tool: {tool_name} with args {tool_call['args']}")
+    if tool_name not in tool_map:
+        return ToolMessage(content=f"Error: Tool '{tool_name}' not found.", tool_call_id=tool_call["id"])
+
+    start = time.perf_counter()
+    try:
+        # wait_for cancels the tool coroutine when its budget runs out.
+        tool_output = await asyncio.wait_for(tool_map[tool_name].ainvoke(tool_call["args"]), timeout=timeout)
+        logger.info(f"Tool {tool_name} finished in {time.perf_counter() - start:.2f}s")
+    except asyncio.TimeoutError:
+        logger.warning(f"Tool {tool_name} timed out after {timeout}s")
+        tool_output = (
+            f"Tool '{tool_name}' timed out after {timeout:g} seconds and returned no result. "
+            "Answer with the other information available and mention that this source was unavailable."
+        )
+    except Exception as e:
+        logger.error(f"Tool {tool_name} failed: {e}")
+        tool_output = f"Error: Tool '{tool_name}' failed: {e}"
+    return ToolMessage(content=str(tool_output), tool_call_id=tool_call["id"])
+
+
+async def execute_tool_calls(
+    tool_calls: List[Dict[str, Any]],
+    tool_map: Dict[str, Any],
+    tool_timeouts: Optional[Dict[str, float]] = None,
+    default_timeout: Optional[float] = None,
+) -> List[ToolMessage]:
+    """
+    Executes the requested tool calls concurrently, each under its own deadline.
+
+    Args:
+        tool_calls: Tool calls from the model response.
+        tool_map: Mapping of tool name to tool.
+        tool_timeouts: Per-tool latency budgets in seconds, keyed by tool name.
+        default_timeout: Budget for tools without an entry in `tool_timeouts` (None means no limit).
+
+    Returns:
+        One ToolMessage per tool call, in the same order as `tool_calls`.
+    """
+    tool_timeouts = tool_timeouts or {}
+    return list(await asyncio.gather(*[
+        _run_tool_call(tool_call, tool_map, tool_timeouts.get(tool_call["name"], default_timeout))
+        for tool_call in tool_calls
+    ]))
+
+
+async def stream_tool_calling_turn(
+    llm: Any,
+    llm_with_tools: Any,
+    messages: List[Any],
+    tool_map: Dict[str, Any],
+    tool_timeouts: Optional[Dict[str, float]] = None,
+    default_tool_timeout: Optional[float] = None,
+    turn_info: Optional[Dict[str, Any]] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Runs one agent turn in a single streaming pass over the tool-bound model.
+
+    Text deltas from the tool-bound call are yielded as soon as they arrive, while
+    tool-call chunks are merged as they stream in. A second round-trip to the model
+    is only made when the first pass actually requested one or more tools.
+
+    Args:
+        llm: The plain chat model used to answer after the tools have run.
+        llm_with_tools: The same model with the tutor's tools bound to it.
+        messages: The System/Human messages for this turn. Tool calls and tool
+            results are appended to this list in place.
+        tool_map: Mapping of tool name to tool for the currently enabled tools.
+        tool_timeouts: Per-tool latency budgets in seconds, see execute_tool_calls.
+        default_tool_timeout: Budget for tools without an explicit entry.
+        turn_info: Optional dict that receives `tool_calls`, the names of the tools
+            the model called during this turn (empty when it answered directly).
+
+    Yields:
+        Text chunks of the final answer.
+    """
+    gathered: Optional[AIMessageChunk] = None
+    started, first_token = time.perf_counter(), None
+    async for chunk in llm_with_tools.astream(messages):
+        gathered = chunk if gathered is None else gathered + chunk
+        text = _chunk_text(chunk)
+        if text:
+            first_token = first_token or time.perf_counter()
+            yield text
+
+    if gathered is None:
+        logger.warning("Tool-bound model returned an empty stream.")
+        return
+    _log_prompt_usage("Tool-bound call", gathered, started, first_token)
+
+    if turn_info is not None:
+        turn_info["tool_calls"] = [tool_call["name"] for tool_call in gathered.tool_calls]
+
+    if gathered.invalid_tool_calls:
+        logger.warning(f"Model produced invalid tool calls: {gathered.invalid_tool_calls}")
+
+    if not gathered.tool_calls:
+        # Scenario 1: The LLM answered directly and the answer has already been streamed.
+        logger.info("LLM answered directly without tool usage in a single streaming pass.")
+        return
+
+    # Scenario 2: The LLM decided to call one or more tools; run them concurrently.
+    ai_message = message_chunk_to_message(gathered)
+    messages.append(ai_message)
+    messages.extend(await execute_tool_calls(ai_message.tool_calls, tool_map, tool_timeouts, default_tool_timeout))
+
+    # Now, invoke the model again with the tool results to get the final answer.
+    final: Optional[AIMessageChunk] = None
+    started, first_token = time.perf_counter(), None
+    async for chunk in llm.astream(messages):
+        final = chunk if final is None else final + chunk
+        text = _chunk_text(chunk)
+        if text:
+            first_token = first_token or time.perf_counter()
+            yield text
+    _log_prompt_usage("Post-tool call", final, started, first_token)
@@ -0,0 +1,82 @@
+"""
+Compares the session BM25 index as a session grows: rebuilding langchain's
+BM25Retriever from every chunk on each upload (the cumulative equivalent of the
+old per-upload rebuild) against appending to IncrementalBM25Index.
+
+Usage (from the python/ directory):
+    python benchmarks/bench_bm25.py --documents 500 --batch 10
+
+Chunks are synthetic (Zipf-distributed words, ~200 tokens each). Reported per
+checkpoint: time to index the latest upload, query latency and retained memory.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_community.retrievers import BM25Retriever
+
+from bm25_index import IncrementalBM25Index, IncrementalBM25Retriever, tokenize
+
+QUERIES = ["w1 w17 w230", "w5 w99", "w3 w42 w777 w1500", "w12", "w8 w64 w512"]
+
+
+def _corpus(documents: int, vocabulary: int = 20000, tokens: int = 200) -> List[Document]:
+    rng = random.Random(7)
+    words = [f"w{i}" for i in range(vocabulary)]
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary)]
+    return [
+        Document(page_content=" ".join(rng.choices(words, weights, k=tokens)), metadata={"source": f"file_{i // 10}.pdf"})
+        for i in range(documents)
+    ]
+
+
+def _query_ms(retriever, repeats: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for query in QUERIES:
+            retriever.invoke(query)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(QUERIES))
+
+
+def _run(mode: str, corpus: List[Document], batch: int, checkpoints: List[int]) -> List[dict]:
+    tracemalloc.start()
+    index, retriever, rows = IncrementalBM25Index(), None, []
+    for end in range(batch, len(corpus) + 1, batch):
+        start = time.perf_counter()
+        if mode == "rebuild":
+            retriever = BM25Retriever.from_documents(corpus[:end], preprocess_func=tokenize, k=5)
+        else:
+            index.add_documents(corpus[end - batch:end])
+            retriever = retriever or IncrementalBM25Retriever(index=index, k=5)
+        upload_ms = (time.perf_counter() - start) * 1000
+        if end in checkpoints:
+            current, _ = tracemalloc.get_traced_memory()
+            rows.append({"documents": end, "upload_ms": upload_ms, "query_ms": _query_ms(retriever),
+                         "retained_mb": current / 1024 / 1024})
+    tracemalloc.stop()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cumulative BM25 rebuilds vs the incremental index.")
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=10, help="chunks per upload")
+    args = parser.parse_args()
+
+    corpus = _corpus(args.documents)
+    checkpoints = sorted({c for c in (50, 100, 250, 500, args.documents) if c <= args.documents and c % args.batch == 0})
+    for mode in ("rebuild", "incremental"):
+        for row in _run(mode, corpus, args.batch, checkpoints):
+            print(f"{mode:>11} @ {row['documents']:>4} chunks: upload {row['upload_ms']:8.2f} ms | "
+                  f"query {row['query_ms']:6.3f} ms | retained {row['retained_mb']:6.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures what the chunking stage changes for knowledge-base retrieval: prompt
+tokens handed to the model per query, and recall of the passage that answers it.
+
+Usage (from the python/ directory):
+    python benchmarks/bench_chunking.py --pages 40 --k 5
+
+The corpus is synthetic: pages of filler paragraphs under headings, each section
+holding one fact with distinctive terms. Each query asks for one fact; it is
+recalled when the retrieved context contains that fact's sentence. Retrieval uses
+the session BM25 index so no embedding API is needed; "unsplit" embeds whole
+loader pages (the previous behaviour), "chunked" runs DocumentChunker first.
+"""
+import os
+import sys
+import random
+import argparse
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from bm25_index import IncrementalBM25Index
+from chunking import DocumentChunker
+
+FILLER = ("students teachers lesson learning science history energy matter system process example result "
+          "method study chapter concept theory model practice question answer class school reading").split()
+
+
+def _corpus(pages: int, sections: int, rng: random.Random) -> Tuple[List[Document], List[Tuple[str, str]]]:
+    documents, facts = [], []
+    for page in range(pages):
+        parts = []
+        for section in range(sections):
+            fact_id = page * sections + section
+            fact = f"The zeta{fact_id} coefficient of compound{fact_id} is {rng.randint(10, 99)} units."
+            facts.append((f"What is the zeta{fact_id} coefficient of compound{fact_id}?", fact))
+            paragraphs = [" ".join(rng.choices(FILLER, k=60)) + "." for _ in range(3)]
+            paragraphs.insert(rng.randint(0, 3), fact)
+            parts.append(f"## Section {page + 1}.{section + 1}\n" + "\n\n".join(paragraphs))
+        documents.append(Document(page_content="\n\n".join(parts), metadata={"source": "textbook.pdf", "page": page}))
+    return documents, facts
+
+
+def _evaluate(name: str, documents: List[Document], facts, k: int, chunker: DocumentChunker) -> None:
+    index = IncrementalBM25Index()
+    index.add_documents(documents)
+    recalled, prompt_tokens = 0, 0
+    for query, fact in facts:
+        retrieved = index.search(query, k)
+        context = "\n\n".join(f"Source: {doc.metadata.get('source')}\nContent: {doc.page_content}" for doc in retrieved)
+        recalled += fact in context
+        prompt_tokens += chunker.count_tokens(context)
+    sizes = sorted(chunker.count_tokens(doc.page_content) for doc in documents)
+    print(f"{name:>8}: {len(documents):5d} vectors (median {sizes[len(sizes) // 2]} tokens) | "
+          f"recall@{k} {recalled / len(facts):.3f} | prompt tokens/query {prompt_tokens / len(facts):8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval with and without the chunking stage.")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--sections", type=int, default=6, help="sections (facts) per page")
+    parser.add_argument("--k", type=int, default=5, help="retrieved documents per query (retrieval_k)")
+    parser.add_argument("--chunk-tokens", type=int, default=400)
+    parser.add_argument("--overlap-tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    pages, facts = _corpus(args.pages, args.sections, random.Random(11))
+    chunker = DocumentChunker(args.chunk_tokens, args.overlap_tokens)
+    _evaluate("unsplit", pages, facts, args.k, chunker)
+    _evaluate("chunked", chunker.split_documents(pages), facts, args.k, chunker)
+
+
+if __name__ == "__main__":
+    main()
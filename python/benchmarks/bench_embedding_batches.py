@@ -0,0 +1,112 @@
+"""
+Simulates ingesting a large upload against a rate-limited embeddings provider:
+one request for every chunk (the old behaviour, apart from the client's own
+internal batching) against the EmbeddingScheduler's token-sized, concurrent,
+backed-off batches.
+
+Usage (from the python/ directory):
+    python benchmarks/bench_embedding_batches.py --chunks 2500 --tpm 400000
+
+The fake provider charges `--latency-ms` plus a per-token cost for each request
+and enforces a tokens-per-minute budget (scaled down by `--time-scale` so a run
+takes seconds): a request that would exceed the budget fails with a 429 carrying
+Retry-After. Reported: wall time, requests, 429s, and whether the ingest finished.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from embedding_pipeline import EmbeddingBatchError, EmbeddingScheduler
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("rate limited")
+        self.response = type("Response", (), {"headers": {"retry-after": str(retry_after)}})()
+
+
+class FakeProvider:
+    """Token bucket refilled continuously at `tpm` tokens per (scaled) minute."""
+
+    def __init__(self, tpm: int, latency_ms: float, time_scale: float):
+        self.capacity = tpm
+        self.rate = tpm / (60.0 / time_scale)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        self.rejected = 0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        cost = sum(len(text) // 4 for text in texts)
+        if cost > self.tokens:
+            self.rejected += 1
+            raise RateLimitError(round((cost - self.tokens) / self.rate, 2))
+        self.tokens -= cost
+        await asyncio.sleep(self.latency + cost / 1_000_000)
+        return [[0.0] * 8 for _ in texts]
+
+
+async def _upsert(documents: List[Document], vectors: List[List[float]]) -> None:
+    await asyncio.sleep(0.002)
+
+
+async def _single_request(corpus: List[Document], provider: FakeProvider) -> str:
+    try:
+        vectors = await provider.embed([doc.page_content for doc in corpus])
+        await _upsert(corpus, vectors)
+        return "stored"
+    except RateLimitError:
+        return "FAILED (429)"
+
+
+async def _scheduled(corpus: List[Document], provider: FakeProvider, args) -> str:
+    scheduler = EmbeddingScheduler(batch_tokens=args.batch_tokens, concurrency=args.concurrency,
+                                   max_retries=args.retries, base_delay=0.05, max_delay=2.0)
+    try:
+        stored = await scheduler.run(corpus, provider.embed, _upsert)
+        return f"stored {stored}"
+    except EmbeddingBatchError as e:
+        return f"FAILED after {len(e.stored)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched, rate-limit-aware embedding.")
+    parser.add_argument("--chunks", type=int, default=2500, help="~5 chunks per page of a 500-page upload")
+    parser.add_argument("--chunk-tokens", type=int, default=400)
+    parser.add_argument("--tpm", type=int, default=400000, help="provider tokens per minute")
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--time-scale", type=float, default=20.0, help="how much faster than real time the budget refills")
+    parser.add_argument("--batch-tokens", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=8)
+    args = parser.parse_args()
+
+    corpus = [Document(page_content="word " * (args.chunk_tokens * 4 // 5), metadata={"token_count": args.chunk_tokens})
+              for _ in range(args.chunks)]
+    for name in ("single", "scheduled"):
+        provider = FakeProvider(args.tpm, args.latency_ms, args.time_scale)
+        start = time.perf_counter()
+        if name == "single":
+            outcome = asyncio.run(_single_request(corpus, provider))
+        else:
+            outcome = asyncio.run(_scheduled(corpus, provider, args))
+        print(f"{name:>9}: {time.perf_counter() - start:7.2f} s | {provider.requests:4d} requests | "
+              f"{provider.rejected:3d} x 429 | {outcome}")
+
+
+if __name__ == "__main__":
+    main()
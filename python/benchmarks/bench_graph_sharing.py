@@ -0,0 +1,80 @@
+"""
+Compares compiling the orchestrator graph per session against the shared, process-wide graph.
+
+Usage (from the python/ directory):
+    python benchmarks/bench_graph_sharing.py --sessions 200
+
+A stub tutor stands in for AsyncRAGTutor so no LLM calls are made: the numbers
+isolate graph compilation cost (memory and time to the first streamed chunk).
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage
+
+from tutor_graph import ActionType, build_orchestrator_graph, get_orchestrator_graph, tutor_run_config
+
+
+class StubTutor:
+    """Implements the parts of the tutor interface the orchestrator graph calls."""
+    profile_state_key = "student_details"
+    ensemble_retriever = None
+
+    async def _route_query(self, query: str) -> dict:
+        return {"action": ActionType.USE_LLM_WITH_TOOLS}
+
+    async def _agent_executor_stream_async(self, query, formatted_time, is_knowledge_base_ready, history, **profile):
+        for token in ("Photosynthesis ", "turns ", "light ", "into ", "energy."):
+            yield token
+
+
+async def _first_message(graph, tutor) -> float:
+    """Seconds from session start until the first chunk of the first answer is streamed."""
+    start = time.perf_counter()
+    initial_state = {"messages": [HumanMessage(content="What is photosynthesis?")], "history": [], "student_details": {}}
+    async for _ in graph.astream(initial_state, config=tutor_run_config(tutor), stream_mode="custom"):
+        return time.perf_counter() - start
+    return time.perf_counter() - start
+
+
+async def _run(mode: str, sessions: int) -> dict:
+    tracemalloc.start()
+    graphs, first_chunk = [], []
+    for _ in range(sessions):
+        start = time.perf_counter()
+        graph = build_orchestrator_graph() if mode == "per-session" else get_orchestrator_graph()
+        compile_time = time.perf_counter() - start
+        graphs.append(graph)  # keep sessions alive, as the session dict does
+        first_chunk.append(compile_time + await _first_message(graph, StubTutor()))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    first_chunk.sort()
+    return {
+        "mode": mode,
+        "retained_mb": current / 1024 / 1024,
+        "peak_mb": peak / 1024 / 1024,
+        "p50_ms": first_chunk[len(first_chunk) // 2] * 1000,
+        "p95_ms": first_chunk[int(len(first_chunk) * 0.95) - 1] * 1000,
+        "unique_graphs": len({id(g) for g in graphs}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-session vs shared orchestrator graphs.")
+    parser.add_argument("--sessions", type=int, default=100)
+    args = parser.parse_args()
+
+    for mode in ("per-session", "shared"):
+        result = asyncio.run(_run(mode, args.sessions))
+        print(f"{result['mode']:>12}: {result['unique_graphs']} graphs | retained {result['retained_mb']:.2f} MB | "
+              f"peak {result['peak_mb']:.2f} MB | first chunk p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
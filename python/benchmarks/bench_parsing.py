@@ -0,0 +1,110 @@
+"""
+Measures document parsing for uploads: wall time and how much it delays the
+event loop that serves every SSE stream, parsing in a worker thread (the
+previous behaviour) against the DocumentParser process pool with page ranges.
+
+Usage (from the python/ directory):
+    python benchmarks/bench_parsing.py --pages 10 100 500 --pool-size 4
+
+PDFs are generated (text pages, ~45 lines each). Event-loop lag is sampled by
+a ticker that sleeps 10 ms and records how late it wakes up; a token stream
+sharing the loop is delayed by the same amount.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_parsing import DocumentParser
+
+WORDS = "the cell membrane controls which substances enter and leave while energy from respiration drives transport".split()
+
+
+def _write_pdf(path: str, pages: int, lines: int = 45) -> None:
+    """A minimal text-only PDF (Helvetica), built by hand so no PDF writer is needed."""
+    objects: List[bytes] = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        text = [f"BT /F1 10 Tf 40 800 Td 12 TL (Page {page + 1}) Tj".encode()]
+        for line in range(lines):
+            words = " ".join(WORDS[(page + line + i) % len(WORDS)] for i in range(12))
+            text.append(f"T* ({words} {page}.{line}) Tj".encode())
+        stream = b" ".join(text) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % len(objects))
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+async def _measure(parser: DocumentParser, path: str) -> dict:
+    lags: List[float] = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(max(0.0, time.perf_counter() - start - 0.01) * 1000)
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    docs = await parser.parse_bytes(data, os.path.basename(path))
+    wall = time.perf_counter() - start
+    stop.set()
+    await tick
+    lags.sort()
+    return {"pages": len(docs), "wall_s": wall, "lag_max_ms": lags[-1] if lags else 0.0,
+            "lag_p99_ms": lags[int(len(lags) * 0.99)] if lags else 0.0,
+            "lag_median_ms": statistics.median(lags) if lags else 0.0}
+
+
+async def _run(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = [("thread", DocumentParser(pool_size=0)),
+                 ("pool", DocumentParser(pool_size=args.pool_size, pages_per_task=args.pages_per_task))]
+        # Start the workers before timing so process spawn is not billed to the first file.
+        warmup = os.path.join(tmp, "warmup.pdf")
+        _write_pdf(warmup, 1)
+        with open(warmup, "rb") as f:
+            await modes[1][1].parse_bytes(f.read(), "warmup.pdf")
+        for pages in args.pages:
+            path = os.path.join(tmp, f"doc_{pages}.pdf")
+            _write_pdf(path, pages)
+            for name, parser in modes:
+                row = await _measure(parser, path)
+                print(f"{pages:>4} pages | {name:>6}: {row['wall_s']:7.2f} s | loop lag median {row['lag_median_ms']:6.2f} ms, "
+                      f"p99 {row['lag_p99_ms']:7.2f} ms, max {row['lag_max_ms']:7.2f} ms | {row['pages']} pages parsed")
+        modes[1][1].shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thread vs process-pool document parsing.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--pool-size", type=int, default=max(1, min(4, (os.cpu_count() or 2) - 1)))
+    parser.add_argument("--pages-per-task", type=int, default=25)
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Compares the legacy system prompt layout with the cache-friendly one.
+
+Usage (from the python/ directory):
+    python benchmarks/bench_prompt_layout.py --turns 20
+    python benchmarks/bench_prompt_layout.py --live    # also measures real prompt tokens / latency via OpenAI
+
+Legacy layout: pretty-printed profile near the top, rebuilt every turn.
+New layout: persona + rules + compact canonical profile as a cached prefix,
+time and session status as a short suffix.
+
+Reported per layout: prompt tokens, tokens in the prefix shared by consecutive
+turns (what a provider-side prompt cache can reuse) and render time per turn.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Student_chatbot.Student_AI_tutor import RAGTutorConfig
+from prompt_cache import SystemPromptCache, render_volatile_suffix
+
+SAMPLE_PROFILE = {
+    "name": "Aisha Rahman",
+    "grade": "8",
+    "subjects": ["Mathematics", "Science", "English"],
+    "pending_tasks": [
+        {"subject": "Mathematics", "title": "Linear equations worksheet", "due": "2025-10-21"},
+        {"subject": "Science", "title": "Photosynthesis lab report", "due": "2025-10-23"},
+    ],
+    "achievements": ["Science fair finalist"],
+    "preferred_language": "English",
+}
+SESSION_NOTES = [
+    "- **Knowledge Base**: NOT AVAILABLE. Do not use the 'knowledge_base_retriever' tool.",
+    "- **Web Search**: ENABLED. You can use the 'websearch_tool' tool for web searches.",
+]
+PROFILE_BLOCK = "**Student Details:**\n{student_details_schema}"
+
+
+def _count_tokens(text: str) -> int:
+    try:
+        import tiktoken
+        return len(tiktoken.encoding_for_model("gpt-4o").encode(text))
+    except Exception:
+        return len(text) // 4  # rough estimate when tiktoken is unavailable
+
+
+def _legacy_prompt(template: str, formatted_time: str) -> str:
+    """Reconstructs the previous layout: profile at the top, pretty-printed, time at the end."""
+    first_line, rest = template.split("\n", 1)
+    rest = rest.replace(PROFILE_BLOCK, "").rstrip()
+    profile = json.dumps(SAMPLE_PROFILE, indent=2)
+    prompt = f"{first_line}\n\n**Student Details:**\n{profile}\n{rest}\n\n**🕒 Current Time**: {formatted_time}\n"
+    return prompt + "\n\n**Current Session Status:**\n" + "\n".join(SESSION_NOTES)
+
+
+def _new_prompt(cache: SystemPromptCache, template: str, formatted_time: str) -> str:
+    prefix = cache.prefix("follow_up", template, "student_details_schema", SAMPLE_PROFILE, "No student details provided.")
+    return prefix + render_volatile_suffix(formatted_time, SESSION_NOTES)
+
+
+def _shared_prefix_tokens(previous: str, current: str) -> int:
+    length = 0
+    for a, b in zip(previous, current):
+        if a != b:
+            break
+        length += 1
+    return _count_tokens(current[:length])
+
+
+async def _live_call(prompt: str) -> dict:
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from model_clients import OPENAI, get_model_registry
+
+    llm = get_model_registry().chat(OPENAI, model="gpt-4o", temperature=0.2, max_tokens=16)
+    start = time.perf_counter()
+    response = await llm.ainvoke([SystemMessage(content=prompt), HumanMessage(content="Say hi.")])
+    usage = response.usage_metadata or {}
+    return {
+        "latency_ms": (time.perf_counter() - start) * 1000,
+        "input_tokens": usage.get("input_tokens", 0),
+        "cached": (usage.get("input_token_details") or {}).get("cache_read", 0),
+    }
+
+
+async def _live_calls(prompts) -> list:
+    # Sequential on one event loop, so each turn can hit the prefix cached by the previous one.
+    return [await _live_call(prompt) for prompt in prompts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the system prompt layout.")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--live", action="store_true", help="Send each prompt to OpenAI and report usage/latency.")
+    args = parser.parse_args()
+
+    template = RAGTutorConfig().follow_up_system_prompt
+    cache = SystemPromptCache()
+    clock = datetime(2025, 10, 20, 9, 0, 0)
+
+    prompts_by_layout = {}
+    for name in ("legacy", "cache-friendly"):
+        prompts, render_seconds = [], 0.0
+        for turn in range(args.turns):
+            formatted_time = (clock + timedelta(seconds=37 * turn)).strftime("%Y-%m-%d %H:%M:%S")
+            start = time.perf_counter()
+            prompt = _legacy_prompt(template, formatted_time) if name == "legacy" else _new_prompt(cache, template, formatted_time)
+            render_seconds += time.perf_counter() - start
+            prompts.append(prompt)
+
+        tokens = _count_tokens(prompts[-1])
+        shared = [_shared_prefix_tokens(a, b) for a, b in zip(prompts, prompts[1:])]
+        print(f"{name:>15}: prompt {tokens} tokens | prefix shared across turns {min(shared) if shared else 0} tokens | "
+              f"render {render_seconds / args.turns * 1e6:.1f} us/turn")
+        prompts_by_layout[name] = prompts[:5]
+    print(f"Prefix cache: {cache.hits} hits / {cache.misses} misses")
+
+    if args.live:
+        results = asyncio.run(_live_calls([p for prompts in prompts_by_layout.values() for p in prompts]))
+        for index, result in enumerate(results):
+            name = list(prompts_by_layout)[index // 5]
+            print(f"{name:>15} turn {index % 5 + 1}: input {result['input_tokens']} tokens, "
+                  f"cached {result['cached']}, latency {result['latency_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Compares first-upload latency of per-session Qdrant collections against one shared,
+session-filtered collection (QDRANT_SHARED_COLLECTION).
+
+Usage (from the python/ directory):
+    python benchmarks/bench_qdrant_collections.py --sessions 50 --url http://localhost:6333
+    python benchmarks/bench_qdrant_collections.py --sessions 50            # in-process Qdrant
+
+A deterministic hashing embedder stands in for OpenAI, so the numbers isolate the
+Qdrant side: collection setup + upsert for the first upload, and one filtered search.
+Against a real server collection creation dominates; the in-process mode mostly shows
+relative overhead. Benchmark collections are deleted afterwards.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "unused-by-benchmark")
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from qdrant_client import QdrantClient
+
+from Student_chatbot.Student_AI_tutor import RAGTutorConfig, VectorStoreManager
+
+DIMENSIONS = 1536
+
+
+class HashEmbeddings(Embeddings):
+    """Cheap, deterministic vectors of the production dimensionality."""
+
+    def _embed(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255.0 - 0.5 for i in range(DIMENSIONS)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _documents(session: int, chunks: int) -> List[Document]:
+    return [
+        Document(page_content=f"Session {session} chunk {i}: photosynthesis converts light into chemical energy.",
+                 metadata={"source": f"notes_{session}.pdf"})
+        for i in range(chunks)
+    ]
+
+
+async def _run(mode: str, client: QdrantClient, sessions: int, chunks: int) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    shared = f"bench_shared_{run_id}" if mode == "shared" else None
+    managers, upload, search = [], [], []
+    for session in range(sessions):
+        config = RAGTutorConfig(qdrant_collection_name=f"bench_{mode}_{run_id}_{session}", qdrant_shared_collection=shared)
+        manager = VectorStoreManager(config)
+        manager.qdrant_client = client
+        manager.embeddings = HashEmbeddings()
+        managers.append(manager)
+
+        start = time.perf_counter()
+        await manager.initialize_collection()
+        await manager.aadd_documents(_documents(session, chunks))
+        upload.append(time.perf_counter() - start)
+
+        retriever = manager.get_retriever(k=5)
+        start = time.perf_counter()
+        docs = await retriever.ainvoke("What does photosynthesis do?")
+        search.append(time.perf_counter() - start)
+        # Sessions must only ever see their own chunks.
+        assert all(doc.page_content.startswith(f"Session {session} ") for doc in docs), "cross-session leak"
+
+    collections = len(client.get_collections().collections)
+    for manager in managers:
+        await manager.delete_collection_async()
+    if shared:
+        client.delete_collection(shared)
+    upload.sort()
+    search.sort()
+    return {
+        "mode": mode,
+        "collections": collections,
+        "upload_p50_ms": upload[len(upload) // 2] * 1000,
+        "upload_p95_ms": upload[max(int(len(upload) * 0.95) - 1, 0)] * 1000,
+        "search_p50_ms": search[len(search) // 2] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-session vs shared Qdrant collections.")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=40, help="chunks per first upload")
+    parser.add_argument("--url", default=None, help="Qdrant URL (default: in-process Qdrant)")
+    parser.add_argument("--api-key", default=os.getenv("QDRANT_API_KEY"))
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url, api_key=args.api_key) if args.url else QdrantClient(location=":memory:")
+    for mode in ("per-session", "shared"):
+        result = asyncio.run(_run(mode, client, args.sessions, args.chunks))
+        print(f"{result['mode']:>12}: {result['collections']} collections | first upload p50 {result['upload_p50_ms']:.1f} ms, "
+              f"p95 {result['upload_p95_ms']:.1f} ms | search p50 {result['search_p50_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Throughput benchmark for the SSE writer, using a fake token generator.
+
+Usage (from the python/ directory):
+    python benchmarks/bench_sse.py --streams 200 --tokens 500 --token-interval-ms 2
+
+Compares the previous per-token encoding (json.dumps + nested send() generator,
+one frame per token) with sse.coalesce_sse. Every frame is written to a local
+socket through an asyncio StreamWriter, as the server does for each ASGI body
+message, so per-frame transport cost is included. Reports frames, bytes, CPU
+time and tokens per CPU-second for all streams running concurrently.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sse import coalesce_sse
+
+WORDS = ["Photosynthesis ", "is ", "the ", "process ", "by ", "which ", "green ", "plants ", "use ", "sunlight ",
+         "to ", "make ", "food ", "from ", "carbon ", "dioxide ", "and ", "water. "]
+
+
+async def fake_tokens(count: int, interval: float):
+    for i in range(count):
+        if interval:
+            await asyncio.sleep(interval)
+        yield WORDS[i % len(WORDS)]
+
+
+async def legacy_stream(count: int, interval: float):
+    """The previous event_stream: one json.dumps and one nested generator per token."""
+    async def send(obj: dict):
+        yield f"data: {json.dumps(obj)}\n\n"
+
+    async for token in fake_tokens(count, interval):
+        async for part in send({"type": "text_chunk", "content": token}):
+            yield part
+    async for part in send({"type": "done"}):
+        yield part
+
+
+async def coalesced_stream(count: int, interval: float):
+    async def events():
+        async for token in fake_tokens(count, interval):
+            yield {"type": "text_chunk", "content": token}
+        yield {"type": "done"}
+
+    async for frame in coalesce_sse(events()):
+        yield frame
+
+
+async def _drain(reader: asyncio.StreamReader) -> None:
+    while await reader.read(65536):
+        pass
+
+
+async def _consume(stream) -> tuple:
+    server_sock, client_sock = socket.socketpair()
+    _, writer = await asyncio.open_connection(sock=server_sock)
+    reader, client_writer = await asyncio.open_connection(sock=client_sock)
+    drain_task = asyncio.ensure_future(_drain(reader))
+    frames = size = 0
+    async for frame in stream:
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")  # StreamingResponse encodes str chunks the same way
+        writer.write(frame)
+        await writer.drain()
+        frames += 1
+        size += len(frame)
+    writer.close()
+    await drain_task
+    client_writer.close()
+    return frames, size
+
+
+async def _run(name: str, factory, streams: int, tokens: int, interval: float) -> None:
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    results = await asyncio.gather(*[_consume(factory(tokens, interval)) for _ in range(streams)])
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    frames = sum(r[0] for r in results)
+    size = sum(r[1] for r in results)
+    total_tokens = streams * tokens
+    print(f"{name:>10}: {frames:>8} frames | {size / 1024:>9.1f} KiB | wall {wall:6.2f}s | cpu {cpu:6.2f}s | "
+          f"{total_tokens / cpu if cpu else float('inf'):>12,.0f} tokens/cpu-s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SSE encoding and coalescing.")
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--token-interval-ms", type=float, default=2.0,
+                        help="Delay between fake tokens; 0 measures pure encoding overhead.")
+    args = parser.parse_args()
+    interval = args.token_interval_ms / 1000
+
+    asyncio.run(_run("legacy", legacy_stream, args.streams, args.tokens, interval))
+    asyncio.run(_run("coalesced", coalesced_stream, args.streams, args.tokens, interval))
+
+
+if __name__ == "__main__":
+    main()
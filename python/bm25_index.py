@@ -0,0 +1,169 @@
+import re
+import math
+import logging
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+# Removed documents are compacted out of the postings once they make up this share of the slots.
+COMPACT_RATIO = 0.25
+MAX_TERM_FREQUENCY = 65535
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens (Unicode-aware, so Arabic and accented text tokenize too)."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def _source(doc: Document) -> str:
+    return str(doc.metadata.get("source", ""))
+
+
+class IncrementalBM25Index:
+    """
+    Per-session BM25 (Okapi) inverted index that grows with every upload.
+
+    Postings are typed arrays (document slots as unsigned ints, term frequencies
+    as unsigned shorts) appended in place, so an upload only tokenizes its own
+    documents. A query gathers the postings of its terms with numpy, so scoring
+    cost follows the matched postings, not the number of uploads. Documents can
+    be removed by source; their slots are masked out and compacted in bulk.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._vocab: Dict[str, int] = {}
+        self._postings_ids: List[array] = []
+        self._postings_tfs: List[array] = []
+        self._df = array("I")       # live documents per term
+        self._lengths = array("I")  # tokens per slot
+        self._alive = array("B")    # 1 for live slots, 0 for removed ones
+        self._docs: List[Optional[Document]] = []
+        self._by_source: Dict[str, List[int]] = {}
+        self._live = 0
+        self._total_length = 0
+        self._text_bytes = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    @property
+    def documents(self) -> List[Document]:
+        return [doc for doc in self._docs if doc is not None]
+
+    def add_documents(self, documents: List[Document]) -> int:
+        """Appends documents to the index; returns how many were added."""
+        for doc in documents:
+            slot = len(self._docs)
+            counts = Counter(tokenize(doc.page_content))
+            for term, tf in counts.items():
+                term_id = self._vocab.get(term)
+                if term_id is None:
+                    term_id = self._vocab[term] = len(self._postings_ids)
+                    self._postings_ids.append(array("I"))
+                    self._postings_tfs.append(array("H"))
+                    self._df.append(0)
+                self._postings_ids[term_id].append(slot)
+                self._postings_tfs[term_id].append(min(tf, MAX_TERM_FREQUENCY))
+                self._df[term_id] += 1
+            length = sum(counts.values())
+            self._lengths.append(length)
+            self._alive.append(1)
+            self._docs.append(doc)
+            self._by_source.setdefault(_source(doc), []).append(slot)
+            self._live += 1
+            self._total_length += length
+            self._text_bytes += len(doc.page_content)
+        return len(documents)
+
+    def remove_source(self, source: str) -> int:
+        """Removes every document whose metadata 'source' matches; returns how many were removed."""
+        slots = self._by_source.pop(source, [])
+        for slot in slots:
+            doc = self._docs[slot]
+            for term in set(tokenize(doc.page_content)):
+                self._df[self._vocab[term]] -= 1
+            self._alive[slot] = 0
+            self._docs[slot] = None
+            self._live -= 1
+            self._total_length -= self._lengths[slot]
+            self._text_bytes -= len(doc.page_content)
+        if slots and len(self._docs) - self._live > COMPACT_RATIO * len(self._docs):
+            self._compact()
+        return len(slots)
+
+    def _compact(self) -> None:
+        """Drops removed slots from every posting list and renumbers the live documents."""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        remap = (np.cumsum(alive) - 1).astype(np.uintc)
+        for term_id, ids in enumerate(self._postings_ids):
+            ids = np.frombuffer(ids, dtype=np.uintc)
+            keep = alive[ids]
+            tfs = np.frombuffer(self._postings_tfs[term_id], dtype=np.ushort)[keep]
+            self._postings_ids[term_id] = array("I", remap[ids[keep]].tobytes())
+            self._postings_tfs[term_id] = array("H", tfs.tobytes())
+        self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uintc)[alive].tobytes())
+        self._alive = array("B", [1]) * self._live
+        self._docs = [doc for doc in self._docs if doc is not None]
+        self._by_source = {}
+        for slot, doc in enumerate(self._docs):
+            self._by_source.setdefault(_source(doc), []).append(slot)
+
+    def search(self, query: str, k: int) -> List[Document]:
+        """Top-k documents by BM25 score; documents sharing no term with the query are not returned."""
+        if not self._live or k <= 0:
+            return []
+        term_ids = {self._vocab[term] for term in tokenize(query) if term in self._vocab}
+        if not term_ids:
+            return []
+        lengths = np.frombuffer(self._lengths, dtype=np.uintc)
+        avg_length = self._total_length / self._live or 1.0
+        scores = np.zeros(len(self._docs), dtype=np.float32)
+        for term_id in term_ids:
+            df = self._df[term_id]
+            if df == 0:
+                continue
+            ids = np.frombuffer(self._postings_ids[term_id], dtype=np.uintc)
+            tf = np.frombuffer(self._postings_tfs[term_id], dtype=np.ushort).astype(np.float32)
+            idf = math.log(1.0 + (self._live - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[ids] / avg_length)
+            # Slots are unique within a posting list, so fancy-index accumulation is safe.
+            scores[ids] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+        scores *= np.frombuffer(self._alive, dtype=np.uint8)
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [self._docs[slot] for slot in ranked]
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size: postings, per-document arrays and the stored text."""
+        postings = sum(
+            ids.itemsize * len(ids) + tfs.itemsize * len(tfs)
+            for ids, tfs in zip(self._postings_ids, self._postings_tfs)
+        )
+        per_doc = self._lengths.itemsize * len(self._lengths) + len(self._alive)
+        return postings + per_doc + self._df.itemsize * len(self._df) + self._text_bytes
+
+
+class IncrementalBM25Retriever(BaseRetriever):
+    """Lexical retriever over a session's IncrementalBM25Index, for the EnsembleRetriever slot."""
+
+    index: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.index.search(query, self.k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # Scoring takes well under a millisecond, less than a hop to the thread pool would.
+        return self.index.search(query, self.k)
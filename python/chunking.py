@@ -0,0 +1,241 @@
+import re
+import hashlib
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    logger.warning("tiktoken not found. Chunk sizes will be estimated from character counts.")
+
+# Tokenizer of the OpenAI embedding models (text-embedding-3-*).
+DEFAULT_ENCODING = "cl100k_base"
+# Rough characters per token, used without tiktoken and to size hard splits of run-on text.
+CHARS_PER_TOKEN = 4
+
+_PARAGRAPH = re.compile(r"\S.*?(?=\n[ \t]*\n|\Z)", re.S)
+_LINE = re.compile(r"[^\n]+")
+_SENTENCE = re.compile(r"\S.*?(?:[.!?][\"')\]]*(?=\s)|\Z)", re.S)
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# "2.3 Title" / "2.3. Title" / "4 Title"; "1. Mix the flour" is a list item, not a heading.
+_NUMBERED_HEADING = re.compile(r"^(\d+(?:\.\d+)+)\.?\s+\S|^(\d+)\s+[A-Z]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class _Unit:
+    """A contiguous span of the source text: a heading, a paragraph or a piece of one."""
+    start: int
+    end: int
+    tokens: int
+    heading_level: int = 0  # 0 for body text
+
+
+@lru_cache(maxsize=None)
+def _load_encoding(name: str):
+    """The tokenizer, or None; tiktoken downloads its tables on first use, which can fail offline."""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer {name}; estimating chunk sizes from characters: {e}")
+        return None
+
+
+def chunk_hash(text: str) -> str:
+    """Hash of the whitespace- and case-normalized text, used to drop exact duplicates."""
+    normalized = _WHITESPACE.sub(" ", text).strip().lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _heading_level(line: str) -> int:
+    """Heading level of a line (markdown, numbered or short title-like lines), 0 if it is body text."""
+    line = line.strip()
+    markdown = _MARKDOWN_HEADING.match(line)
+    if markdown:
+        return len(markdown.group(1))
+    if not line or len(line) > 80 or line[-1] in ".,;:!?" or len(line.split()) > 12:
+        return 0
+    numbered = _NUMBERED_HEADING.match(line)
+    if numbered:
+        return numbered.group(1).count(".") + 1 if numbered.group(1) else 1
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 3 and all(c.isupper() for c in letters):
+        return 1
+    return 0
+
+
+def _heading_text(line: str) -> str:
+    markdown = _MARKDOWN_HEADING.match(line.strip())
+    return markdown.group(2) if markdown else line.strip()
+
+
+class DocumentChunker:
+    """
+    Splits loaded documents into token-bounded chunks before they are embedded.
+
+    Chunks follow the document structure: a heading starts a new chunk, paragraphs
+    are packed whole while they fit, and only paragraphs larger than a chunk are
+    split (at sentence boundaries, then at whitespace). Consecutive chunks of one
+    section overlap by up to `overlap_tokens` of trailing paragraphs/sentences.
+    Each chunk keeps its document's metadata plus page, character offsets into
+    the page, section heading, token count and a content hash; exact duplicates
+    (within the batch and against `seen_hashes`) are dropped.
+    """
+
+    def __init__(self, max_tokens: int = 400, overlap_tokens: int = 50, encoding_name: str = DEFAULT_ENCODING):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self._encoding = _load_encoding(encoding_name)
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return max(1, len(text) // CHARS_PER_TOKEN)
+
+    def split_documents(self, documents: Iterable[Document], seen_hashes: Optional[Set[str]] = None) -> List[Document]:
+        """Chunks `documents` in order; hashes of the returned chunks are added to `seen_hashes`."""
+        seen = seen_hashes if seen_hashes is not None else set()
+        chunks: List[Document] = []
+        # Headings carry over page boundaries within the same source.
+        sections: Dict[str, List[Tuple[int, str]]] = {}
+        dropped = 0
+        for doc in documents:
+            source = str(doc.metadata.get("source", ""))
+            path = sections.setdefault(source, [])
+            for text, start, end, section in self._split_text(doc.page_content, path):
+                digest = chunk_hash(text)
+                if digest in seen:
+                    dropped += 1
+                    continue
+                seen.add(digest)
+                metadata = dict(doc.metadata)
+                metadata.update({
+                    "chunk_index": len(chunks),
+                    "start_offset": start,
+                    "end_offset": end,
+                    "token_count": self.count_tokens(text),
+                    "chunk_hash": digest,
+                })
+                if section:
+                    metadata["section"] = section
+                chunks.append(Document(page_content=text, metadata=metadata))
+        if dropped:
+            logger.info(f"Dropped {dropped} duplicate chunk(s)")
+        return chunks
+
+    def _units(self, text: str) -> List[_Unit]:
+        units: List[_Unit] = []
+        for paragraph in _PARAGRAPH.finditer(text):
+            start = paragraph.start()
+            end = start + len(paragraph.group().rstrip())
+            # Heading lines become their own units; PDF text often has them mid-paragraph.
+            body_start = start
+            for line in _LINE.finditer(text, start, end):
+                level = _heading_level(line.group())
+                if level:
+                    units.extend(self._body_units(text, body_start, line.start()))
+                    units.append(_Unit(line.start(), line.end(), self.count_tokens(line.group()), level))
+                    body_start = line.end()
+            units.extend(self._body_units(text, body_start, end))
+        return units
+
+    def _body_units(self, text: str, start: int, end: int) -> List[_Unit]:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start >= end:
+            return []
+        tokens = self.count_tokens(text[start:end])
+        if tokens <= self.max_tokens:
+            return [_Unit(start, end, tokens)]
+        units: List[_Unit] = []
+        for sentence in _SENTENCE.finditer(text, start, end):
+            s_start, s_end = sentence.start(), sentence.start() + len(sentence.group().rstrip())
+            s_tokens = self.count_tokens(text[s_start:s_end])
+            if s_tokens <= self.max_tokens:
+                units.append(_Unit(s_start, s_end, s_tokens))
+                continue
+            # Run-on text without sentence breaks (tables, OCR output): cut at whitespace.
+            window = max(1, self.max_tokens * CHARS_PER_TOKEN * 3 // 4)
+            position = s_start
+            while position < s_end:
+                cut = min(position + window, s_end)
+                if cut < s_end:
+                    space = text.rfind(" ", position + window // 2, cut)
+                    cut = space if space > position else cut
+                units.append(_Unit(position, cut, self.count_tokens(text[position:cut])))
+                position = cut
+                while position < s_end and text[position].isspace():
+                    position += 1
+        return units
+
+    def _split_text(self, text: str, path: List[Tuple[int, str]]):
+        """Yields (chunk text, start offset, end offset, section) for one document."""
+        current: List[_Unit] = []
+        body_tokens = 0
+        prefix_tokens = 0  # cost of the section prefix of a chunk that starts with body text
+        chunk_section = ""
+
+        def section_title() -> str:
+            return " > ".join(title for _, title in path)
+
+        def prefix_cost(section: str) -> int:
+            return self.count_tokens(section) + 2 if section else 0
+
+        def has_body(units: List[_Unit]) -> bool:
+            return any(not u.heading_level for u in units)
+
+        def emit(units: List[_Unit], section: str):
+            start, end = units[0].start, units[-1].end
+            body = text[start:end]
+            # Continuation chunks repeat their heading so they still make sense on their own.
+            if section and not units[0].heading_level:
+                body = f"{section}\n\n{body}"
+            return body, start, end, section
+
+        for unit in self._units(text):
+            if unit.heading_level:
+                if has_body(current):
+                    yield emit(current, chunk_section)
+                    current, body_tokens = [], 0
+                if not current:
+                    prefix_tokens = 0
+                while path and path[-1][0] >= unit.heading_level:
+                    path.pop()
+                path.append((unit.heading_level, _heading_text(text[unit.start:unit.end])))
+                chunk_section = section_title()
+                current.append(unit)
+                body_tokens += unit.tokens
+                continue
+            if has_body(current) and prefix_tokens + body_tokens + unit.tokens > self.max_tokens:
+                yield emit(current, chunk_section)
+                overlap: List[_Unit] = []
+                overlap_tokens = 0
+                for previous in reversed(current):
+                    if previous.heading_level or overlap_tokens + previous.tokens > self.overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous.tokens
+                current, body_tokens = overlap, overlap_tokens
+                prefix_tokens = prefix_cost(chunk_section)
+                if prefix_tokens + body_tokens + unit.tokens > self.max_tokens:
+                    current, body_tokens = [], 0
+            if not current:
+                chunk_section = section_title()
+                prefix_tokens = prefix_cost(chunk_section)
+            current.append(unit)
+            body_tokens += unit.tokens
+        # Trailing headings without body text only carry over to the next page.
+        if has_body(current):
+            yield emit(current, chunk_section)
@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Uploaded knowledge-base files are stored under kb/<CONTENT_KEY_PREFIX>/<sha256>/<filename>.
+CONTENT_KEY_PREFIX = "sha256"
+_CONTENT_KEY = re.compile(rf"(?:^|/){CONTENT_KEY_PREFIX}/([0-9a-f]{{64}})/")
+# Part of every cache key: bump it whenever parsing output changes (document_parsing.py or the
+# tutors' image descriptions), so uploads parsed by an older build are parsed again.
+PARSER_VERSION = 2
+# Eviction removes a little more than the overflow so it does not run on every insert.
+_EVICTION_HEADROOM = 0.9
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def content_key(digest: str, filename: str) -> str:
+    """Storage name (below kb/) of an upload with this content hash."""
+    return f"{CONTENT_KEY_PREFIX}/{digest}/{os.path.basename(filename)}"
+
+
+def content_hash_from_key(storage_key: str) -> Optional[str]:
+    """The content hash of a content-addressed storage key, or None for older (uuid-named) keys."""
+    match = _CONTENT_KEY.search(storage_key)
+    return match.group(1) if match else None
+
+
+class ParsedContentCache:
+    """
+    Persistent cache of parsed uploads (loader output or image descriptions) keyed
+    by the sha256 of the uploaded file and PARSER_VERSION, so a file uploaded
+    again, to any session, is neither downloaded nor parsed again. Its chunks are then identical too, so
+    their embeddings come from the EmbeddingCache.
+
+    Documents are stored as JSON in SQLite (WAL) and evicted least-recently-used
+    once they exceed `max_bytes`. Blocking sqlite calls run in a worker thread.
+    """
+
+    def __init__(self, path: str = "parsed_cache.db", max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parsed_content ("
+                "content_hash TEXT PRIMARY KEY, documents TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_parsed_last_used ON parsed_content (last_used)")
+            self._stored_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM parsed_content").fetchone()[0]
+
+    @staticmethod
+    def _entry_key(digest: str) -> str:
+        # Entries of older parser versions are never hit again and age out through eviction.
+        return f"{digest}:v{PARSER_VERSION}"
+
+    def _get(self, digest: str) -> Optional[List[Document]]:
+        digest = self._entry_key(digest)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT documents FROM parsed_content WHERE content_hash = ?", (digest,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self._conn.execute("UPDATE parsed_content SET last_used = ? WHERE content_hash = ?", (time.time(), digest))
+        return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in json.loads(row[0])]
+
+    def _put(self, digest: str, documents: List[Document]) -> None:
+        payload = json.dumps(
+            [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents],
+            ensure_ascii=False, default=str
+        )
+        size = len(payload.encode("utf-8"))
+        digest = self._entry_key(digest)
+        with self._lock, self._conn:
+            previous = self._conn.execute("SELECT size FROM parsed_content WHERE content_hash = ?", (digest,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parsed_content (content_hash, documents, size, last_used) VALUES (?, ?, ?, ?)",
+                (digest, payload, size, time.time())
+            )
+            self._stored_bytes += size - (previous[0] if previous else 0)
+            self.stats["writes"] += 1
+            if self._stored_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Deletes least-recently-used entries until the cache is back under its size cap (lock held)."""
+        target = int(self.max_bytes * _EVICTION_HEADROOM)
+        deleted = 0
+        for digest, size in self._conn.execute(
+                "SELECT content_hash, size FROM parsed_content ORDER BY last_used").fetchall():
+            if self._stored_bytes <= target:
+                break
+            self._conn.execute("DELETE FROM parsed_content WHERE content_hash = ?", (digest,))
+            self._stored_bytes -= size
+            deleted += 1
+        self.stats["evicted"] += deleted
+        logger.info(f"Evicted {deleted} parsed uploads ({self._stored_bytes // (1024 * 1024)} MiB left)")
+
+    async def get(self, digest: str) -> Optional[List[Document]]:
+        """The cached documents, or None on a miss; a failing cache counts as a miss."""
+        try:
+            return await asyncio.to_thread(self._get, digest)
+        except Exception as e:
+            logger.error(f"Parsed-upload cache lookup failed: {e}")
+            return None
+
+    async def put(self, digest: str, documents: List[Document]) -> None:
+        if not documents:
+            return
+        try:
+            await asyncio.to_thread(self._put, digest, documents)
+        except Exception as e:
+            logger.error(f"Could not store parsed upload in the cache: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "stored_bytes": self._stored_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_cache: Optional[ParsedContentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_parsed_content_cache() -> Optional[ParsedContentCache]:
+    """
+    Returns the process-wide parsed-upload cache, or None when disabled
+    (PARSED_CACHE_ENABLED=false). PARSED_CACHE_PATH and PARSED_CACHE_MAX_MB configure it.
+    """
+    global _cache
+    if os.getenv("PARSED_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = os.getenv("PARSED_CACHE_PATH", "parsed_cache.db")
+                max_mb = int(os.getenv("PARSED_CACHE_MAX_MB", "512"))
+                try:
+                    _cache = ParsedContentCache(path, max_mb * 1024 * 1024)
+                except Exception as e:
+                    logger.error(f"Parsed-upload cache unavailable: {e}")
+                    return None
+                logger.info(f"Using parsed-upload cache at {path} (cap {max_mb} MiB)")
+    return _cache
+
+
+def parsed_cache_metrics() -> Optional[Dict[str, Any]]:
+    """Metrics for the health endpoint, or None while the cache has never been used."""
+    return _cache.metrics() if _cache is not None else None
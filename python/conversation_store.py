@@ -0,0 +1,305 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from model_clients import OPENAI, get_model_registry
+from query_router import SUMMARY_ROLE
+
+logger = logging.getLogger(__name__)
+
+# The SQLite backend deletes idle conversations at most this often, on append.
+PRUNE_INTERVAL_SECONDS = 300.0
+
+SUMMARY_PROMPT = """You maintain a running summary of a tutoring conversation so it can continue without the full transcript.
+
+Current summary (may be empty):
+{summary}
+
+New messages to fold into the summary:
+{messages}
+
+Write the updated summary in at most 200 words. Keep names, subjects, grade level, goals, uploaded files, questions asked,
+explanations already given and anything the user said they struggle with. Write it in the conversation's language.
+Return only the summary text."""
+
+
+@dataclass
+class ConversationState:
+    """A session's rolling summary plus the messages not yet folded into it (oldest first)."""
+    summary: str = ""
+    messages: List[Dict[str, str]] = field(default_factory=list)
+
+
+class ConversationStore(ABC):
+    """Storage backend for server-side chat history, keyed by session id."""
+
+    @abstractmethod
+    async def load(self, session_id: str) -> ConversationState:
+        """Returns the summary and the unsummarized messages of the session."""
+
+    @abstractmethod
+    async def append(self, session_id: str, role: str, content: str) -> None:
+        """Appends one message to the session."""
+
+    @abstractmethod
+    async def fold(self, session_id: str, summary: str, folded_count: int) -> None:
+        """Replaces the summary and drops the oldest `folded_count` unsummarized messages."""
+
+    @abstractmethod
+    async def clear(self, session_id: str) -> None:
+        """Deletes everything stored for the session."""
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Process-local backend. Conversations are lost on restart.
+
+    Conversations are cleared with their session, and as a backstop the store
+    keeps at most `max_sessions` of them in LRU order and drops any idle for
+    longer than `idle_ttl_seconds`.
+    """
+
+    def __init__(self, max_sessions: int = 5000, idle_ttl_seconds: float = 24 * 3600.0):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._sessions: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+
+    def _state(self, session_id: str) -> ConversationState:
+        state = self._sessions.get(session_id)
+        created = state is None
+        if created:
+            state = self._sessions[session_id] = ConversationState()
+        self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+        if created:
+            self._evict()
+        return state
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        # Oldest first: drop idle conversations, then the least recently used ones over the cap.
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and self._last_used.get(session_id, 0.0) >= cutoff:
+                break
+            self._sessions.pop(session_id)
+            self._last_used.pop(session_id, None)
+
+    async def load(self, session_id: str) -> ConversationState:
+        if session_id not in self._sessions:
+            return ConversationState()
+        state = self._state(session_id)
+        return ConversationState(summary=state.summary, messages=list(state.messages))
+
+    async def append(self, session_id: str, role: str, content: str) -> None:
+        self._state(session_id).messages.append({"role": role, "content": content})
+
+    async def fold(self, session_id: str, summary: str, folded_count: int) -> None:
+        state = self._state(session_id)
+        state.summary = summary
+        del state.messages[:folded_count]
+
+    async def clear(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    SQLite backend, so conversations survive restarts and can be shared by workers on one host.
+
+    Messages are never rewritten: folding only advances the session's `summarized_seq`.
+    Conversations are cleared with their session; as a backstop for sessions that
+    were never cleared (expired elsewhere, restarts) conversations not written to
+    for `idle_ttl_seconds` are deleted. Blocking sqlite calls run in a worker thread.
+    """
+
+    def __init__(self, path: str = "conversations.db", idle_ttl_seconds: float = 24 * 3600.0):
+        self.path = path
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL DEFAULT '', "
+                "summarized_seq INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+                "role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, seq)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at)")
+
+    def _load(self, session_id: str) -> ConversationState:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summarized_seq FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            summary, summarized_seq = row if row else ("", 0)
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, summarized_seq)
+            ).fetchall()
+        return ConversationState(summary=summary, messages=[{"role": r, "content": c} for r, c in rows])
+
+    def _append(self, session_id: str, role: str, content: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, role, content, now)
+            )
+            self._conn.execute(
+                "INSERT INTO conversations (session_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (session_id, now)
+            )
+            if now - self._last_prune >= PRUNE_INTERVAL_SECONDS:
+                self._last_prune = now
+                self._prune(now - self.idle_ttl_seconds)
+
+    def _prune(self, cutoff: float) -> None:
+        """Deletes conversations idle since before `cutoff` (lock held, inside a transaction)."""
+        self._conn.execute(
+            "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM conversations WHERE updated_at < ?)",
+            (cutoff,)
+        )
+        deleted = self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Deleted {deleted} idle conversations")
+
+    def _fold(self, session_id: str, summary: str, folded_count: int) -> None:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT summarized_seq FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            summarized_seq = row[0] if row else 0
+            if folded_count > 0:
+                last = self._conn.execute(
+                    "SELECT seq FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT 1 OFFSET ?",
+                    (session_id, summarized_seq, folded_count - 1)
+                ).fetchone()
+                if last:
+                    summarized_seq = last[0]
+            self._conn.execute(
+                "INSERT INTO conversations (session_id, summary, summarized_seq, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, "
+                "summarized_seq = excluded.summarized_seq, updated_at = excluded.updated_at",
+                (session_id, summary, summarized_seq, time.time())
+            )
+
+    def _clear(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+
+    async def load(self, session_id: str) -> ConversationState:
+        return await asyncio.to_thread(self._load, session_id)
+
+    async def append(self, session_id: str, role: str, content: str) -> None:
+        await asyncio.to_thread(self._append, session_id, role, content)
+
+    async def fold(self, session_id: str, summary: str, folded_count: int) -> None:
+        await asyncio.to_thread(self._fold, session_id, summary, folded_count)
+
+    async def clear(self, session_id: str) -> None:
+        await asyncio.to_thread(self._clear, session_id)
+
+
+class ConversationManager:
+    """
+    Server-side chat history with a rolling summary.
+
+    Turns are appended as they are streamed. After each answer a background task
+    folds the oldest messages into the summary once more than `keep_recent`
+    messages are unsummarized, so the history handed to the tutor stays small
+    without losing earlier context.
+    """
+
+    def __init__(self, store: ConversationStore, keep_recent: int = 6, summarize_batch: int = 4,
+                 summary_model: str = "gpt-4o-mini"):
+        self.store = store
+        self.keep_recent = keep_recent
+        self.summarize_batch = summarize_batch
+        self.summary_model = summary_model
+        self._summarizing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        """Returns the history for the tutor: the summary (if any) followed by the recent messages."""
+        state = await self.store.load(session_id)
+        history = [{"role": SUMMARY_ROLE, "content": state.summary}] if state.summary else []
+        return history + state.messages
+
+    async def append(self, session_id: str, role: str, content: str) -> None:
+        if content:
+            await self.store.append(session_id, role, content)
+
+    async def clear(self, session_id: str) -> None:
+        await self.store.clear(session_id)
+
+    def schedule_summary(self, session_id: str) -> None:
+        """Starts a background summary update for the session unless one is already running."""
+        if session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        task = asyncio.create_task(self._summarize(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, session_id: str) -> None:
+        try:
+            state = await self.store.load(session_id)
+            overflow = len(state.messages) - self.keep_recent
+            if overflow < self.summarize_batch:
+                return
+            to_fold = state.messages[:overflow]
+            transcript = "\n".join(
+                f"{'AI' if m['role'] in ('assistant', 'ai') else 'User'}: {m['content']}" for m in to_fold
+            )
+            llm = get_model_registry().chat(OPENAI, model=self.summary_model, temperature=0.0, max_tokens=400, streaming=False)
+            start = time.perf_counter()
+            response = await llm.ainvoke([
+                SystemMessage(content=SUMMARY_PROMPT.format(summary=state.summary or "(none)", messages=transcript)),
+                HumanMessage(content="Update the summary."),
+            ])
+            await self.store.fold(session_id, str(response.content).strip(), len(to_fold))
+            logger.info(f"Folded {len(to_fold)} messages into the summary of session {session_id} "
+                        f"in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # The messages stay unsummarized and are retried after the next answer.
+            logger.error(f"Error updating conversation summary for session {session_id}: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+
+
+def create_conversation_store() -> ConversationStore:
+    """
+    Builds the backend selected by CONVERSATION_STORE ('memory' or 'sqlite'). Both drop
+    conversations idle for CONVERSATION_IDLE_TTL_SECONDS; the memory backend also keeps
+    at most CONVERSATION_MAX_SESSIONS.
+    """
+    backend = os.getenv("CONVERSATION_STORE", "memory").lower()
+    idle_ttl_seconds = float(os.getenv("CONVERSATION_IDLE_TTL_SECONDS", str(24 * 3600)))
+    if backend == "sqlite":
+        path = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+        logger.info(f"Using SQLite conversation store at {path}")
+        return SQLiteConversationStore(path, idle_ttl_seconds)
+    return InMemoryConversationStore(
+        max_sessions=int(os.getenv("CONVERSATION_MAX_SESSIONS", "5000")),
+        idle_ttl_seconds=idle_ttl_seconds
+    )
@@ -0,0 +1,287 @@
+import os
+import io
+import json
+import asyncio
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.json', '.html', '.htm', '.xhtml', '.txt', '.md')
+
+# Parsed pages cross the process boundary as (text, metadata) pairs.
+ParsedPage = Tuple[str, Dict[str, Any]]
+FileData = Union[bytes, bytearray, memoryview, io.BytesIO]
+# Imported once in the forkserver, so pool workers start with them loaded; missing ones are skipped.
+_POOL_PRELOAD = ["document_parsing", "pdfplumber", "docx2txt", "bs4"]
+
+
+class SharedBytes(NamedTuple):
+    """A file placed in shared memory; workers attach by name instead of receiving the bytes."""
+    name: str
+    size: int
+
+
+PdfData = Union[bytes, SharedBytes]
+
+
+class ParseTimeout(Exception):
+    """Parsing a file took longer than the per-file timeout."""
+
+    def __init__(self, filename: str, timeout: float):
+        super().__init__(f"Parsing {filename} timed out after {timeout:.0f}s")
+        self.filename = filename
+        self.timeout = timeout
+
+
+# ---------------------------------------------------------------------------
+# Worker functions (run in the parse pool; parsers are imported there, not here).
+# Every supported format is parsed from memory, so ingestion writes no temp files;
+# output matches the langchain loaders the tutors used before (PDFPlumberLoader,
+# Docx2txtLoader, BSHTMLLoader, TextLoader, JSONLoader with jq_schema '.[*]').
+# Changing their output? Bump content_cache.PARSER_VERSION.
+# ---------------------------------------------------------------------------
+
+def _load(data: PdfData) -> bytes:
+    if not isinstance(data, SharedBytes):
+        return data
+    shm = shared_memory.SharedMemory(data.name)
+    view = shm.buf[:data.size]
+    try:
+        return bytes(view)
+    finally:
+        view.release()
+        shm.close()
+
+
+def _pdf_page_count(data: PdfData) -> int:
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(_load(data))) as pdf:
+        return len(pdf.pages)
+
+
+def _parse_pdf_pages(data: PdfData, filename: str, start: int, end: int, total_pages: int) -> List[ParsedPage]:
+    """Pages [start, end) of a PDF."""
+    import pdfplumber
+    pages: List[ParsedPage] = []
+    with pdfplumber.open(io.BytesIO(_load(data)), pages=list(range(start + 1, end + 1))) as pdf:
+        info = {k: v for k, v in (pdf.metadata or {}).items() if type(v) in (str, int)}
+        for page in pdf.pages:
+            metadata = dict(info)
+            metadata.update({"source": filename, "file_path": filename, "page": page.page_number - 1, "total_pages": total_pages})
+            pages.append((page.extract_text() or "", metadata))
+    return pages
+
+
+def _decode_text(data: bytes) -> str:
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    try:
+        import chardet
+        for guess in chardet.detect_all(data):
+            try:
+                return data.decode(guess["encoding"] or "utf-8")
+            except (UnicodeDecodeError, LookupError):
+                continue
+    except ImportError:
+        pass
+    return data.decode("latin-1")
+
+
+def _json_text(item: Any) -> str:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, (dict, list)):
+        return json.dumps(item) if item else ""
+    return str(item) if item is not None else ""
+
+
+def _parse_in_memory(data: bytes, filename: str, extension: str) -> List[ParsedPage]:
+    if extension == '.docx':
+        import docx2txt
+        return [(docx2txt.process(io.BytesIO(data)), {"source": filename})]
+    if extension in ('.html', '.htm', '.xhtml'):
+        from bs4 import BeautifulSoup
+        try:
+            soup = BeautifulSoup(data, "lxml")
+        except Exception:  # bs4.FeatureNotFound when lxml is not installed
+            soup = BeautifulSoup(data, "html.parser")
+        title = str(soup.title.string) if soup.title else ""
+        return [(soup.get_text(""), {"source": filename, "title": title})]
+    if extension in ('.txt', '.md'):
+        return [(_decode_text(data), {"source": filename})]
+    if extension == '.json':
+        parsed = json.loads(_decode_text(data))
+        items = parsed if isinstance(parsed, list) else list(parsed.values()) if isinstance(parsed, dict) else None
+        if items is None:
+            raise ValueError(f"{filename}: expected a JSON array or object at the top level")
+        return [(_json_text(item), {"source": filename, "seq_num": i}) for i, item in enumerate(items, 1)]
+    return []
+
+
+def _as_bytes(data: FileData) -> bytes:
+    # memoryview and BytesIO cannot be sent to a worker process as they are.
+    if isinstance(data, io.BytesIO):
+        return data.getvalue()
+    return bytes(data)
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+    """
+    Forking a process that runs an event loop and client threads is unsafe, so
+    workers fork from a forkserver that only has the parsers imported (spawn
+    where forkserver is unavailable). Either way workers re-import the script
+    the process was started with, so the API runs through `python -m uvicorn`.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(_POOL_PRELOAD)
+    return context
+
+
+class DocumentParser:
+    """
+    Parses uploaded files off the event loop, in a dedicated process pool,
+    straight from their bytes (no temp files).
+
+    Parser work (pdfplumber, docx2txt, BeautifulSoup) is pure-Python and holds
+    the GIL, so in a thread it still stalls every SSE stream of the process.
+    PDFs longer than `pages_per_task` are split into page ranges parsed in
+    parallel and merged back in page order; the PDF is placed in shared memory
+    once rather than pickled to every range. Each file has `timeout` seconds;
+    on timeout its queued ranges are cancelled (a range already running
+    finishes in the background, its result discarded). With `pool_size` 0
+    parsing falls back to a worker thread.
+    """
+
+    def __init__(self, pool_size: int = 2, pages_per_task: int = 25, timeout: float = 180.0):
+        self.pool_size = max(0, pool_size)
+        self.pages_per_task = max(1, pages_per_task)
+        self.timeout = timeout
+        self._pool: Optional[Executor] = None
+        self._pool_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"files": 0, "pages": 0, "page_tasks": 0, "timeouts": 0, "failures": 0}
+
+    @classmethod
+    def from_env(cls) -> "DocumentParser":
+        return cls(
+            pool_size=int(os.getenv("PARSE_POOL_SIZE", str(min(4, max(1, (os.cpu_count() or 2) - 1))))),
+            pages_per_task=int(os.getenv("PDF_PAGES_PER_TASK", "25")),
+            timeout=float(os.getenv("PARSE_TIMEOUT_SECONDS", "180")),
+        )
+
+    def _executor(self) -> Optional[Executor]:
+        if self.pool_size == 0:
+            return None
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(self.pool_size, mp_context=_pool_context())
+                    logger.info(f"Started document parse pool with {self.pool_size} processes")
+        return self._pool
+
+    async def _run(self, func, *args):
+        executor = self._executor()
+        if executor is None:
+            return await asyncio.to_thread(func, *args)
+        try:
+            return await asyncio.wrap_future(executor.submit(func, *args))
+        except BrokenProcessPool:
+            # A crashed worker (e.g. out of memory) breaks the whole pool; the next file gets a new one.
+            with self._pool_lock:
+                if self._pool is executor:
+                    self._pool = None
+            raise
+
+    async def _parse_pdf(self, data: bytes, filename: str) -> List[ParsedPage]:
+        if self._executor() is None:
+            return await self._parse_pdf_ranges(data, filename)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        try:
+            shm.buf[:len(data)] = data
+            return await self._parse_pdf_ranges(SharedBytes(shm.name, len(data)), filename)
+        finally:
+            # A range still running after a timeout keeps its own mapping; unlinking only drops the name.
+            shm.close()
+            shm.unlink()
+
+    async def _parse_pdf_ranges(self, data: PdfData, filename: str) -> List[ParsedPage]:
+        total = await self._run(_pdf_page_count, data)
+        ranges = [(start, min(start + self.pages_per_task, total)) for start in range(0, total, self.pages_per_task)]
+        if len(ranges) <= 1 or self.pool_size <= 1:
+            self.stats["page_tasks"] += 1
+            return await self._run(_parse_pdf_pages, data, filename, 0, total, total)
+        self.stats["page_tasks"] += len(ranges)
+        tasks = [asyncio.ensure_future(self._run(_parse_pdf_pages, data, filename, start, end, total))
+                 for start, end in ranges]
+        try:
+            parts = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return [page for part in parts for page in part]
+
+    async def parse_bytes(self, data: FileData, filename: str) -> List[Document]:
+        """Parses an uploaded file by its extension; returns [] for unsupported types. Raises ParseTimeout."""
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            return []
+        data = _as_bytes(data)
+        try:
+            if extension == '.pdf':
+                pages = await asyncio.wait_for(self._parse_pdf(data, filename), self.timeout)
+            else:
+                pages = await asyncio.wait_for(self._run(_parse_in_memory, data, filename, extension), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise ParseTimeout(filename, self.timeout)
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        self.stats["files"] += 1
+        self.stats["pages"] += len(pages)
+        return [Document(page_content=text, metadata=metadata) for text, metadata in pages]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "pool_size": self.pool_size, "pages_per_task": self.pages_per_task, "timeout": self.timeout}
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_parser: Optional[DocumentParser] = None
+_parser_lock = threading.Lock()
+
+
+def get_document_parser() -> DocumentParser:
+    """
+    Returns the process-wide parser; PARSE_POOL_SIZE (0 = worker thread),
+    PDF_PAGES_PER_TASK and PARSE_TIMEOUT_SECONDS configure it.
+    """
+    global _parser
+    if _parser is None:
+        with _parser_lock:
+            if _parser is None:
+                _parser = DocumentParser.from_env()
+    return _parser
+
+
+def document_parser_metrics() -> Optional[Dict[str, Any]]:
+    """Metrics for the health endpoint, or None while nothing has been parsed."""
+    return _parser.metrics() if _parser is not None else None
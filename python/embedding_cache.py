@@ -0,0 +1,214 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps host parameters per statement; lookups are split into batches of this size.
+_LOOKUP_BATCH = 500
+# Eviction removes a little more than the overflow so it does not run on every insert.
+_EVICTION_HEADROOM = 0.9
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of document embeddings keyed by (model, dimensions, sha256 of the text).
+
+    Vectors are stored as float32 blobs in SQLite (WAL), so every worker on a host
+    shares one cache and identical chunks uploaded to different sessions are embedded
+    once. Entries are evicted least-recently-used once the stored vectors exceed
+    `max_bytes`. Blocking sqlite calls run in a worker thread.
+    """
+
+    def __init__(self, path: str = "embedding_cache.db", max_bytes: int = 1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, dimensions INTEGER NOT NULL, text_hash TEXT NOT NULL, "
+                "vector BLOB NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (model, dimensions, text_hash)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+            self._stored_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()[0]
+
+    def _get_many(self, model: str, dimensions: int, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock, self._conn:
+            for i in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[i:i + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND dimensions = ? "
+                    f"AND text_hash IN ({placeholders})", (model, dimensions, *batch)
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32).tolist()
+                self.stats["hits"] += len(rows)
+                self.stats["misses"] += len(batch) - len(rows)
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND dimensions = ? "
+                        f"AND text_hash IN ({','.join('?' * len(rows))})",
+                        (time.time(), model, dimensions, *(digest for digest, _ in rows))
+                    )
+        return found
+
+    def _put_many(self, model: str, dimensions: int, entries: Dict[str, List[float]]) -> None:
+        now = time.time()
+        rows = [(model, dimensions, digest, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for digest, vector in entries.items()]
+        digests = list(entries)
+        with self._lock, self._conn:
+            # Rows being replaced (a concurrent worker may have embedded the same chunk) are already counted.
+            replaced = 0
+            for i in range(0, len(digests), _LOOKUP_BATCH):
+                batch = digests[i:i + _LOOKUP_BATCH]
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ? AND dimensions = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})", (model, dimensions, *batch)
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, dimensions, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._stored_bytes += sum(len(row[3]) for row in rows) - replaced
+            self.stats["writes"] += len(rows)
+            if self._stored_bytes > self.max_bytes:
+                self._evict(sum(len(row[3]) for row in rows) // len(rows))
+
+    def _evict(self, entry_bytes: int) -> None:
+        """Deletes least-recently-used entries until the cache is back under its size cap (lock held)."""
+        target = int(self.max_bytes * _EVICTION_HEADROOM)
+        count = max(1, (self._stored_bytes - target) // max(entry_bytes, 1))
+        deleted = self._conn.execute(
+            "DELETE FROM embeddings WHERE (model, dimensions, text_hash) IN "
+            "(SELECT model, dimensions, text_hash FROM embeddings ORDER BY last_used LIMIT ?)", (count,)
+        ).rowcount
+        self.stats["evicted"] += deleted
+        self._stored_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        logger.info(f"Evicted {deleted} cached embeddings ({self._stored_bytes // (1024 * 1024)} MiB left)")
+
+    async def get_many(self, model: str, dimensions: int, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        return await asyncio.to_thread(self._get_many, model, dimensions, hashes)
+
+    async def put_many(self, model: str, dimensions: int, entries: Dict[str, List[float]]) -> None:
+        if entries:
+            await asyncio.to_thread(self._put_many, model, dimensions, entries)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "stored_bytes": self._stored_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings client so document embeddings are served from the
+    EmbeddingCache and only cache misses reach the embedding API. Queries are
+    passed straight through (they rarely repeat and are latency-critical).
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str, dimensions: Optional[int] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+        # 0 stands for the model's native size when no reduced dimension is requested.
+        self.dimensions = dimensions or 0
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        try:
+            vectors = await self.cache.get_many(self.model, self.dimensions, hashes)
+        except Exception as e:
+            logger.error(f"Embedding cache lookup failed, embedding everything: {e}")
+            vectors = {}
+        missing = {digest: text for digest, text in zip(hashes, texts) if digest not in vectors}
+        if missing:
+            embedded = await self.embeddings.aembed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), embedded))
+            vectors.update(new_vectors)
+            try:
+                await self.cache.put_many(self.model, self.dimensions, new_vectors)
+            except Exception as e:
+                logger.error(f"Could not store embeddings in the cache: {e}")
+        return [vectors[digest] for digest in hashes]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache._get_many(self.model, self.dimensions, hashes)
+        missing = {digest: text for digest, text in zip(hashes, texts) if digest not in vectors}
+        if missing:
+            new_vectors = dict(zip(missing.keys(), self.embeddings.embed_documents(list(missing.values()))))
+            vectors.update(new_vectors)
+            self.cache._put_many(self.model, self.dimensions, new_vectors)
+        return [vectors[digest] for digest in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Returns the process-wide embedding cache, or None when disabled
+    (EMBEDDING_CACHE_ENABLED=false). EMBEDDING_CACHE_PATH and EMBEDDING_CACHE_MAX_MB configure it.
+    """
+    global _cache
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+                max_mb = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+                _cache = EmbeddingCache(path, max_mb * 1024 * 1024)
+                logger.info(f"Using embedding cache at {path} (cap {max_mb} MiB)")
+    return _cache
+
+
+def cached_embeddings(embeddings: Embeddings, model: str) -> Embeddings:
+    """The embeddings client wrapped with the shared cache, or unchanged if the cache is disabled or unavailable."""
+    try:
+        cache = get_embedding_cache()
+    except Exception as e:
+        logger.error(f"Embedding cache unavailable: {e}")
+        return embeddings
+    if cache is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, cache, model, getattr(embeddings, "dimensions", None))
+
+
+def embedding_cache_metrics() -> Optional[Dict[str, Any]]:
+    """Metrics for the health endpoint, or None while the cache has never been used."""
+    return _cache.metrics() if _cache is not None else None
@@ -0,0 +1,238 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from loop_local import LoopLocal
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for documents that did not come out of the chunker.
+CHARS_PER_TOKEN = 4
+# OpenAI accepts at most this many inputs per embeddings request.
+MAX_INPUTS_PER_REQUEST = 2048
+
+
+class EmbeddingBatchError(Exception):
+    """A batch still failed after all retries; `stored` documents had already been upserted."""
+
+    def __init__(self, stored: List[Document], total: int, cause: BaseException):
+        super().__init__(f"Embedding failed after storing {len(stored)}/{total} documents: {cause}")
+        self.stored = stored
+        self.total = total
+        self.cause = cause
+
+
+@dataclass
+class EmbeddingProgress:
+    """Snapshot handed to the progress callback after every stored batch (`batch` is that batch)."""
+    documents_done: int
+    documents_total: int
+    batches_done: int
+    batches_total: int
+    retries: int
+    batch: List[Document] = field(default_factory=list, repr=False)
+
+    @property
+    def fraction(self) -> float:
+        return self.documents_done / self.documents_total if self.documents_total else 1.0
+
+
+ProgressCallback = Callable[[EmbeddingProgress], Any]
+
+
+def _token_estimate(doc: Document) -> int:
+    # Chunks carry their exact size from DocumentChunker.
+    tokens = doc.metadata.get("token_count")
+    return int(tokens) if tokens else max(1, len(doc.page_content) // CHARS_PER_TOKEN)
+
+
+def _retry_delay(exc: BaseException) -> Optional[float]:
+    """
+    The delay the provider asked for (Retry-After) or 0.0 for other transient
+    errors; None when the error is not worth retrying (bad input, auth).
+    """
+    status = getattr(exc, "status_code", None)
+    name = type(exc).__name__
+    if status == 429 or name == "RateLimitError":
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return float(headers.get("retry-after", 0))
+        except (TypeError, ValueError):
+            return 0.0
+    if (isinstance(status, int) and status >= 500) or name in ("APIConnectionError", "APITimeoutError"):
+        return 0.0
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return 0.0
+    return None
+
+
+class EmbeddingScheduler:
+    """
+    Embeds and stores large document lists in token-sized batches.
+
+    Batches are filled up to `batch_tokens` (and MAX_INPUTS_PER_REQUEST inputs),
+    and at most `concurrency` of them are in flight per event loop (one loop per
+    server worker), so concurrent uploads share the provider's rate limit
+    instead of each firing its own burst. A rate-limited batch backs off exponentially with full jitter
+    (or for the provider's Retry-After) and pauses every other batch for that
+    time too. Each batch is upserted as soon as it is embedded, so a failure
+    late in a 500-page upload keeps what was already stored.
+    """
+
+    def __init__(self, batch_tokens: int = 20000, concurrency: int = 4, max_retries: int = 6,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        self.batch_tokens = batch_tokens
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # asyncio.Semaphore binds to the loop that first waits on it; keep one per loop.
+        self._semaphores: LoopLocal[asyncio.Semaphore] = LoopLocal(lambda: asyncio.Semaphore(self.concurrency))
+        self._paused_until = 0.0
+        self.stats: Dict[str, int] = {"batches": 0, "documents": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingScheduler":
+        return cls(
+            batch_tokens=int(os.getenv("EMBEDDING_BATCH_TOKENS", "20000")),
+            concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "4")),
+            max_retries=int(os.getenv("EMBEDDING_MAX_RETRIES", "6")),
+        )
+
+    def batches(self, documents: List[Document]) -> List[List[Document]]:
+        """Splits documents, in order, into batches of at most `batch_tokens` tokens."""
+        batches: List[List[Document]] = []
+        current: List[Document] = []
+        tokens = 0
+        for doc in documents:
+            size = _token_estimate(doc)
+            if current and (tokens + size > self.batch_tokens or len(current) >= MAX_INPUTS_PER_REQUEST):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(doc)
+            tokens += size
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_with_backoff(self, embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+                                  texts: List[str]) -> tuple:
+        attempt = 0
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            try:
+                return await embed(texts), attempt
+            except Exception as e:
+                delay = _retry_delay(e)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                delay = max(delay, backoff)
+                if getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError":
+                    self.stats["rate_limited"] += 1
+                    # Everyone shares the rate limit, so every batch waits, not just this one.
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Embedding batch of {len(texts)} failed ({type(e).__name__}); "
+                               f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def run(self, documents: List[Document],
+                  embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+                  upsert: Callable[[List[Document], List[List[float]]], Awaitable[Any]],
+                  progress: Optional[ProgressCallback] = None) -> int:
+        """
+        Embeds `documents` with `embed` and stores every batch with `upsert` as it completes.
+        Returns the number of documents stored; raises EmbeddingBatchError if a batch gives up.
+        """
+        semaphore = self._semaphores.get()
+        batches = self.batches(documents)
+        state = {"documents": 0, "batches": 0, "retries": 0}
+        stored: List[Document] = []
+        # Upserts still running, with their batch and retry count; removed once recorded as stored.
+        upserts: Dict[asyncio.Future, tuple] = {}
+
+        async def _one(batch: List[Document]) -> None:
+            async with semaphore:
+                vectors, retries = await self._embed_with_backoff(embed, [doc.page_content for doc in batch])
+                # Shielded: when another batch fails this one is cancelled, but an upsert already
+                # running in a thread still lands in the vector store and must be recorded.
+                upserting = asyncio.ensure_future(upsert(batch, vectors))
+                upserts[upserting] = (batch, retries)
+                await asyncio.shield(upserting)
+                del upserts[upserting]
+            await _stored(batch, retries)
+
+        async def _stored(batch: List[Document], retries: int) -> None:
+            stored.extend(batch)
+            state["documents"] += len(batch)
+            state["batches"] += 1
+            state["retries"] += retries
+            self.stats["batches"] += 1
+            self.stats["documents"] += len(batch)
+            if progress is not None:
+                try:
+                    result = progress(EmbeddingProgress(state["documents"], len(documents),
+                                                        state["batches"], len(batches), state["retries"], batch))
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"Embedding progress callback failed: {e}")
+
+        tasks = [asyncio.create_task(_one(batch)) for batch in batches]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*upserts, return_exceptions=True)
+            for upserting, (batch, retries) in upserts.items():
+                if not upserting.cancelled() and upserting.exception() is None:
+                    await _stored(batch, retries)
+            self.stats["failed"] += 1
+            raise EmbeddingBatchError(stored, len(documents), e) from e
+        logger.info(f"Embedded and stored {len(documents)} documents in {len(batches)} batches "
+                    f"({state['retries']} retries)")
+        return state["documents"]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "batch_tokens": self.batch_tokens,
+            "concurrency": self.concurrency,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 1),
+        }
+
+
+_scheduler: Optional[EmbeddingScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_embedding_scheduler() -> EmbeddingScheduler:
+    """
+    Returns the process-wide scheduler, so the concurrency cap holds across uploads
+    (EMBEDDING_BATCH_TOKENS, EMBEDDING_CONCURRENCY and EMBEDDING_MAX_RETRIES configure it).
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = EmbeddingScheduler.from_env()
+    return _scheduler
+
+
+def embedding_scheduler_metrics() -> Optional[Dict[str, Any]]:
+    """Metrics for the health endpoint, or None while nothing has been embedded."""
+    return _scheduler.metrics() if _scheduler is not None else None
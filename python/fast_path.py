@@ -0,0 +1,84 @@
+import re
+import random
+from typing import Any, Dict, List, Optional
+
+# Yielded by run_agent_async before a fast-path answer so the API can emit a
+# {"type": "fast_path"} SSE event (same convention as __IMAGE_RESPONSE__).
+FAST_PATH_MARKER = "__FAST_PATH__"
+
+FILLER_KINDS = {
+    "greeting": ["hello", "hi", "hey", "greetings", "yo", "sup", "good morning", "good afternoon", "good evening",
+                 "hi there", "hello there", "hey there"],
+    "thanks": ["thanks", "thank you", "thx", "ty", "thanks a lot", "thank you so much", "ok thanks", "okay thanks"],
+    "acknowledgement": ["ok", "okay", "great", "good", "cool", "nice", "got it", "alright", "sure", "awesome", "perfect"],
+    "farewell": ["bye", "goodbye", "see you", "see you later", "good night"],
+}
+
+# "sure"/"ok" after "Want me to show an example?" is an answer, not a filler.
+_AFFIRMATIVE_KINDS = ("acknowledgement",)
+_TRAILING_QUESTION_PATTERN = re.compile(r"[?؟][^\w?؟]*$", re.UNICODE)
+_OFFER_PATTERN = re.compile(
+    r"\b(would you like|do you want|want me to|shall i|should i|shall we|should we|ready to|let me know if)\b",
+    re.IGNORECASE,
+)
+# How much of the end of the last assistant turn is searched for an offer.
+_OFFER_TAIL_CHARS = 200
+
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s']+", re.UNICODE)
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+_TEMPLATES = {
+    "student": {
+        "greeting": ["Hi{name}! 👋 What would you like to learn or work on today?",
+                     "Hello{name}! I'm ready to help. Which subject or assignment should we start with?"],
+        "thanks": ["You're welcome{name}! 😊 Do you have another question, or should we try a practice problem?",
+                   "Happy to help{name}! Keep going — what would you like to explore next?"],
+        "acknowledgement": ["Great! Let me know what you'd like to do next — ask a question or try a practice problem.",
+                            "Awesome! What should we tackle next?"],
+        "farewell": ["Bye{name}! Great work today — come back anytime you need help. 🌟"],
+    },
+    "teacher": {
+        "greeting": ["Hello{name}. How can I help with your class today?",
+                     "Hi{name}. I'm ready to help with student analysis, lesson materials or teaching strategies."],
+        "thanks": ["You're welcome{name}. Is there anything else I can help you with?"],
+        "acknowledgement": ["Understood. What would you like to look at next?"],
+        "farewell": ["Goodbye{name}. Have a great day in the classroom."],
+    },
+}
+
+
+def normalize_short_message(text: str) -> str:
+    """Lower-cases the message and strips punctuation/emoji so 'Thanks!!' matches 'thanks'."""
+    cleaned = _PUNCTUATION_PATTERN.sub(" ", text.lower())
+    return _WHITESPACE_PATTERN.sub(" ", cleaned).strip()
+
+
+def filler_kind(text: str) -> Optional[str]:
+    """Returns the filler category of a message ('greeting', 'thanks', ...) or None."""
+    normalized = normalize_short_message(text)
+    for kind, phrases in FILLER_KINDS.items():
+        if normalized in phrases:
+            return kind
+    return None
+
+
+def answers_open_question(text: str, history: Optional[List[Dict[str, Any]]]) -> bool:
+    """
+    True when an acknowledgement-style message ("sure", "ok", "got it") replies to a
+    question or offer at the end of the last assistant turn, so it must take the full path.
+    """
+    if filler_kind(text) not in _AFFIRMATIVE_KINDS:
+        return False
+    for message in reversed(history or []):
+        if message.get("role") in ("assistant", "ai"):
+            tail = str(message.get("content") or "").strip()[-_OFFER_TAIL_CHARS:]
+            return bool(_TRAILING_QUESTION_PATTERN.search(tail) or _OFFER_PATTERN.search(tail))
+    return False
+
+
+def templated_reply(kind: str, audience: str = "student", name: Optional[str] = None) -> str:
+    """Builds a persona-aware canned reply for a conversational filler."""
+    templates = _TEMPLATES.get(audience, _TEMPLATES["student"])
+    options = templates.get(kind) or templates["acknowledgement"]
+    first_name = name.split()[0] if name and name.strip() else ""
+    return random.choice(options).format(name=f" {first_name}" if first_name else "")
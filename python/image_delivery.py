@@ -0,0 +1,73 @@
+import os
+import json
+import uuid
+import base64
+import asyncio
+import logging
+from io import BytesIO
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Yielded by run_agent_async, followed by a JSON payload, while an image is being generated,
+# so the API can emit {"type": "image_progress", ...} SSE events (same convention as __IMAGE_RESPONSE__).
+IMAGE_PROGRESS_MARKER = "__IMAGE_PROGRESS__"
+
+PROMPT_READY = "prompt_ready"
+RENDERING = "rendering"
+UPLOADED = "uploaded"
+
+GENERATED_IMAGE_URL_TTL = int(os.getenv("GENERATED_IMAGE_URL_TTL_SECONDS", "3600"))
+GENERATED_IMAGE_RETENTION_HOURS = int(os.getenv("GENERATED_IMAGE_RETENTION_HOURS", "24"))
+THUMBNAIL_SIZE = int(os.getenv("GENERATED_IMAGE_THUMBNAIL_SIZE", "256"))
+
+
+def progress_chunk(payload: Dict[str, Any]) -> str:
+    """Encodes an image progress update as a tutor stream chunk."""
+    return IMAGE_PROGRESS_MARKER + json.dumps(payload, ensure_ascii=False)
+
+
+def parse_progress_chunk(chunk: str) -> Optional[Dict[str, Any]]:
+    """Returns the progress payload if `chunk` is an image progress chunk, else None."""
+    if not chunk.startswith(IMAGE_PROGRESS_MARKER):
+        return None
+    return json.loads(chunk[len(IMAGE_PROGRESS_MARKER):])
+
+
+def make_thumbnail(image_bytes: bytes, max_size: int = THUMBNAIL_SIZE) -> str:
+    """Small JPEG preview of the image as a data URI (a few KB instead of the full PNG)."""
+    with Image.open(BytesIO(image_bytes)) as image:
+        image = image.convert("RGB")
+        image.thumbnail((max_size, max_size))
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=70, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+async def publish_generated_image(storage_manager: Any, image_base64: str) -> Optional[Dict[str, Any]]:
+    """
+    Uploads a generated image and returns {"url", "thumbnail", "key", "expires_in"},
+    or None if it could not be stored, in which case callers fall back to inline data.
+    """
+    if storage_manager is None:
+        return None
+    try:
+        image_bytes = base64.b64decode(image_base64)
+        thumbnail_task = asyncio.create_task(asyncio.to_thread(make_thumbnail, image_bytes))
+        success, key = await storage_manager.upload_generated_image_async(
+            image_bytes, f"{uuid.uuid4().hex}.png", "image/png", GENERATED_IMAGE_RETENTION_HOURS
+        )
+        thumbnail = await thumbnail_task
+        if not success:
+            logger.error(f"Could not store generated image: {key}")
+            return None
+        url = await storage_manager.get_file_url_async(key, GENERATED_IMAGE_URL_TTL)
+        if not url:
+            return None
+        logger.info(f"Stored generated image ({len(image_bytes) // 1024} KiB) as {key}")
+        return {"url": url, "thumbnail": thumbnail, "key": key, "expires_in": GENERATED_IMAGE_URL_TTL}
+    except Exception as e:
+        logger.error(f"Error publishing generated image: {e}")
+        return None
@@ -0,0 +1,114 @@
+import os
+import re
+import json
+import math
+import zlib
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+USE_LLM_WITH_TOOLS = "use_llm_with_tools"
+GENERATE_IMAGE = "generate_image"
+
+DEFAULT_ARTIFACT_PATH = os.path.join(os.path.dirname(__file__), "artifacts", "intent_router_v1.json")
+
+# Any of these cues means the query may be a visual request. Such queries are never
+# short-circuited: the LLM router still has to extract the image parameters.
+VISUAL_CUE_PATTERN = re.compile(
+    r"\b(draw\w*|diagram\w*|chart\w*|graph\w*|image\w*|picture\w*|pic|photo\w*|illustrat\w*|visuali[sz]\w*|visual\w*|"
+    r"sketch\w*|infographic\w*|poster\w*|flowchart\w*|map\w*|timeline\w*|plot\w*|render\w*|"
+    r"look\w* like|show me)\b"
+    r"|ارسم|رسم|صورة|صور|مخطط|خريطة",
+    re.IGNORECASE,
+)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cases and splits text into word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def hashed_ngram_features(text: str, n_features: int, ngram_range=(1, 2)) -> Dict[int, float]:
+    """
+    Maps word n-grams to a sparse vector using the hashing trick.
+
+    crc32 is used instead of hash() so feature indices are stable across processes.
+    """
+    tokens = tokenize(text)
+    features: Dict[int, float] = {}
+    low, high = ngram_range
+    for n in range(low, high + 1):
+        for i in range(len(tokens) - n + 1):
+            gram = " ".join(tokens[i:i + n])
+            index = zlib.crc32(gram.encode("utf-8")) % n_features
+            features[index] = features.get(index, 0.0) + 1.0
+    if features:
+        # L2-normalise so long queries are not scored more confidently than short ones.
+        norm = math.sqrt(sum(v * v for v in features.values()))
+        features = {k: v / norm for k, v in features.items()}
+    return features
+
+
+@dataclass
+class IntentPrediction:
+    """Result of the local pre-classifier. `action` is None when the query is ambiguous."""
+    action: Optional[str]
+    image_probability: float
+    reason: str
+
+
+class IntentPreClassifier:
+    """
+    Zero-LLM pre-classifier placed in front of the tutor's LLM router.
+
+    Clear "answer" queries (no visual cue and a low image probability from the
+    hashed n-gram model) are routed to `use_llm_with_tools` locally. Everything
+    else is reported as ambiguous so the caller falls back to the LLM router.
+    """
+
+    def __init__(self, artifact: Dict):
+        self.version = artifact["version"]
+        self.n_features = int(artifact["n_features"])
+        self.ngram_range = tuple(artifact.get("ngram_range", (1, 2)))
+        self.bias = float(artifact["bias"])
+        self.weights = {int(k): float(v) for k, v in artifact["weights"].items()}
+        self.answer_threshold = float(artifact.get("answer_threshold", 0.15))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_ARTIFACT_PATH) -> "IntentPreClassifier":
+        """Loads a versioned model artifact written by intent_classifier.train."""
+        with open(path, "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+        classifier = cls(artifact)
+        logger.info(f"Loaded intent pre-classifier {classifier.version} from {path}")
+        return classifier
+
+    def image_probability(self, query: str) -> float:
+        """Probability that the query asks for an image, according to the linear model."""
+        features = hashed_ngram_features(query, self.n_features, self.ngram_range)
+        score = self.bias + sum(self.weights.get(index, 0.0) * value for index, value in features.items())
+        return 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0)))
+
+    def classify(self, query: str) -> IntentPrediction:
+        """Classifies the query, returning action=None when the LLM router should decide."""
+        probability = self.image_probability(query)
+        if VISUAL_CUE_PATTERN.search(query):
+            return IntentPrediction(action=None, image_probability=probability, reason="visual_cue")
+        if probability < self.answer_threshold:
+            return IntentPrediction(action=USE_LLM_WITH_TOOLS, image_probability=probability, reason="model")
+        return IntentPrediction(action=None, image_probability=probability, reason="low_confidence")
+
+
+@lru_cache(maxsize=None)
+def get_intent_classifier(path: Optional[str] = None) -> Optional[IntentPreClassifier]:
+    """Returns a process-wide classifier instance, or None if the artifact cannot be loaded."""
+    try:
+        return IntentPreClassifier.load(path or DEFAULT_ARTIFACT_PATH)
+    except Exception as e:
+        logger.warning(f"Intent pre-classifier unavailable, every query will use the LLM router: {e}")
+        return None
@@ -0,0 +1,150 @@
+"""
+Offline evaluation of the intent pre-classifier against labels and the LLM router.
+
+Usage (from the python/ directory):
+    python -m intent_classifier.evaluate --data intent_classifier/data/labeled_queries.jsonl
+    python -m intent_classifier.evaluate --data my_queries.jsonl --folds 0 --llm   # held-out file, also calls the GPT-4o router
+
+The labeled file is JSONL with {"query": ..., "label": "use_llm_with_tools" | "generate_image"}.
+
+By default the numbers are stratified k-fold cross-validated: every query is
+classified by a model trained (with the artifact's n_features and
+answer_threshold) on the other folds only, since the shipped artifact was fit
+and its threshold tuned on the bundled file. Use --folds 0 to score the
+artifact itself, and only on data it was not trained on.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, List, Optional
+
+from intent_classifier.classifier import (
+    IntentPreClassifier, IntentPrediction, DEFAULT_ARTIFACT_PATH, GENERATE_IMAGE, USE_LLM_WITH_TOOLS
+)
+from intent_classifier.train import build_artifact
+
+
+def _load_rows(path: str) -> List[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _stratified_folds(labels: List[str], folds: int, seed: int) -> List[List[int]]:
+    """Row indices split into `folds` groups with the label mix of the whole file."""
+    rng = random.Random(seed)
+    groups: List[List[int]] = [[] for _ in range(folds)]
+    position = 0
+    for label in sorted(set(labels)):
+        indices = [i for i, l in enumerate(labels) if l == label]
+        rng.shuffle(indices)
+        for i in indices:
+            groups[position % folds].append(i)
+            position += 1
+    return groups
+
+
+def _cross_validated_predictions(queries: List[str], labels: List[str], reference: IntentPreClassifier,
+                                 args) -> List[IntentPrediction]:
+    """Predicts every query with a model that never saw it during training."""
+    predictions: List[Optional[IntentPrediction]] = [None] * len(queries)
+    for k, held_out in enumerate(_stratified_folds(labels, args.folds, args.seed)):
+        held = set(held_out)
+        rows = [(queries[i], 1 if labels[i] == GENERATE_IMAGE else 0) for i in range(len(queries)) if i not in held]
+        model = IntentPreClassifier(build_artifact(
+            rows, f"{reference.version}-fold{k}", reference.n_features, args.epochs, args.learning_rate,
+            args.l2, reference.answer_threshold, args.seed
+        ))
+        for i in held_out:
+            predictions[i] = model.classify(queries[i])
+    return predictions
+
+
+async def _llm_router_labels(queries: List[str], concurrency: int) -> List[str]:
+    """Routes every query through the tutor's LLM router (_route_query)."""
+    from Student_chatbot.Student_AI_tutor import AsyncRAGTutor, RAGTutorConfig
+
+    tutor = AsyncRAGTutor(storage_manager=None, config=RAGTutorConfig(web_search_enabled=False, intent_preclassifier_enabled=False))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _route(query: str) -> str:
+        async with semaphore:
+            decision = await tutor._route_query(query)
+            return str(getattr(decision["action"], "value", decision["action"]))
+
+    return await asyncio.gather(*[_route(q) for q in queries])
+
+
+def _ratio(numerator: int, denominator: int) -> str:
+    return f"{numerator}/{denominator} ({(numerator / denominator * 100) if denominator else 0.0:.1f}%)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the intent pre-classifier.")
+    parser.add_argument("--data", default="intent_classifier/data/labeled_queries.jsonl")
+    parser.add_argument("--artifact", default=DEFAULT_ARTIFACT_PATH)
+    parser.add_argument("--llm", action="store_true", help="Also measure agreement with the LLM router.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--show-errors", action="store_true")
+    parser.add_argument("--folds", type=int, default=5,
+                        help="Cross-validation folds; 0 scores the artifact as-is (held-out data only).")
+    # Training settings for the cross-validation folds (train.py defaults).
+    parser.add_argument("--epochs", type=int, default=40)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    classifier = IntentPreClassifier.load(args.artifact)
+    rows = _load_rows(args.data)
+    queries = [row["query"] for row in rows]
+    labels = [row["label"] for row in rows]
+
+    start = time.perf_counter()
+    for query in queries:
+        classifier.classify(query)
+    per_query_ms = (time.perf_counter() - start) / max(len(queries), 1) * 1000
+    if args.folds > 1:
+        predictions = _cross_validated_predictions(queries, labels, classifier, args)
+        evaluated = f"{args.folds}-fold cross-validation"
+    else:
+        predictions = [classifier.classify(q) for q in queries]
+        evaluated = f"artifact {classifier.version}"
+
+    short_circuited = [i for i, p in enumerate(predictions) if p.action is not None]
+    correct_short = [i for i in short_circuited if labels[i] == predictions[i].action]
+    missed_images = [i for i in short_circuited if labels[i] != USE_LLM_WITH_TOOLS]
+
+    print(f"Evaluated: {evaluated} | queries: {len(rows)} | classify latency: {per_query_ms:.3f} ms/query")
+    print(f"Short-circuit coverage:         {_ratio(len(short_circuited), len(rows))}")
+    print(f"Short-circuit label accuracy:   {_ratio(len(correct_short), len(short_circuited))}")
+    answer_total = sum(1 for label in labels if label == USE_LLM_WITH_TOOLS)
+    answer_covered = sum(1 for i in short_circuited if labels[i] == USE_LLM_WITH_TOOLS)
+    print(f"Answer queries handled locally: {_ratio(answer_covered, answer_total)}")
+
+    llm_labels: Optional[List[str]] = None
+    if args.llm:
+        llm_start = time.perf_counter()
+        llm_labels = asyncio.run(_llm_router_labels(queries, args.concurrency))
+        llm_ms = (time.perf_counter() - llm_start) / max(len(queries), 1) * 1000 * args.concurrency
+        agree_short = sum(1 for i in short_circuited if llm_labels[i] == predictions[i].action)
+        combined = [predictions[i].action or llm_labels[i] for i in range(len(rows))]
+        agree_all = sum(1 for a, b in zip(combined, llm_labels) if a == b)
+        llm_correct = sum(1 for a, b in zip(llm_labels, labels) if a == b)
+        print(f"LLM router latency (approx):    {llm_ms:.0f} ms/query")
+        print(f"LLM router label accuracy:      {_ratio(llm_correct, len(rows))}")
+        print(f"Agreement on short-circuited:   {_ratio(agree_short, len(short_circuited))}")
+        print(f"Pipeline agreement with LLM:    {_ratio(agree_all, len(rows))}")
+
+    if args.show_errors:
+        for i in missed_images:
+            print(f"  MISROUTED (label={labels[i]}, p_image={predictions[i].image_probability:.3f}): {queries[i]}")
+        if llm_labels:
+            for i in short_circuited:
+                if llm_labels[i] != predictions[i].action:
+                    print(f"  LLM DISAGREES (llm={llm_labels[i]}): {queries[i]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Trains the hashed n-gram logistic model used by IntentPreClassifier.
+
+Usage (from the python/ directory):
+    python -m intent_classifier.train --data intent_classifier/data/labeled_queries.jsonl \
+        --output intent_classifier/artifacts/intent_router_v1.json --version v1
+"""
+import json
+import math
+import random
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from intent_classifier.classifier import GENERATE_IMAGE, hashed_ngram_features
+
+
+def load_labeled_queries(path: str) -> List[Tuple[str, int]]:
+    """Reads a JSONL file of {"query": ..., "label": ...} rows. Label 1 means generate_image."""
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            rows.append((item["query"], 1 if item["label"] == GENERATE_IMAGE else 0))
+    return rows
+
+
+def train_logistic_regression(rows: List[Tuple[str, int]], n_features: int, epochs: int, learning_rate: float,
+                              l2: float, seed: int) -> Tuple[Dict[int, float], float]:
+    """Plain SGD logistic regression over sparse hashed features."""
+    rng = random.Random(seed)
+    samples = [(hashed_ngram_features(query, n_features), label) for query, label in rows]
+    weights: Dict[int, float] = {}
+    bias = 0.0
+    for _ in range(epochs):
+        rng.shuffle(samples)
+        for features, label in samples:
+            score = bias + sum(weights.get(i, 0.0) * v for i, v in features.items())
+            prediction = 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0)))
+            error = prediction - label
+            for i, v in features.items():
+                w = weights.get(i, 0.0)
+                weights[i] = w - learning_rate * (error * v + l2 * w)
+            bias -= learning_rate * error
+    return weights, bias
+
+
+def build_artifact(rows: List[Tuple[str, int]], version: str, n_features: int, epochs: int, learning_rate: float,
+                   l2: float, answer_threshold: float, seed: int) -> Dict:
+    """Trains on `rows` and returns the artifact dict IntentPreClassifier loads."""
+    weights, bias = train_logistic_regression(rows, n_features, epochs, learning_rate, l2, seed)
+    return {
+        "version": version,
+        "trained_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "training_examples": len(rows),
+        "n_features": n_features,
+        "ngram_range": [1, 2],
+        "answer_threshold": answer_threshold,
+        "bias": round(bias, 6),
+        "weights": {str(i): round(w, 6) for i, w in sorted(weights.items()) if abs(w) > 1e-6},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the tutor intent pre-classifier.")
+    parser.add_argument("--data", default="intent_classifier/data/labeled_queries.jsonl")
+    parser.add_argument("--output", default="intent_classifier/artifacts/intent_router_v1.json")
+    parser.add_argument("--version", default="v1")
+    parser.add_argument("--n-features", type=int, default=2 ** 16)
+    parser.add_argument("--epochs", type=int, default=40)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--answer-threshold", type=float, default=0.15,
+                        help="Queries whose image probability is below this are routed locally.")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    rows = load_labeled_queries(args.data)
+    artifact = build_artifact(rows, args.version, args.n_features, args.epochs, args.learning_rate, args.l2,
+                              args.answer_threshold, args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, separators=(",", ":"))
+    print(f"Wrote {args.output} ({len(artifact['weights'])} non-zero weights, {len(rows)} examples)")
+
+
+if __name__ == "__main__":
+    main()
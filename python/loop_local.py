@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import weakref
+from typing import Callable, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LoopLocal(Generic[T]):
+    """
+    One value per running event loop, created on first use by `factory`.
+
+    asyncio primitives and connection pools are bound to the loop that first
+    uses them. Process-wide singletons are shared by callers that each run
+    their own loop (Streamlit keeps one per browser session, the terminal
+    chatbot and benchmarks call asyncio.run), so their loop-bound state must
+    not be shared. Values are dropped together with their loop.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._values: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        """The running loop's value; must be called from a coroutine."""
+        loop = asyncio.get_running_loop()
+        value = self._values.get(loop)
+        if value is None:
+            with self._lock:
+                value = self._values.get(loop)
+                if value is None:
+                    value = self._values[loop] = self._factory()
+        return value
+
+    def pop(self) -> Optional[T]:
+        """Removes and returns the running loop's value, if it has one."""
+        with self._lock:
+            return self._values.pop(asyncio.get_running_loop(), None)
+
+    def values(self) -> List[T]:
+        with self._lock:
+            return list(self._values.values())
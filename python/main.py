@@ -1,11 +1,10 @@
 import os
-import uuid
+import sys
 import logging
 from typing import List, Dict, Any, Optional, Union
 
-import uvicorn
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body, WebSocket, WebSocketDisconnect, Form
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, WebSocket, WebSocketDisconnect, Form, Request
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, validator
 from dotenv import load_dotenv
@@ -28,8 +27,23 @@ load_dotenv()
 # --- Import functionalities from your scripts ---
 
 # Chatbot imports
-from Student_chatbot.Student_AI_tutor import AsyncRAGTutor, RAGTutorConfig
+from Student_chatbot.Student_AI_tutor import AsyncRAGTutor, RAGTutorConfig, VectorStoreManager
 from AI_tutor import TeacherAsyncRAGTutor, TeacherRAGTutorConfig
+from fast_path import FAST_PATH_MARKER
+from tutor_graph import get_orchestrator_graph
+from model_clients import get_model_registry
+from conversation_store import ConversationManager, create_conversation_store
+from semantic_cache import semantic_cache_metrics
+from embedding_cache import embedding_cache_metrics
+from embedding_pipeline import embedding_scheduler_metrics
+from content_cache import parsed_cache_metrics
+from document_parsing import document_parser_metrics, get_document_parser
+from sse import sse_response
+from session_manager import SessionLease, SessionLimits, SessionManager, estimate_tutor_memory
+from session_state import TutorSessionState, create_session_state_store, purge_expired_sessions
+from tutor_pool import TutorPool, pool_size_from_env
+from image_delivery import parse_progress_chunk
+from admission import AdmissionController, AdmissionRejected, SessionBusy, SessionGate
 
 
 # Assessment generation imports
@@ -60,7 +74,7 @@ except Exception as e:
     logger.warning(f"Perplexity chat not initialized: {e}")
 
 # Import the cloud storage manager
-from storage import CloudflareR2Storage
+from storage import CloudflareR2Storage, LOCAL_MEDIA_ROUTE, verify_local_media_signature
 
 
 # --- FastAPI App Initialization ---
@@ -88,9 +102,84 @@ try:
     storage_manager = CloudflareR2Storage()
     logger.info("✅ Cloudflare R2 storage manager initialized.")
 
-    # Initialize Tutor Sessions Dictionary
-    tutor_sessions: Dict[str, AsyncRAGTutor] = {}
-    teacher_sessions: Dict[str, TeacherAsyncRAGTutor] = {} # New: Dictionary to store teacher sessions
+    # Bounded session registries (SESSION_MAX_SESSIONS / SESSION_IDLE_TTL_SECONDS / SESSION_MAX_MEMORY_MB).
+    # Evicted tutors shut down their thread pool, drop their retrievers and, unless
+    # SESSION_DELETE_COLLECTIONS=false, delete their Qdrant collection.
+    delete_session_collections = os.getenv("SESSION_DELETE_COLLECTIONS", "true").lower() == "true"
+
+    # Persisted session records, so any worker can rebuild a session (SESSION_STATE_STORE=memory|sqlite).
+    # Running several workers also needs CONVERSATION_STORE=sqlite for the chat history.
+    session_state_store = create_session_state_store()
+    student_session_state = TutorSessionState(session_state_store, "student")
+    teacher_session_state = TutorSessionState(session_state_store, "teacher")
+
+    def _tutor_teardown(session_state: TutorSessionState):
+        async def teardown(session_id: str, tutor: Any):
+            # With a shared state store another worker may still serve the session, so its
+            # collection is only deleted once the session has been idle everywhere.
+            delete = delete_session_collections and (
+                not session_state_store.shared
+                or await session_state.is_expired(session_id, session_limits.idle_ttl_seconds)
+            )
+            await tutor.aclose(delete_collection=delete)
+            if delete:
+                await session_state.forget(session_id)
+                # The chat history is stored under the same '<kind>:<session_id>' key as the record.
+                await conversation_manager.clear(session_state.key(session_id))
+        return teardown
+
+    def _build_student_tutor() -> AsyncRAGTutor:
+        tutor_config = RAGTutorConfig.from_env()
+        tutor_config.web_search_enabled = True  # Always enable web search
+        return AsyncRAGTutor(storage_manager=storage_manager, config=tutor_config)
+
+    def _build_teacher_tutor() -> TeacherAsyncRAGTutor:
+        teacher_config = TeacherRAGTutorConfig.from_env()
+        teacher_config.web_search_enabled = True  # Always enable web search
+        return TeacherAsyncRAGTutor(storage_manager=storage_manager, config=teacher_config)
+
+    # Warm pools of ready tutor shells, so a new session does not pay for construction
+    # on its first request (TUTOR_POOL_SIZE_STUDENT / TUTOR_POOL_SIZE_TEACHER; 0 disables).
+    student_tutor_pool = TutorPool(
+        "student tutor", _build_student_tutor, pool_size_from_env("student", 4), prepare=AsyncRAGTutor.setup_langgraph_async
+    )
+    teacher_tutor_pool = TutorPool(
+        "teacher tutor", _build_teacher_tutor, pool_size_from_env("teacher", 2), prepare=TeacherAsyncRAGTutor.setup_langgraph_async
+    )
+    tutor_pools = [student_tutor_pool, teacher_tutor_pool]
+
+    session_limits = SessionLimits.from_env()
+    tutor_sessions: SessionManager[AsyncRAGTutor] = SessionManager(
+        "student tutor", lambda session_id: student_tutor_pool.take(), session_limits,
+        _tutor_teardown(student_session_state), estimate_tutor_memory
+    )
+    teacher_tutor_sessions: SessionManager[TeacherAsyncRAGTutor] = SessionManager(
+        "teacher tutor", lambda session_id: teacher_tutor_pool.take(), session_limits,
+        _tutor_teardown(teacher_session_state), estimate_tutor_memory
+    )
+    # Bulk data uploaded by teachers for their voice sessions, keyed by teacher name
+    teacher_sessions: SessionManager[Dict[str, Any]] = SessionManager("teacher data", limits=session_limits)
+    all_session_managers = [tutor_sessions, teacher_tutor_sessions, teacher_sessions]
+
+    # One request at a time per tutor session; SESSION_CONCURRENCY_POLICY=queue|reject|cancel decides
+    # what happens to a request that arrives while the session is busy.
+    session_gate = SessionGate(
+        os.getenv("SESSION_CONCURRENCY_POLICY", "queue").lower(),
+        int(os.getenv("SESSION_QUEUE_MAX", "4"))
+    )
+    # Concurrency caps per endpoint class (ADMISSION_LIMIT_CHAT / _INGEST / _GENERATION);
+    # excess requests get 429 + Retry-After instead of waiting on upstream LLM quotas.
+    admission = AdmissionController.from_env()
+
+    # Server-side chat history with rolling summaries (CONVERSATION_STORE=memory|sqlite)
+    conversation_manager = ConversationManager(
+        create_conversation_store(),
+        keep_recent=int(os.getenv("CONVERSATION_KEEP_RECENT", "6"))
+    )
+
+    # Compile the tutor orchestrator graph once; every session reuses it
+    get_orchestrator_graph()
+    logger.info("✅ Tutor orchestrator graph compiled.")
 
     # Initialize other components
     slide_generator = SlideSpeakGenerator()
@@ -110,6 +199,66 @@ except Exception as e:
     logger.error(f"❌ Error initializing global components: {e}", exc_info=True)
     raise
 
+async def _open_tutor_session(sessions: SessionManager, session_state: TutorSessionState, session_id: str) -> SessionLease:
+    """
+    Returns a lease on the session's tutor, rehydrated from the session-state store on first use
+    on this worker. The tutor is pinned before rehydration starts, so eviction cannot tear it down
+    under the request; the caller releases the lease (`async with lease`) when the request is done.
+    """
+    lease = sessions.acquire(session_id)
+    try:
+        await session_state.restore(session_id, lease.value)
+    except BaseException:
+        lease.release()
+        raise
+    return lease
+
+def _ingest_lane(session_key: str) -> str:
+    """Session-gate key that serializes a session's uploads; its chat turns use the session key itself."""
+    return f"{session_key}:ingest"
+
+async def _delete_collection(collection_name: str):
+    config = RAGTutorConfig.from_env()
+    config.qdrant_collection_name = collection_name
+    await VectorStoreManager(config).delete_collection_async()
+
+async def _purge_expired_session_state(interval_seconds: float):
+    """Deletes records (and collections) of sessions idle on every worker, including ones no worker holds any more."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            collection_deleter = _delete_collection if delete_session_collections else None
+            purged = await purge_expired_sessions(
+                session_state_store, session_limits.idle_ttl_seconds, collection_deleter, conversation_manager.clear
+            )
+            if purged:
+                logger.info(f"Purged {purged} expired session record(s)")
+        except Exception as e:
+            logger.error(f"Error purging expired session state: {e}")
+
+@app.on_event("startup")
+async def start_session_sweepers():
+    """Evicts idle sessions in the background, even when no new sessions are created."""
+    interval = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+    for manager in all_session_managers:
+        manager.start_sweeper(interval)
+    for pool in tutor_pools:
+        pool.replenish()
+    if session_state_store.shared:
+        app.state.session_purge_task = asyncio.create_task(_purge_expired_session_state(interval))
+
+@app.on_event("shutdown")
+async def close_sessions():
+    purge_task = getattr(app.state, "session_purge_task", None)
+    if purge_task is not None:
+        purge_task.cancel()
+    for manager in all_session_managers:
+        await manager.close()
+    for pool in tutor_pools:
+        # Pool shells never created a collection, so there is nothing to delete in Qdrant.
+        await pool.close(lambda tutor: tutor.aclose())
+    get_document_parser().shutdown()
+
 # ==============================
 # 1. HEALTH CHECK ENDPOINT
 # ==============================
@@ -119,9 +268,42 @@ async def health_check():
     return {
         "status": "healthy",
         "message": "AI Education Platform API is running",
-        "timestamp": "2024-01-01T00:00:00Z"
+        "timestamp": "2024-01-01T00:00:00Z",
+        "model_clients": get_model_registry().stats(),
+        "semantic_cache": semantic_cache_metrics(),
+        "embedding_cache": embedding_cache_metrics(),
+        "embedding_scheduler": embedding_scheduler_metrics(),
+        "parsed_cache": parsed_cache_metrics(),
+        "document_parser": document_parser_metrics(),
+        "sessions": {manager.name: manager.metrics() for manager in all_session_managers},
+        "tutor_pools": {pool.name: pool.metrics() for pool in tutor_pools},
+        "admission": admission.metrics(),
+        "session_gate": session_gate.metrics()
     }
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(SessionBusy)
+async def session_busy_handler(request: Request, exc: SessionBusy):
+    return JSONResponse(status_code=409, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+@app.get(LOCAL_MEDIA_ROUTE + "/{key:path}")
+async def local_media_endpoint(key: str, expires: int, signature: str):
+    """
+    Serves generated images kept in local storage (when R2 is unavailable) through
+    the short-lived signed URLs handed out by the storage manager.
+    """
+    if not key.startswith("generated/") or ".." in key.split("/"):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not verify_local_media_signature(key, expires, signature):
+        raise HTTPException(status_code=403, detail="Link expired or invalid")
+    local_path = os.path.join("local_storage", key)
+    if not os.path.isfile(local_path):
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(local_path, headers={"Cache-Control": "private, max-age=3600"})
+
 # ==============================
 # 2. VOICE FUNCTIONALITY ENDPOINTS
 # ==============================
@@ -135,31 +317,16 @@ async def voice_realtime_endpoint():
     This streams audio in real-time like ChatGPT.
     """
     async def event_stream():
-        import json
-        import asyncio
-        
-        
-        async def send(obj: dict):
-            yield f"data: {json.dumps(obj)}\n\n"
-
         try:
             # This simulates the real-time voice interaction
             # In a real implementation, you'd stream audio chunks here
-            async for part in send({"type": "voice_ready", "message": "Voice system ready"}):
-                yield part
+            yield {"type": "voice_ready", "message": "Voice system ready"}
 
         except Exception as e:
             logger.error(f"Error in real-time voice stream: {e}", exc_info=True)
-            async for part in send({"type": "error", "message": str(e)}):
-                yield part
-
-    headers = {
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "Content-Type": "text/event-stream",
-        "X-Accel-Buffering": "no",
-    }
-    return StreamingResponse(event_stream(), headers=headers, media_type="text/event-stream")
+            yield {"type": "error", "message": str(e)}
+
+    return sse_response(event_stream())
 
 # Update the voice chat endpoint to use real-time processing
 
@@ -508,18 +675,32 @@ class StudentData(BaseModel):
 class ChatbotRequest(BaseModel):
     session_id: str = Field(..., description="A unique identifier for the chat session. This maintains the context and knowledge base for the user.")
     query: str = Field(..., description="The user's text query to the chatbot.")  # FIXED: Remove Optional, make required
-    history: List[Dict[str, Any]] = Field([], description="A list of previous messages in the chat history.")
+    history: List[Dict[str, Any]] = Field([], description="A list of previous messages in the chat history. Optional: when empty, the server-side conversation for this session_id is used.")
     web_search_enabled: bool = Field(True, description="Enable or disable web search functionality for the tutor.")  # Changed default to True
     student_data: Optional[StudentData] = Field(None, description="Comprehensive student data for personalized learning")
     uploaded_files: Optional[List[str]] = Field([], description="List of uploaded file names for context")
 
+async def _record_assistant_turn(conversation_key: str, answer_parts: List[str]):
+    """Stores the streamed answer in the conversation store and refreshes the rolling summary."""
+    # Generated images are not kept in history; only a note that one was shown.
+    answer = "".join(
+        "[An image was generated and shown to the user.]" if part.startswith("__IMAGE_RESPONSE__") else part
+        for part in answer_parts
+    )
+    await conversation_manager.append(conversation_key, "assistant", answer)
+    conversation_manager.schedule_summary(conversation_key)
+
 @app.post("/chatbot_endpoint")
-async def chatbot_endpoint(request: ChatbotRequest):
+@admission.admitted("chat")
+async def chatbot_endpoint(request: ChatbotRequest, http_request: Request):
     """
     Handles interactions with the AI tutor with JSON-only requests.
     Streaming text responses, no audio files.
     Enhanced with student data for personalized learning.
     """
+    # Reject before the stream starts if the session is busy and the policy does not wait (409).
+    session_gate.check(f"student:{request.session_id}")
+    lease: Optional[SessionLease] = None
     try:
         logger.info(f"Chatbot endpoint called with session_id: {request.session_id}")
         logger.info(f"Query: {request.query}")
@@ -527,14 +708,9 @@ async def chatbot_endpoint(request: ChatbotRequest):
         
         session_id = request.session_id
         
-        # Get or create a tutor instance for the session
-        if session_id not in tutor_sessions:
-            logger.info(f"Creating new AI Tutor session: {session_id}")
-            tutor_config = RAGTutorConfig.from_env()
-            tutor_config.web_search_enabled = True  # Always enable web search
-            tutor_sessions[session_id] = AsyncRAGTutor(storage_manager=storage_manager, config=tutor_config)
-        
-        tutor = tutor_sessions[session_id]
+        # Get or create a tutor instance for the session; it stays pinned until the answer has streamed
+        lease = await _open_tutor_session(tutor_sessions, student_session_state, session_id)
+        tutor = lease.value
 
         # Always enable web search for the tutor
         tutor.update_web_search_status(True)
@@ -546,7 +722,12 @@ async def chatbot_endpoint(request: ChatbotRequest):
 
         # Prepare enhanced context with student data
         enhanced_query = request.query
-        enhanced_history = request.history.copy()
+        # Clients may send only the new message; the server then supplies the stored conversation.
+        conversation_key = f"student:{session_id}"
+        if request.history:
+            enhanced_history = request.history.copy()
+        else:
+            enhanced_history = await conversation_manager.get_history(conversation_key)
         
         if request.student_data:
             student_data = request.student_data
@@ -593,40 +774,58 @@ async def chatbot_endpoint(request: ChatbotRequest):
             image_storage_key=None,  # No image upload in this flow
             is_knowledge_base_ready=is_kb_ready,
             uploaded_files=request.uploaded_files,
-            student_details=request.student_data.model_dump() if request.student_data else None
+            student_details=request.student_data.model_dump() if request.student_data else None,
+            raw_query=request.query
         )
 
         async def event_stream():
-            import json
-            async def send(obj: dict):
-                yield f"data: {json.dumps(obj)}\n\n"
-            try:
-                async for chunk in response_generator:
-                    if not chunk:
-                        continue
-                    async for part in send({"type": "text_chunk", "content": chunk}):
-                        yield part
-                async for part in send({"type": "done"}):
-                    yield part
-            except Exception as e:
-                logger.error(f"Error in chatbot stream: {e}", exc_info=True)
-                async for part in send({"type": "error", "message": str(e)}):
-                    yield part
-
-        headers = {
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream",
-            "X-Accel-Buffering": "no",
-        }
-        return StreamingResponse(event_stream(), headers=headers, media_type="text/event-stream")
+            answer_parts = []
+            # The session cannot be evicted while its answer is streaming, and runs one request at a time.
+            async with lease:
+                await conversation_manager.append(conversation_key, "user", request.query)
+                try:
+                    async with session_gate.hold(conversation_key) as turn:
+                        async for chunk in response_generator:
+                            if turn.cancelled:
+                                # A newer request for this session replaced this one (SESSION_CONCURRENCY_POLICY=cancel).
+                                await response_generator.aclose()
+                                yield {"type": "cancelled", "message": "Superseded by a newer request"}
+                                return
+                            if not chunk:
+                                continue
+                            if chunk == FAST_PATH_MARKER:
+                                # Let the frontend know this turn skipped the full agent pipeline.
+                                yield {"type": "fast_path"}
+                                continue
+                            progress = parse_progress_chunk(chunk)
+                            if progress is not None:
+                                # Image generation status; the image itself follows as a URL, not inline base64.
+                                yield {"type": "image_progress", **progress}
+                                continue
+                            answer_parts.append(chunk)
+                            yield {"type": "text_chunk", "content": chunk}
+                    yield {"type": "done"}
+                except SessionBusy as e:
+                    yield {"type": "error", "message": str(e)}
+                except Exception as e:
+                    logger.error(f"Error in chatbot stream: {e}", exc_info=True)
+                    yield {"type": "error", "message": str(e)}
+                finally:
+                    # Also runs when the client disconnects, so partial answers are kept.
+                    await _record_assistant_turn(conversation_key, answer_parts)
+
+        # Text chunks are coalesced and encoded by the shared SSE writer.
+        return sse_response(event_stream(), http_request)
 
     except Exception as e:
+        if lease is not None:
+            lease.release()
         logger.error(f"Error in chatbot endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # NEW: Document upload endpoint for chatbot
 @app.post("/upload_documents_endpoint")
+@admission.admitted("ingest")
 async def upload_documents_endpoint(session_id: str = Form(...), files: List[UploadFile] = File(...)):
     """
     Upload documents for the chatbot session to create a knowledge base.
@@ -635,46 +834,46 @@ async def upload_documents_endpoint(session_id: str = Form(...), files: List[Upl
         if not files:
             raise HTTPException(status_code=400, detail="No files provided")
         
-        # Get or create a tutor instance for the session
-        if session_id not in tutor_sessions:
-            logger.info(f"Creating new AI Tutor session for document upload: {session_id}")
-            tutor_config = RAGTutorConfig.from_env()
-            tutor_config.web_search_enabled = True  # Always enable web search
-            tutor_sessions[session_id] = AsyncRAGTutor(storage_manager=storage_manager, config=tutor_config)
-        
-        tutor = tutor_sessions[session_id]
+        # Get or create a tutor instance for the session; it cannot be evicted while documents are ingested
+        lease = await _open_tutor_session(tutor_sessions, student_session_state, session_id)
+
+        # Ingestion waits for (and is never cancelled by) other requests of the same session.
+        async with lease as tutor, \
+                session_gate.hold(_ingest_lane(student_session_state.key(session_id)), cancellable=False), \
+                session_gate.hold(student_session_state.key(session_id), cancellable=False):
+            # Save files and get storage keys
+            storage_keys, filenames = [], {}
+            for file in files:
+                if file.filename:
+                    file_bytes = await file.read()
+
+                    # Stored under its content hash; a file already uploaded (by any session) is reused.
+                    success, storage_key, reused = await storage_manager.upload_kb_file_async(file_bytes, file.filename)
+
+                    if success:
+                        if storage_key not in storage_keys:
+                            storage_keys.append(storage_key)
+                        filenames.setdefault(storage_key, file.filename)
+                        logger.info(f"{'Reused stored' if reused else 'Uploaded'} file {file.filename} with key: {storage_key}")
+                    else:
+                        logger.error(f"Failed to upload file {file.filename} to cloud storage.")
         
-        # Save files and get storage keys
-        storage_keys = []
-        for file in files:
-            if file.filename:
-                file_bytes = await file.read()
-                safe_filename = f"{uuid.uuid4()}_{file.filename}"
-                
-                # Upload to cloud storage. These are for the KB, so is_user_doc=False
-                success, storage_key = await storage_manager.upload_file_async(file_bytes, safe_filename, is_user_doc=False)
-                
+            if storage_keys:
+                # Ingest documents into the tutor's knowledge base
+                success = await tutor.ingest_async(storage_keys, filenames=filenames)
                 if success:
-                    storage_keys.append(storage_key)
-                    logger.info(f"Uploaded file {file.filename} to cloud storage with key: {storage_key}")
+                    await student_session_state.record_ingest(session_id, tutor, storage_keys, filenames)
+                    return {
+                        "success": True,
+                        "message": f"Successfully uploaded and processed {len(storage_keys)} document(s)",
+                        "files_processed": len(storage_keys)
+                    }
                 else:
-                    logger.error(f"Failed to upload file {file.filename} to cloud storage.")
-        
-        if storage_keys:
-            # Ingest documents into the tutor's knowledge base
-            success = await tutor.ingest_async(storage_keys)
-            if success:
-                return {
-                    "success": True,
-                    "message": f"Successfully uploaded and processed {len(storage_keys)} document(s)",
-                    "files_processed": len(storage_keys)
-                }
+                    raise HTTPException(status_code=500, detail="Failed to process uploaded documents")
             else:
-                raise HTTPException(status_code=500, detail="Failed to process uploaded documents")
-        else:
-            raise HTTPException(status_code=400, detail="No valid files were successfully uploaded")
-            
-    except HTTPException:
+                raise HTTPException(status_code=400, detail="No valid files were successfully uploaded")
+
+    except (HTTPException, SessionBusy):
         raise
     except Exception as e:
         logger.error(f"Error in document upload endpoint: {e}", exc_info=True)
@@ -682,6 +881,7 @@ async def upload_documents_endpoint(session_id: str = Form(...), files: List[Upl
 
 # NEW: Document upload endpoint for TEACHER chatbot
 @app.post("/teacher_upload_document_endpoint")
+@admission.admitted("ingest")
 async def teacher_upload_document_endpoint(session_id: str = Form(...), files: List[UploadFile] = File(...)):
     """
     Upload documents for the teacher's chatbot session to create a knowledge base.
@@ -690,51 +890,138 @@ async def teacher_upload_document_endpoint(session_id: str = Form(...), files: L
         if not files:
             raise HTTPException(status_code=400, detail="No files provided")
 
-        # Get or create a TEACHER tutor instance for the session
-        if session_id not in teacher_tutor_sessions:
-            logger.info(f"Creating new Teacher AI Tutor session for document upload: {session_id}")
-            teacher_config = TeacherRAGTutorConfig.from_env()
-            teacher_config.web_search_enabled = True  # Always enable web search
-            teacher_tutor_sessions[session_id] = TeacherAsyncRAGTutor(storage_manager=storage_manager, config=teacher_config)
-
-        tutor = teacher_tutor_sessions[session_id]
-
-        # Save files and get storage keys
-        storage_keys = []
-        for file in files:
-            if file.filename:
-                file_bytes = await file.read()
-                safe_filename = f"{uuid.uuid4()}_{file.filename}"
-
-                # Upload to cloud storage. These are for the KB, so is_user_doc=False
-                success, storage_key = await storage_manager.upload_file_async(file_bytes, safe_filename, is_user_doc=False)
+        # Get or create a tutor instance for the session; it cannot be evicted while documents are ingested
+        lease = await _open_tutor_session(teacher_tutor_sessions, teacher_session_state, session_id)
+
+        # Ingestion waits for (and is never cancelled by) other requests of the same session.
+        async with lease as tutor, \
+                session_gate.hold(_ingest_lane(teacher_session_state.key(session_id)), cancellable=False), \
+                session_gate.hold(teacher_session_state.key(session_id), cancellable=False):
+            # Save files and get storage keys
+            storage_keys, filenames = [], {}
+            for file in files:
+                if file.filename:
+                    file_bytes = await file.read()
+
+                    # Stored under its content hash; a file already uploaded (by any session) is reused.
+                    success, storage_key, reused = await storage_manager.upload_kb_file_async(file_bytes, file.filename)
+
+                    if success:
+                        if storage_key not in storage_keys:
+                            storage_keys.append(storage_key)
+                        filenames.setdefault(storage_key, file.filename)
+                        logger.info(f"{'Reused stored' if reused else 'Uploaded'} file {file.filename} for teacher with key: {storage_key}")
+                    else:
+                        logger.error(f"Failed to upload file {file.filename} for teacher to cloud storage.")
 
+            if storage_keys:
+                # Ingest documents into the teacher's tutor's knowledge base
+                success = await tutor.ingest_async(storage_keys, filenames=filenames)
                 if success:
-                    storage_keys.append(storage_key)
-                    logger.info(f"Uploaded file {file.filename} for teacher to cloud storage with key: {storage_key}")
+                    await teacher_session_state.record_ingest(session_id, tutor, storage_keys, filenames)
+                    return {
+                        "success": True,
+                        "message": f"Successfully uploaded and processed {len(storage_keys)} document(s) for the teacher's session",
+                        "files_processed": len(storage_keys)
+                    }
                 else:
-                    logger.error(f"Failed to upload file {file.filename} for teacher to cloud storage.")
-
-        if storage_keys:
-            # Ingest documents into the teacher's tutor's knowledge base
-            success = await tutor.ingest_async(storage_keys)
-            if success:
-                return {
-                    "success": True,
-                    "message": f"Successfully uploaded and processed {len(storage_keys)} document(s) for the teacher's session",
-                    "files_processed": len(storage_keys)
-                }
+                    raise HTTPException(status_code=500, detail="Failed to process uploaded documents for the teacher's session")
             else:
-                raise HTTPException(status_code=500, detail="Failed to process uploaded documents for the teacher's session")
-        else:
-            raise HTTPException(status_code=400, detail="No valid files were successfully uploaded")
+                raise HTTPException(status_code=400, detail="No valid files were successfully uploaded")
 
-    except HTTPException:
+    except (HTTPException, SessionBusy):
         raise
     except Exception as e:
         logger.error(f"Error in teacher document upload endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _upload_stage_event(event: Dict[str, Any], filenames: Dict[str, str]) -> Dict[str, Any]:
+    """Turns a tutor ingestion event into an SSE event naming the uploaded file."""
+    event = dict(event)
+    stage = event.pop("stage")
+    key = event.pop("key", None)
+    if stage == "queryable":
+        return {"type": "kb_ready", **event}
+    return {"type": "file_stage", "file": filenames.get(key, key), "stage": stage, **event}
+
+async def _progressive_upload(sessions: SessionManager, session_state: TutorSessionState, session_id: str,
+                              files: List[UploadFile], http_request: Request):
+    """
+    Stores, parses, embeds and indexes uploaded files while streaming per-file stages
+    (stored, parsed, chunked, embedded, indexed). The knowledge base is queryable from
+    the first indexed batch on ("kb_ready"); the session's chat turns are not blocked
+    meanwhile, only its other uploads wait.
+    """
+    # Read now: the request's upload files are closed once the endpoint has returned.
+    uploads = [(file.filename, await file.read()) for file in files if file.filename]
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No files provided")
+    lane = _ingest_lane(session_state.key(session_id))
+    session_gate.check(lane)
+    lease = await _open_tutor_session(sessions, session_state, session_id)
+    tutor = lease.value
+
+    async def event_stream():
+        async with lease:
+            try:
+                async with session_gate.hold(lane, cancellable=False):
+                    storage_keys, filenames = [], {}
+                    for filename, file_bytes in uploads:
+                        # Stored under its content hash; a file already uploaded (by any session) is reused.
+                        success, storage_key, reused = await storage_manager.upload_kb_file_async(file_bytes, filename)
+                        if success:
+                            if storage_key not in storage_keys:
+                                storage_keys.append(storage_key)
+                            filenames.setdefault(storage_key, filename)
+                            yield {"type": "file_stage", "file": filename, "stage": "stored", "reused": reused}
+                        else:
+                            logger.error(f"Failed to upload file {filename} to cloud storage.")
+                            yield {"type": "file_stage", "file": filename, "stage": "failed", "error": "Could not store the file"}
+                    if not storage_keys:
+                        yield {"type": "error", "message": "No valid files were successfully uploaded"}
+                        return
+
+                    stages: asyncio.Queue = asyncio.Queue()
+                    ingest = asyncio.create_task(tutor.ingest_async(storage_keys, stages.put_nowait, filenames))
+                    ingest.add_done_callback(lambda _: stages.put_nowait(None))
+                    try:
+                        while (event := await stages.get()) is not None:
+                            yield _upload_stage_event(event, filenames)
+                    finally:
+                        # A client that disconnects does not abort the ingestion; it completes and is recorded.
+                        success = await ingest
+                        if success:
+                            await session_state.record_ingest(session_id, tutor, storage_keys, filenames)
+                    if success:
+                        yield {"type": "done", "files_processed": len(storage_keys)}
+                    else:
+                        yield {"type": "error", "message": "Failed to process uploaded documents"}
+            except SessionBusy as e:
+                yield {"type": "error", "message": str(e)}
+            except Exception as e:
+                logger.error(f"Error in streaming document upload: {e}", exc_info=True)
+                yield {"type": "error", "message": str(e)}
+
+    return sse_response(event_stream(), http_request)
+
+@app.post("/upload_documents_stream")
+@admission.admitted("ingest")
+async def upload_documents_stream(http_request: Request, session_id: str = Form(...), files: List[UploadFile] = File(...)):
+    """
+    Streaming (SSE) variant of /upload_documents_endpoint that reports each file's progress
+    and lets the student ask about the documents while they are still being embedded.
+    """
+    return await _progressive_upload(tutor_sessions, student_session_state, session_id, files, http_request)
+
+@app.post("/teacher_upload_document_stream")
+@admission.admitted("ingest")
+async def teacher_upload_document_stream(http_request: Request, session_id: str = Form(...), files: List[UploadFile] = File(...)):
+    """
+    Streaming (SSE) variant of /teacher_upload_document_endpoint that reports each file's progress
+    and lets the teacher query the documents while they are still being embedded.
+    """
+    return await _progressive_upload(teacher_tutor_sessions, teacher_session_state, session_id, files, http_request)
+
 # ==============================
 # 4. ASSESSMENT ENDPOINT
 # ==============================
@@ -756,6 +1043,7 @@ class AssessmentSchema(BaseModel):
     language: Optional[str] = Field("English", description="The language to generate the assessment in (e.g., English, Arabic)")
 
 @app.post("/assessment_endpoint", response_model=Dict[str, Any])
+@admission.admitted("generation")
 async def assessment_endpoint(schema: AssessmentSchema):
     """
     Generates a set of test questions based on the provided schema.
@@ -838,6 +1126,7 @@ class TeachingContentSchema(BaseModel):
     )
 
 @app.post("/teaching_content_endpoint", response_model=Dict[str, Any])
+@admission.admitted("generation")
 async def teaching_content_endpoint(schema: TeachingContentSchema):
     """
     Generates detailed teaching content based on the provided specifications.
@@ -877,6 +1166,7 @@ class PresentationSchema(BaseModel):
     template: str = Field("default", description="The template style for the presentation.", example="default", pattern="^(default|aurora|lavender|monarch|serene|iris|clyde|adam|nebula|bruno)$")
 
 @app.post("/presentation_endpoint", response_model=Dict[str, Any])
+@admission.admitted("generation")
 async def presentation_endpoint(schema: PresentationSchema):
     """
     Generates a SlideSpeak presentation based on the provided specifications.
@@ -942,6 +1232,7 @@ class ImageGenSchema(BaseModel):
     language: str = Field("English", description="Language for labels (e.g., English, Arabic)")
 
 @app.post("/image_generation_endpoint", response_model=Dict[str, Any])
+@admission.admitted("generation")
 async def image_generation_endpoint(schema: ImageGenSchema):
     try:
         generator = ImageGenerator()
@@ -970,6 +1261,7 @@ class WebSearchSchema(BaseModel):
     max_results: int = Field(5, description="Maximum number of results")
 
 @app.post("/web_search_endpoint", response_model=Dict[str, Any])
+@admission.admitted("generation")
 async def web_search_endpoint(schema: WebSearchSchema):
     if not pplx_chat:
         raise HTTPException(status_code=500, detail="Perplexity client not configured. Check PPLX_API_KEY.")
@@ -1023,13 +1315,9 @@ def _parse_panel_prompts(story_text: str):
     return panels
 
 @app.post("/comics_stream_endpoint")
-async def comics_stream_endpoint(schema: ComicsSchema):
+@admission.admitted("generation")
+async def comics_stream_endpoint(schema: ComicsSchema, http_request: Request):
     async def event_stream():
-        import json
-        async def send(obj: dict):
-            # SSE event
-            yield f"data: {json.dumps(obj)}\n\n"
-
         try:
             # 1) Generate story/panel prompts
             story_prompts = await run_in_threadpool(
@@ -1040,52 +1328,40 @@ async def comics_stream_endpoint(schema: ComicsSchema):
                 schema.language  # Pass language parameter
             )
             if not story_prompts:
-                async for chunk in send({"type": "error", "message": "Failed to generate story prompts."}):
-                    yield chunk
+                yield {"type": "error", "message": "Failed to generate story prompts."}
                 return
 
             # Send the full story text first
-            async for chunk in send({"type": "story_prompts", "content": story_prompts}):
-                yield chunk
+            yield {"type": "story_prompts", "content": story_prompts}
 
             # 2) Parse and send each panel prompt, then image URL per panel
             panel_prompts = _parse_panel_prompts(story_prompts)
             if not panel_prompts:
-                async for chunk in send({"type": "error", "message": "No panel prompts parsed."}):
-                    yield chunk
+                yield {"type": "error", "message": "No panel prompts parsed."}
                 return
 
             for i, prompt in enumerate(panel_prompts[:schema.num_panels]):
                 panel_index = i + 1
                 # Emit the panel prompt
-                async for chunk in send({"type": "panel_prompt", "index": panel_index, "prompt": prompt}):
-                    yield chunk
+                yield {"type": "panel_prompt", "index": panel_index, "prompt": prompt}
 
                 # Generate panel image synchronously via threadpool to avoid blocking
                 image_url = await run_in_threadpool(generate_comic_image, prompt, panel_index)
-                async for chunk in send({
+                yield {
                     "type": "panel_image",
                     "index": panel_index,
                     "url": image_url or ""
-                }):
-                    yield chunk
+                }
 
             # Done
-            async for chunk in send({"type": "done"}):
-                yield chunk
+            yield {"type": "done"}
 
         except Exception as e:
             logger.error(f"Error in comics stream: {e}", exc_info=True)
-            async for chunk in send({"type": "error", "message": str(e)}):
-                yield chunk
-
-    headers = {
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "Content-Type": "text/event-stream",
-        "X-Accel-Buffering": "no",  # for some proxies
-    }
-    return StreamingResponse(event_stream(), headers=headers, media_type="text/event-stream")
+            yield {"type": "error", "message": str(e)}
+
+    # Heartbeats keep proxies from closing the stream while panels are being drawn.
+    return sse_response(event_stream(), http_request)
 
 
 
@@ -1102,7 +1378,7 @@ class TeacherBulkDataSchema(BaseModel):
 class TeacherChatbotRequest(BaseModel):
     session_id: str = Field(..., description="A unique identifier for the chat session. This maintains the context and knowledge base for the user.")
     query: str = Field(..., description="The user's text query to the chatbot.")  # FIXED: Remove Optional, make required
-    history: List[Dict[str, Any]] = Field([], description="A list of previous messages in the chat history.")
+    history: List[Dict[str, Any]] = Field([], description="A list of previous messages in the chat history. Optional: when empty, the server-side conversation for this session_id is used.")
     teacher_data: TeacherBulkDataSchema
     web_search_enabled: bool = Field(True, description="Enable or disable web search functionality for the tutor.")  # Changed default to True
     uploaded_files: Optional[List[str]] = Field([], description="List of uploaded file names for context")
@@ -1121,13 +1397,13 @@ async def teacher_bulk_data_endpoint(schema: TeacherBulkDataSchema):
         
         # Store the teacher data in memory for the voice session
         # In production, you'd want to use Redis or a database
-        teacher_sessions[schema.teacher_name] = {
+        teacher_sessions.put(schema.teacher_name, {
             "student_details_with_reports": schema.student_details_with_reports,
             "generated_content_details": schema.generated_content_details,
             "feedback_data": schema.feedback_data,
             "learning_analytics": schema.learning_analytics,
             "timestamp": datetime.now().isoformat()
-        }
+        })
         
         return {
             "success": True,
@@ -1429,17 +1705,18 @@ async def handle_teacher_openai_responses(openai_ws, client_ws):
         logger.error(f"Error handling teacher OpenAI responses: {e}", exc_info=True)
         await client_ws.send_json({"type": "error", "message": str(e)})
 
-# Add teacher tutor sessions
-teacher_tutor_sessions: Dict[str, Any] = {}
-
 # Add teacher voice agent endpoint
 @app.post("/teacher_voice_chat_endpoint")  
-async def teacher_voice_chat_endpoint(request: TeacherChatbotRequest):
+@admission.admitted("chat")
+async def teacher_voice_chat_endpoint(request: TeacherChatbotRequest, http_request: Request):
     """
     Handles interactions with the AI tutor for teachers with JSON-only requests.
     Streaming text responses, no audio files.
     Enhanced with teacher data for personalized teaching support.
     """
+    # Reject before the stream starts if the session is busy and the policy does not wait (409).
+    session_gate.check(f"teacher:{request.session_id}")
+    lease: Optional[SessionLease] = None
     try:
         # Get comprehensive teacher data from the schema
         teacher_data = request.teacher_data.model_dump()
@@ -1471,14 +1748,9 @@ async def teacher_voice_chat_endpoint(request: TeacherChatbotRequest):
 
         session_id = request.session_id
         
-        # Get or create a teacher tutor instance for the session
-        if session_id not in teacher_tutor_sessions:
-            logger.info(f"Creating new Teacher AI Tutor session: {session_id}")
-            teacher_config = TeacherRAGTutorConfig.from_env()
-            teacher_config.web_search_enabled = True  # Always enable web search
-            teacher_tutor_sessions[session_id] = TeacherAsyncRAGTutor(storage_manager=storage_manager, config=teacher_config)
-
-        tutor = teacher_tutor_sessions[session_id]
+        # Get or create a teacher tutor instance for the session; it stays pinned until the answer has streamed
+        lease = await _open_tutor_session(teacher_tutor_sessions, teacher_session_state, session_id)
+        tutor = lease.value
 
         # Always enable web search for the tutor
         tutor.update_web_search_status(True)
@@ -1490,7 +1762,12 @@ async def teacher_voice_chat_endpoint(request: TeacherChatbotRequest):
 
         # Prepare enhanced context with student data
         enhanced_query = request.query
-        enhanced_history = request.history.copy()
+        # Clients may send only the new message; the server then supplies the stored conversation.
+        conversation_key = f"teacher:{session_id}"
+        if request.history:
+            enhanced_history = request.history.copy()
+        else:
+            enhanced_history = await conversation_manager.get_history(conversation_key)
         
         # if request.teacher_data:
         #     teacher_data = request.teacher_data
@@ -1546,35 +1823,52 @@ async def teacher_voice_chat_endpoint(request: TeacherChatbotRequest):
             image_storage_key=None,  # No image upload in this flow
             is_knowledge_base_ready=is_kb_ready,
             uploaded_files=request.uploaded_files,
-            teaching_data=request.teacher_data.model_dump() if request.teacher_data else None
+            teaching_data=request.teacher_data.model_dump() if request.teacher_data else None,
+            raw_query=request.query
         )
 
         async def event_stream():
-            import json
-            async def send(obj: dict):
-                yield f"data: {json.dumps(obj)}\n\n"
-            try:
-                async for chunk in response_generator:
-                    if not chunk:
-                        continue
-                    async for part in send({"type": "text_chunk", "content": chunk}):
-                        yield part
-                async for part in send({"type": "done"}):
-                    yield part
-            except Exception as e:
-                logger.error(f"Error in chatbot stream: {e}", exc_info=True)
-                async for part in send({"type": "error", "message": str(e)}):
-                    yield part
-
-        headers = {
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream",
-            "X-Accel-Buffering": "no",
-        }
-        return StreamingResponse(event_stream(), headers=headers, media_type="text/event-stream")
+            answer_parts = []
+            # The session cannot be evicted while its answer is streaming, and runs one request at a time.
+            async with lease:
+                await conversation_manager.append(conversation_key, "user", request.query)
+                try:
+                    async with session_gate.hold(conversation_key) as turn:
+                        async for chunk in response_generator:
+                            if turn.cancelled:
+                                # A newer request for this session replaced this one (SESSION_CONCURRENCY_POLICY=cancel).
+                                await response_generator.aclose()
+                                yield {"type": "cancelled", "message": "Superseded by a newer request"}
+                                return
+                            if not chunk:
+                                continue
+                            if chunk == FAST_PATH_MARKER:
+                                # Let the frontend know this turn skipped the full agent pipeline.
+                                yield {"type": "fast_path"}
+                                continue
+                            progress = parse_progress_chunk(chunk)
+                            if progress is not None:
+                                # Image generation status; the image itself follows as a URL, not inline base64.
+                                yield {"type": "image_progress", **progress}
+                                continue
+                            answer_parts.append(chunk)
+                            yield {"type": "text_chunk", "content": chunk}
+                    yield {"type": "done"}
+                except SessionBusy as e:
+                    yield {"type": "error", "message": str(e)}
+                except Exception as e:
+                    logger.error(f"Error in chatbot stream: {e}", exc_info=True)
+                    yield {"type": "error", "message": str(e)}
+                finally:
+                    # Also runs when the client disconnects, so partial answers are kept.
+                    await _record_assistant_turn(conversation_key, answer_parts)
+
+        # Text chunks are coalesced and encoded by the shared SSE writer.
+        return sse_response(event_stream(), http_request)
 
     except Exception as e:
+        if lease is not None:
+            lease.release()
         logger.error(f"Error in chatbot endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
@@ -1583,6 +1877,7 @@ async def teacher_voice_chat_endpoint(request: TeacherChatbotRequest):
 # ==============================
 
 @app.post("/video_presentation_endpoint", response_model=Dict[str, Any])
+@admission.admitted("generation")
 async def video_presentation_endpoint(
     pptx_file: UploadFile = File(...),
     voice_id: str = Form(...),
@@ -1640,4 +1935,7 @@ async def video_presentation_endpoint(
 # --- Uvicorn Server Runner ---
 if __name__ == "__main__":
     logger.info("Starting Uvicorn server...")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Hand over to the uvicorn CLI so this module is not the process's __main__: the document
+    # parse pool's workers re-import the __main__ script, which here would be the whole API.
+    os.execv(sys.executable, [sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000",
+                              "--app-dir", os.path.dirname(os.path.abspath(__file__))])
\ No newline at end of file
@@ -129,11 +129,27 @@ class ImageGenerator:
         try:
             # Get the enhanced prompt from GPT-4o
             prompt: str = self._rephrase_schema_to_prompt(schema)
-            
-            if not prompt:
-                print("Prompt generation failed.")
-                return None
+        except KeyError as e:
+            print(f"Error: {e}")
+            return None
+
+        if not prompt:
+            print("Prompt generation failed.")
+            return None
+
+        return self.generate_image_from_prompt(prompt)
+
+    def generate_image_from_prompt(self, prompt: str) -> str:
+        """
+        Generates an image with GPT-Image-1 from an already prepared prompt.
 
+        Args:
+            prompt: The detailed prompt, e.g. from _rephrase_schema_to_prompt.
+
+        Returns:
+            The base64 encoded string of the generated image, or None on failure.
+        """
+        try:
             print("Requesting image from OpenAI GPT-Image-1 API...")
             
             # The API call to generate an image using gpt-image-1
@@ -156,9 +172,6 @@ class ImageGenerator:
         except openai.APIError as e:
             print(f"An OpenAI API error occurred: {e}")
             return None
-        except KeyError as e:
-            print(f"Error: {e}")
-            return None
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
             return None
@@ -0,0 +1,201 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from loop_local import LoopLocal
+
+logger = logging.getLogger(__name__)
+
+OPENAI = "openai"
+GOOGLE = "google"
+PERPLEXITY = "perplexity"
+
+# Upper bound on in-flight requests per provider for the whole process.
+# Override with e.g. MODEL_MAX_CONCURRENCY_OPENAI=64.
+DEFAULT_MAX_CONCURRENCY = {OPENAI: 32, GOOGLE: 16, PERPLEXITY: 8}
+
+ClientKey = Tuple[Any, ...]
+
+
+def _key_fingerprint(api_key: Optional[str]) -> Optional[str]:
+    # Clients are keyed by the API key they were built with, without keeping the key itself in the key (or the logs).
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16] if api_key else None
+
+
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport with one connection pool per event loop: pooled connections
+    belong to the loop that opened them, and the OpenAI clients using this
+    transport are shared by callers on different loops.
+    """
+
+    def __init__(self, limits: httpx.Limits):
+        self._pools: LoopLocal[httpx.AsyncHTTPTransport] = LoopLocal(lambda: httpx.AsyncHTTPTransport(limits=limits))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._pools.get().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        # Only the running loop's pool can be closed here; other loops' pools go with their loop.
+        pool = self._pools.pop()
+        if pool is not None:
+            await pool.aclose()
+
+
+class ModelClientRegistry:
+    """
+    Process-wide registry of LLM and embedding clients.
+
+    Clients are created once per (provider, model, temperature, max_tokens,
+    API key) and shared by every tutor session, so sessions reuse the same HTTP
+    connection pools instead of opening new ones (and new TLS handshakes) per session.
+
+    Concurrency per provider is bounded:
+      * OpenAI clients share one httpx connection pool whose size is the limit,
+        so extra requests wait for a free connection instead of opening more.
+      * Other providers manage their own transports; callers wrap their calls in
+        `async_slot(provider)` / `sync_slot(provider)`.
+
+    Async connection pools and slots are kept per event loop (the server has
+    one; Streamlit runs one per browser session), so the limits apply per loop.
+    """
+
+    def __init__(self, max_concurrency: Optional[Dict[str, int]] = None):
+        self.max_concurrency = dict(DEFAULT_MAX_CONCURRENCY)
+        for provider in self.max_concurrency:
+            env_value = os.getenv(f"MODEL_MAX_CONCURRENCY_{provider.upper()}")
+            if env_value:
+                self.max_concurrency[provider] = int(env_value)
+        self.max_concurrency.update(max_concurrency or {})
+
+        self._clients: Dict[ClientKey, Any] = {}
+        self._lock = threading.Lock()
+        self._sync_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._async_slots: LoopLocal[Dict[str, asyncio.Semaphore]] = LoopLocal(dict)
+        self._http_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+        self._stats = {"created": 0, "reused": 0}
+
+    def _limit(self, provider: str) -> int:
+        return self.max_concurrency.get(provider, 8)
+
+    def _openai_http_clients(self) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """Shared sync/async connection pools used by every OpenAI chat and embedding client."""
+        if self._http_clients is None:
+            limit = self._limit(OPENAI)
+            limits = httpx.Limits(max_connections=limit, max_keepalive_connections=limit)
+            self._http_clients = (httpx.Client(limits=limits), httpx.AsyncClient(transport=_LoopLocalTransport(limits)))
+        return self._http_clients
+
+    def _get_or_create(self, key: ClientKey, factory) -> Any:
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._stats["reused"] += 1
+                return client
+            client = factory()
+            self._clients[key] = client
+            self._stats["created"] += 1
+            logger.info(f"Model client registry: created {key[0]} client for {key[1:]}")
+            return client
+
+    def chat(self, provider: str, model: str, temperature: Optional[float] = None,
+             max_tokens: Optional[int] = None, streaming: bool = True, api_key: Optional[str] = None):
+        """Returns the shared chat model for this (provider, model, temperature, max_tokens, api_key)."""
+        key = ("chat", provider, model, temperature, max_tokens, streaming, _key_fingerprint(api_key))
+
+        def factory():
+            # Unset parameters are left to the provider's defaults.
+            kwargs = {name: value for name, value in (("temperature", temperature), ("max_tokens", max_tokens))
+                      if value is not None}
+            if provider == OPENAI:
+                http_client, http_async_client = self._openai_http_clients()
+                return ChatOpenAI(
+                    model=model,
+                    streaming=streaming,
+                    # Report token usage (including cached prompt tokens) on streamed responses too.
+                    stream_usage=True,
+                    openai_api_key=api_key or os.getenv("OPENAI_API_KEY"),
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                    **kwargs
+                )
+            if provider == GOOGLE:
+                return ChatGoogleGenerativeAI(
+                    model=model,
+                    google_api_key=api_key or os.getenv("GOOGLE_API_KEY"),
+                    streaming=streaming,
+                    **kwargs
+                )
+            if provider == PERPLEXITY:
+                from langchain_perplexity import ChatPerplexity
+                return ChatPerplexity(
+                    model=model,
+                    pplx_api_key=api_key or os.getenv("PPLX_API_KEY"),
+                    streaming=streaming,
+                    **kwargs
+                )
+            raise ValueError(f"Unknown model provider: {provider}")
+
+        return self._get_or_create(key, factory)
+
+    def embeddings(self, model: str, api_key: Optional[str] = None) -> OpenAIEmbeddings:
+        """Returns the shared OpenAI embeddings client for this model and API key."""
+        key = ("embeddings", OPENAI, model, _key_fingerprint(api_key))
+
+        def factory():
+            http_client, http_async_client = self._openai_http_clients()
+            return OpenAIEmbeddings(
+                model=model,
+                openai_api_key=api_key or os.getenv("OPENAI_API_KEY"),
+                http_client=http_client,
+                http_async_client=http_async_client,
+            )
+
+        return self._get_or_create(key, factory)
+
+    @asynccontextmanager
+    async def async_slot(self, provider: str):
+        """Holds one of the provider's concurrency slots for the duration of an async call."""
+        slots = self._async_slots.get()
+        semaphore = slots.get(provider)
+        if semaphore is None:
+            semaphore = slots.setdefault(provider, asyncio.Semaphore(self._limit(provider)))
+        async with semaphore:
+            yield
+
+    @contextmanager
+    def sync_slot(self, provider: str):
+        """Holds one of the provider's concurrency slots for the duration of a blocking call."""
+        with self._lock:
+            semaphore = self._sync_slots.get(provider)
+            if semaphore is None:
+                semaphore = self._sync_slots[provider] = threading.BoundedSemaphore(self._limit(provider))
+        with semaphore:
+            yield
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts of created/reused clients, for the health endpoint and benchmarks."""
+        with self._lock:
+            return {**self._stats, "clients": len(self._clients), "max_concurrency": dict(self.max_concurrency)}
+
+
+_registry: Optional[ModelClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelClientRegistry:
+    """Returns the process-wide model client registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelClientRegistry()
+    return _registry
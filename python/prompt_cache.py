@@ -0,0 +1,60 @@
+import json
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_profile_json(profile: Any) -> str:
+    """
+    Serializes a student/teacher profile compactly and deterministically.
+
+    Sorted keys and no indentation mean the same profile always renders to the
+    same bytes (so the provider can cache the prompt prefix) with fewer tokens.
+    """
+    try:
+        return json.dumps(profile, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        return str(profile)
+
+
+def profile_hash(serialized_profile: str) -> str:
+    return hashlib.sha256(serialized_profile.encode("utf-8")).hexdigest()[:16]
+
+
+def render_volatile_suffix(formatted_time: str, session_notes: List[str]) -> str:
+    """The per-turn part of the system prompt; kept last so it never breaks the cached prefix."""
+    suffix = f"\n\n**🕒 Current Time**: {formatted_time}"
+    if session_notes:
+        suffix += "\n\n**Current Session Status:**\n" + "\n".join(session_notes)
+    return suffix
+
+
+class SystemPromptCache:
+    """
+    Per-session cache of rendered system prompt prefixes.
+
+    The prefix (persona, rules and the serialized profile) is rendered once and
+    reused until the profile hash changes or a different template is selected.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def prefix(self, template_name: str, template: str, profile_placeholder: str,
+               profile: Optional[Dict[str, Any]], empty_profile_text: str) -> str:
+        serialized = canonical_profile_json(profile) if profile else empty_profile_text
+        digest = profile_hash(serialized)
+        cached = self._entries.get(template_name)
+        if cached and cached[0] == digest:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        rendered = template.format(**{profile_placeholder: serialized}).rstrip()
+        self._entries[template_name] = (digest, rendered)
+        logger.info(f"Rendered '{template_name}' system prompt prefix for profile {digest}.")
+        return rendered
@@ -0,0 +1,80 @@
+import logging
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field
+from langchain_core.prompts import ChatPromptTemplate
+
+logger = logging.getLogger(__name__)
+
+# History entries with this role carry the rolling summary of older turns (see conversation_store).
+SUMMARY_ROLE = "summary"
+
+
+class ImageGenerationParams(BaseModel):
+    """Parameters the image generator needs, extracted from the user's request."""
+    topic: str = Field(..., description="The main subject of the image.")
+    grade_level: str = Field(..., description='Educational level, e.g. "elementary", "middle school", "high school".')
+    preferred_visual_type: str = Field(..., description='Type of visual, e.g. "diagram", "chart", "infographic".')
+    subject: str = Field(..., description='Academic subject, e.g. "biology", "physics".')
+    language: str = Field("English", description="Language for any text in the image.")
+    instructions: str = Field(..., description="Specific requirements for the image.")
+    difficulty_flag: str = Field("false", description='"true" for advanced visuals, "false" for simpler ones.')
+
+
+class RephraseRouteDecision(BaseModel):
+    """Standalone query and routing decision produced by a single LLM call."""
+    standalone_query: str = Field(..., description="The follow-up question rewritten as a clear, standalone instruction.")
+    action: Literal["use_llm_with_tools", "generate_image"] = Field(
+        ..., description="Which path should handle the standalone query."
+    )
+    image_parameters: Optional[ImageGenerationParams] = Field(
+        None, description="Required when action is 'generate_image', otherwise null."
+    )
+
+
+REPHRASE_AND_ROUTE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You prepare a student's or teacher's chat message for an AI tutor. In a single step you must (A) rewrite the follow-up question into a clear, standalone instruction and (B) decide which action should handle it.
+
+**A. Rephrasing rules (standalone_query):**
+1.  **Handle Conversational Fillers First:** If the follow-up question is a simple, common conversational phrase (e.g., "okay", "great", "thanks"), return it **UNCHANGED**. This rule overrides all others.
+2.  **Handle Visual Follow-ups:** If the follow-up question is a request for a visual representation (e.g., "explain with a diagram", "can you draw that?", "show me a chart", "generate an image"), combine it with the main topic from the chat history to create a complete, actionable command for an image generator.
+    - Example: Chat History: User: "What is the water cycle?" / Follow-up: "Can you explain it with a diagram?" -> "Generate a diagram that explains the water cycle."
+3.  **Handle Uploaded Files:** If the question is NOT a filler or a visual follow-up AND the chat history contains a System Note listing uploaded files, rewrite the question to be specifically about those files, including the filename(s).
+    - Example: System Note: The user has just uploaded 'homework_chapter_3.pdf'. / Follow-up: "can you explain this?" -> "Can you explain the content of the document 'homework_chapter_3.pdf'?"
+4.  **General Rephrasing:** Otherwise, use the chat history to create a clear, standalone question. If the question is already standalone, return it as is.
+
+**B. Routing rules (action):**
+1.  "use_llm_with_tools" - The question can be answered with standard tools like knowledge base retrieval, web search, or conversation.
+2.  "generate_image" - ONLY when the user explicitly asks to generate or create an image, diagram, chart, or visual representation.
+
+For "generate_image" you MUST fill image_parameters (topic, grade_level, preferred_visual_type, subject, language defaulting to "English", instructions, difficulty_flag defaulting to "false"). For "use_llm_with_tools" leave image_parameters empty."""),
+    ("human", """Chat History:
+{chat_history}
+
+Follow-up Question: {question}"""),
+])
+
+
+def build_rephrase_route_chain(llm: Any):
+    """Builds the fused rephrase-and-route chain returning a RephraseRouteDecision."""
+    return REPHRASE_AND_ROUTE_PROMPT | llm.with_structured_output(RephraseRouteDecision)
+
+
+def format_chat_history(history: List[Dict[str, Any]], uploaded_files: Optional[List[str]] = None, max_messages: int = 4) -> str:
+    """
+    Formats the tail of the conversation (plus any uploaded-file note) for the rephrase prompt.
+    A rolling summary of older turns, if present, is always kept ahead of the tail.
+    """
+    parts = []
+    if uploaded_files:
+        files_str = "', '".join(uploaded_files)
+        parts.append(f"System Note: The user has just uploaded the following file(s): '{files_str}'. The follow-up question likely refers to these files.\n")
+    history = history or []
+    for msg in history:
+        if msg.get("role") == SUMMARY_ROLE:
+            parts.append(f"Summary of the earlier conversation: {msg.get('content', '')}\n")
+    recent = [msg for msg in history if msg.get("role") != SUMMARY_ROLE]
+    for msg in recent[-max_messages:]:
+        role = "AI" if msg.get("role") in ["assistant", "ai"] else "User"
+        parts.append(f"{role}: {msg.get('content', '')}")
+    return "\n".join(parts)
@@ -0,0 +1,167 @@
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ScopeKey = Tuple[str, str]
+
+_ARABIC_PATTERN = re.compile(r"[؀-ۿ]")
+# Replay granularity: a word plus its trailing whitespace, similar to model token deltas.
+_REPLAY_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+def detect_language(text: str) -> str:
+    """Coarse language tag used only to keep cached answers apart."""
+    return "ar" if _ARABIC_PATTERN.search(text or "") else "en"
+
+
+def _grade(student_details: Optional[Dict]) -> str:
+    return str((student_details or {}).get("grade") or "").strip()
+
+
+def cache_scope(student_details: Optional[Dict], query: str) -> ScopeKey:
+    """
+    Answers are only shared between students of the same grade who ask in the same
+    language. Requests carry no language field, so it is detected from the query.
+    """
+    return _grade(student_details).lower(), detect_language(query)
+
+
+def shared_profile(student_details: Optional[Dict]) -> Optional[Dict]:
+    """
+    The only student details an answer that may be cached is generated with: the
+    scope's grade. Progress, assessments or names must not end up in answers
+    replayed to other students.
+    """
+    grade = _grade(student_details)
+    return {"grade": grade} if grade else None
+
+
+@dataclass
+class CachedAnswer:
+    scope: ScopeKey
+    query: str
+    embedding: np.ndarray
+    answer: str
+    created_at: float
+    generation_seconds: float
+
+
+class SemanticAnswerCache:
+    """
+    Process-wide cache of tutor answers, looked up by query-embedding similarity.
+
+    Entries are grouped by scope (grade, language) and evicted by TTL and
+    LRU size. Lookups are a single matrix-vector product over the scope's entries.
+    """
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 86400.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._matrices: Dict[ScopeKey, Tuple[List[int], np.ndarray]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "stores": 0, "evictions": 0, "latency_saved_seconds": 0.0}
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _scope_matrix(self, scope: ScopeKey) -> Tuple[List[int], Optional[np.ndarray]]:
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry.scope == scope]
+            matrix = np.stack([self._entries[i].embedding for i in ids]) if ids else None
+            cached = self._matrices[scope] = (ids, matrix)
+        return cached
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            self._matrices.pop(entry.scope, None)
+
+    def lookup(self, scope: ScopeKey, embedding: List[float], threshold: float) -> Optional[Tuple[CachedAnswer, float]]:
+        """Returns the most similar live entry in the scope if its cosine similarity reaches `threshold`."""
+        query_vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            self.stats["lookups"] += 1
+            ids, matrix = self._scope_matrix(scope)
+            if matrix is None:
+                return None
+            similarities = matrix @ query_vector
+            for index in np.argsort(-similarities):
+                similarity = float(similarities[index])
+                if similarity < threshold:
+                    return None
+                entry_id = ids[index]
+                entry = self._entries.get(entry_id)
+                if entry is None:
+                    continue
+                if now - entry.created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    self.stats["evictions"] += 1
+                    continue
+                self._entries.move_to_end(entry_id)
+                self.stats["hits"] += 1
+                self.stats["latency_saved_seconds"] += entry.generation_seconds
+                return entry, similarity
+        return None
+
+    def store(self, scope: ScopeKey, query: str, embedding: List[float], answer: str, generation_seconds: float) -> None:
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = CachedAnswer(scope, query, self._normalize(embedding), answer, time.time(), generation_seconds)
+            self._matrices.pop(scope, None)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self.stats["evictions"] += 1
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.stats["lookups"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+async def replay_answer(answer: str) -> AsyncGenerator[str, None]:
+    """Streams a cached answer in word-sized chunks so clients see the usual token stream."""
+    for match in _REPLAY_PATTERN.finditer(answer):
+        yield match.group(0)
+        await asyncio.sleep(0)
+
+
+_cache: Optional[SemanticAnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_answer_cache(max_entries: int = 2000, ttl_seconds: float = 86400.0) -> SemanticAnswerCache:
+    """Returns the process-wide cache; size and TTL are taken from the first caller."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticAnswerCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    return _cache
+
+
+def semantic_cache_metrics() -> Optional[Dict[str, float]]:
+    """Metrics for the health endpoint, or None while the cache has never been used."""
+    return _cache.metrics() if _cache is not None else None
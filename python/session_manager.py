@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, Set, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Baseline for a tutor session: LLM wrappers, tool bindings, prompt caches and its thread pool.
+TUTOR_BASE_BYTES = 2 * 1024 * 1024
+
+
+def estimate_tutor_memory(tutor: Any) -> int:
+    """
+    Rough resident size of a tutor session: a fixed baseline plus its BM25 index
+    (postings and stored chunk text; about twice the raw text for other BM25 retrievers).
+    """
+    size = TUTOR_BASE_BYTES
+    bm25_index = getattr(tutor, "bm25_index", None)
+    if bm25_index is not None:
+        return size + bm25_index.memory_bytes()
+    retrievers = getattr(getattr(tutor, "ensemble_retriever", None), "retrievers", None) or []
+    for retriever in retrievers:
+        for doc in getattr(retriever, "docs", None) or []:
+            size += 2 * len(doc.page_content)
+    return size
+
+
+def estimate_json_memory(value: Any) -> int:
+    """Size estimate for plain session data (dicts/lists of JSON-like values)."""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+@dataclass
+class _SessionEntry(Generic[T]):
+    value: T
+    created_at: float
+    last_used: float
+    size_bytes: int = 0
+    in_use: int = 0
+
+
+@dataclass
+class SessionLimits:
+    max_sessions: int = 200
+    idle_ttl_seconds: float = 3600.0
+    max_memory_bytes: int = 1024 * 1024 * 1024
+
+    @classmethod
+    def from_env(cls, prefix: str = "SESSION") -> "SessionLimits":
+        """Reads <PREFIX>_MAX_SESSIONS, <PREFIX>_IDLE_TTL_SECONDS and <PREFIX>_MAX_MEMORY_MB."""
+        defaults = cls()
+        return cls(
+            max_sessions=int(os.getenv(f"{prefix}_MAX_SESSIONS", str(defaults.max_sessions))),
+            idle_ttl_seconds=float(os.getenv(f"{prefix}_IDLE_TTL_SECONDS", str(defaults.idle_ttl_seconds))),
+            max_memory_bytes=int(os.getenv(f"{prefix}_MAX_MEMORY_MB", str(defaults.max_memory_bytes // (1024 * 1024)))) * 1024 * 1024,
+        )
+
+
+class SessionLease(Generic[T]):
+    """
+    A session pinned against eviction until the lease is released (on leaving
+    `async with lease`). A lease dropped unreleased, e.g. by a response stream
+    that never started, is released when it is garbage collected.
+    """
+
+    def __init__(self, manager: "SessionManager[T]", session_id: str, entry: _SessionEntry[T]):
+        self.session_id = session_id
+        self.value = entry.value
+        self._manager = manager
+        self._entry = entry
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._manager._unpin(self.session_id, self._entry)
+
+    async def __aenter__(self) -> T:
+        return self.value
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+    def __del__(self):
+        if not self._released:
+            self._released = True
+            logger.warning(f"Releasing unreleased lease on {self._manager.name} session {self.session_id}")
+            self._manager._unpin(self.session_id, self._entry, enforce=False)
+
+
+class SessionManager(Generic[T]):
+    """
+    Bounded registry of per-session objects (tutors, uploaded teacher data).
+
+    Sessions are kept in LRU order and evicted when idle longer than the TTL,
+    when there are more than `max_sessions`, or when the summed size estimate
+    exceeds `max_memory_bytes`. Sessions in use by a running request are never
+    evicted. Evicted values are passed to `teardown` in a background task.
+    """
+
+    def __init__(self, name: str, factory: Optional[Callable[[str], T]] = None,
+                 limits: Optional[SessionLimits] = None,
+                 teardown: Optional[Callable[[str, T], Awaitable[None]]] = None,
+                 size_estimator: Callable[[Any], int] = estimate_json_memory):
+        self.name = name
+        self.factory = factory
+        self.limits = limits or SessionLimits()
+        self.teardown = teardown
+        self.size_estimator = size_estimator
+        self._entries: "OrderedDict[str, _SessionEntry[T]]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {
+            "created": 0, "hits": 0, "evicted_lru": 0, "evicted_ttl": 0, "evicted_memory": 0, "removed": 0,
+        }
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, session_id: str) -> Optional[T]:
+        """Returns the session's value (marking it recently used), or None."""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        self._touch(session_id, entry)
+        self.stats["hits"] += 1
+        return entry.value
+
+    def get_or_create(self, session_id: str) -> T:
+        """Returns the session's value, creating it with the factory if needed."""
+        value = self.get(session_id)
+        if value is not None:
+            return value
+        if self.factory is None:
+            raise KeyError(session_id)
+        logger.info(f"Creating new {self.name} session: {session_id}")
+        value = self.factory(session_id)
+        self.put(session_id, value)
+        self.stats["created"] += 1
+        return value
+
+    def acquire(self, session_id: str) -> SessionLease[T]:
+        """
+        Returns the session's value (created with the factory if needed) already pinned
+        against eviction, so slow setup such as rehydration cannot lose it to eviction.
+        """
+        self.get_or_create(session_id)
+        return self._pin(session_id, self._entries[session_id])
+
+    def put(self, session_id: str, value: T) -> None:
+        """Stores or replaces the session's value, then enforces the limits."""
+        now = time.monotonic()
+        previous = self._entries.pop(session_id, None)
+        if previous is not None and previous.value is not value:
+            self._schedule_teardown(session_id, previous.value)
+        self._entries[session_id] = _SessionEntry(value, now, now, self._estimate(value))
+        self._enforce_limits(keep=session_id)
+
+    def remove(self, session_id: str) -> bool:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return False
+        self.stats["removed"] += 1
+        self._schedule_teardown(session_id, entry.value)
+        return True
+
+    @asynccontextmanager
+    async def in_use(self, session_id: str):
+        """
+        Protects a resident session from eviction while a request (e.g. a stream) is using it.
+        Raises KeyError if the session is not resident; use `acquire` to pin it when it is looked up.
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            raise KeyError(f"{self.name} session {session_id} is not resident")
+        async with self._pin(session_id, entry):
+            yield
+
+    def _pin(self, session_id: str, entry: _SessionEntry[T]) -> SessionLease[T]:
+        entry.in_use += 1
+        return SessionLease(self, session_id, entry)
+
+    def _unpin(self, session_id: str, entry: _SessionEntry[T], enforce: bool = True) -> None:
+        entry.in_use -= 1
+        entry.last_used = time.monotonic()
+        # Documents may have been added during the request, so the size is re-estimated.
+        entry.size_bytes = self._estimate(entry.value)
+        if enforce:
+            self._enforce_limits(keep=session_id)
+
+    def _touch(self, session_id: str, entry: "_SessionEntry[T]") -> None:
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(session_id)
+
+    def _estimate(self, value: T) -> int:
+        try:
+            return self.size_estimator(value)
+        except Exception as e:
+            logger.warning(f"Could not estimate {self.name} session size: {e}")
+            return 0
+
+    def resident_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        entry = self._entries.pop(session_id)
+        self.stats[f"evicted_{reason}"] += 1
+        idle = time.monotonic() - entry.last_used
+        logger.info(f"Evicting {self.name} session {session_id} ({reason}, idle {idle:.0f}s, ~{entry.size_bytes // 1024} KiB)")
+        self._schedule_teardown(session_id, entry.value)
+
+    def _evictable(self, keep: Optional[str] = None):
+        return [sid for sid, entry in self._entries.items() if entry.in_use == 0 and sid != keep]
+
+    def evict_expired(self) -> int:
+        """Evicts sessions idle for longer than the TTL. Returns how many were evicted."""
+        cutoff = time.monotonic() - self.limits.idle_ttl_seconds
+        expired = [sid for sid in self._evictable() if self._entries[sid].last_used < cutoff]
+        for session_id in expired:
+            self._evict(session_id, "ttl")
+        return len(expired)
+
+    def _enforce_limits(self, keep: Optional[str] = None) -> None:
+        self.evict_expired()
+        # Oldest first; sessions busy with a request are skipped, so limits may be exceeded briefly.
+        candidates = iter(self._evictable(keep))
+        while len(self._entries) > self.limits.max_sessions:
+            session_id = next(candidates, None)
+            if session_id is None:
+                return
+            self._evict(session_id, "lru")
+        while self.resident_bytes() > self.limits.max_memory_bytes:
+            session_id = next(candidates, None)
+            if session_id is None:
+                return
+            self._evict(session_id, "memory")
+
+    def _schedule_teardown(self, session_id: str, value: T) -> None:
+        if self.teardown is None:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._run_teardown(session_id, value))
+        except RuntimeError:
+            logger.warning(f"No event loop; skipping teardown of {self.name} session {session_id}")
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_teardown(self, session_id: str, value: T) -> None:
+        try:
+            await self.teardown(session_id, value)
+        except Exception as e:
+            logger.error(f"Error tearing down {self.name} session {session_id}: {e}")
+
+    def start_sweeper(self, interval_seconds: float = 60.0) -> None:
+        """Starts a background task that evicts idle sessions even when no new requests arrive."""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep(interval_seconds))
+
+    async def _sweep(self, interval_seconds: float) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                self.evict_expired()
+            except Exception as e:
+                logger.error(f"Error sweeping {self.name} sessions: {e}")
+
+    async def close(self) -> None:
+        """Stops the sweeper and tears down every session (used at shutdown)."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        for session_id in list(self._entries):
+            self._schedule_teardown(session_id, self._entries.pop(session_id).value)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "live": len(self._entries),
+            "in_use": sum(1 for entry in self._entries.values() if entry.in_use),
+            "resident_bytes_estimate": self.resident_bytes(),
+            "max_sessions": self.limits.max_sessions,
+            "idle_ttl_seconds": self.limits.idle_ttl_seconds,
+            "max_memory_bytes": self.limits.max_memory_bytes,
+        }
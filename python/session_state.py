@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Session-level settings that can change after a tutor is created; everything else comes from the environment.
+SESSION_CONFIG_FIELDS = ("web_search_enabled",)
+# Access times are written at most this often per session, so busy sessions do not write on every request.
+TOUCH_INTERVAL_SECONDS = 30.0
+
+
+@dataclass
+class SessionRecord:
+    """
+    Everything needed to rebuild a tutor session on any worker.
+
+    The BM25 corpus is not stored separately: it is rebuilt from the chunks in
+    `collection_name`, or from `storage_keys` if the collection is gone.
+    `filenames` maps those keys to the names this session uploaded them under
+    (a deduplicated key carries the first uploader's name). Chat history lives
+    in the conversation store under the same session key.
+    """
+    session_key: str
+    collection_name: Optional[str]
+    storage_keys: List[str] = field(default_factory=list)
+    filenames: Dict[str, str] = field(default_factory=dict)
+    config: Dict[str, Any] = field(default_factory=dict)
+    version: int = 0
+    updated_at: float = 0.0
+
+
+class SessionStateStore(ABC):
+    """Backend for persisted session records, keyed by '<kind>:<session_id>'."""
+
+    # True when other processes can see the records, so a session may live on in another worker.
+    shared: bool = False
+
+    @abstractmethod
+    async def load(self, session_key: str) -> Optional[SessionRecord]:
+        """Returns the session's record, or None."""
+
+    @abstractmethod
+    async def create(self, record: SessionRecord) -> SessionRecord:
+        """Inserts the record unless one exists; returns the stored record either way."""
+
+    @abstractmethod
+    async def add_storage_keys(self, session_key: str, storage_keys: List[str], config: Dict[str, Any],
+                               filenames: Optional[Dict[str, str]] = None) -> int:
+        """Appends ingested files (and their upload names) and the current settings, bumps the version and returns it."""
+
+    @abstractmethod
+    async def touch(self, session_key: str) -> None:
+        """Records that the session was just used."""
+
+    @abstractmethod
+    async def delete(self, session_key: str) -> bool:
+        """Deletes the record; returns False if it was already gone."""
+
+    @abstractmethod
+    async def expired(self, idle_seconds: float) -> List[SessionRecord]:
+        """Records not used by any worker for longer than `idle_seconds`."""
+
+
+class InMemorySessionStateStore(SessionStateStore):
+    """Process-local backend, for a single worker and for tests."""
+
+    def __init__(self):
+        self._records: Dict[str, SessionRecord] = {}
+
+    async def load(self, session_key: str) -> Optional[SessionRecord]:
+        record = self._records.get(session_key)
+        if record is None:
+            return None
+        return replace(record, storage_keys=list(record.storage_keys), filenames=dict(record.filenames),
+                       config=dict(record.config))
+
+    async def create(self, record: SessionRecord) -> SessionRecord:
+        existing = self._records.setdefault(record.session_key, replace(record, updated_at=time.time()))
+        return await self.load(existing.session_key)
+
+    async def add_storage_keys(self, session_key: str, storage_keys: List[str], config: Dict[str, Any],
+                               filenames: Optional[Dict[str, str]] = None) -> int:
+        record = self._records.setdefault(session_key, SessionRecord(session_key, None))
+        record.storage_keys.extend(k for k in storage_keys if k not in record.storage_keys)
+        for key, name in (filenames or {}).items():
+            record.filenames.setdefault(key, name)
+        record.config.update(config)
+        record.version += 1
+        record.updated_at = time.time()
+        return record.version
+
+    async def touch(self, session_key: str) -> None:
+        record = self._records.get(session_key)
+        if record is not None:
+            record.updated_at = time.time()
+
+    async def delete(self, session_key: str) -> bool:
+        return self._records.pop(session_key, None) is not None
+
+    async def expired(self, idle_seconds: float) -> List[SessionRecord]:
+        cutoff = time.time() - idle_seconds
+        return [record for record in self._records.values() if record.updated_at < cutoff]
+
+
+class SQLiteSessionStateStore(SessionStateStore):
+    """
+    SQLite backend shared by all workers on a host; no outside services needed.
+    Blocking sqlite calls run in a worker thread.
+    """
+
+    shared = True
+
+    def __init__(self, path: str = "sessions.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_touch: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                "session_key TEXT PRIMARY KEY, collection_name TEXT, storage_keys TEXT NOT NULL DEFAULT '[]', "
+                "config TEXT NOT NULL DEFAULT '{}', version INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL, "
+                "filenames TEXT NOT NULL DEFAULT '{}')"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(session_state)")}
+            if "filenames" not in columns:
+                self._conn.execute("ALTER TABLE session_state ADD COLUMN filenames TEXT NOT NULL DEFAULT '{}'")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session_state_updated ON session_state (updated_at)")
+
+    @staticmethod
+    def _row_to_record(row) -> SessionRecord:
+        key, collection, keys, filenames, config, version, updated_at = row
+        return SessionRecord(key, collection, json.loads(keys), json.loads(filenames), json.loads(config),
+                             version, updated_at)
+
+    def _load(self, session_key: str) -> Optional[SessionRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT session_key, collection_name, storage_keys, filenames, config, version, updated_at "
+                "FROM session_state WHERE session_key = ?", (session_key,)
+            ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def _create(self, record: SessionRecord) -> SessionRecord:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO session_state "
+                "(session_key, collection_name, storage_keys, filenames, config, version, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (record.session_key, record.collection_name, json.dumps(record.storage_keys),
+                 json.dumps(record.filenames), json.dumps(record.config), record.version, time.time())
+            )
+        return self._load(record.session_key)
+
+    def _add_storage_keys(self, session_key: str, storage_keys: List[str], config: Dict[str, Any],
+                          filenames: Optional[Dict[str, str]] = None) -> int:
+        with self._lock, self._conn:
+            # The read-modify-write runs in one write transaction, so concurrent workers cannot lose keys.
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT storage_keys, filenames, config, version FROM session_state WHERE session_key = ?", (session_key,)
+            ).fetchone()
+            keys, names, stored_config, version = (
+                (json.loads(row[0]), json.loads(row[1]), json.loads(row[2]), row[3]) if row else ([], {}, {}, 0)
+            )
+            keys.extend(k for k in storage_keys if k not in keys)
+            for key, name in (filenames or {}).items():
+                names.setdefault(key, name)
+            stored_config.update(config)
+            self._conn.execute(
+                "INSERT INTO session_state (session_key, storage_keys, filenames, config, version, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(session_key) DO UPDATE SET storage_keys = excluded.storage_keys, "
+                "filenames = excluded.filenames, config = excluded.config, "
+                "version = excluded.version, updated_at = excluded.updated_at",
+                (session_key, json.dumps(keys), json.dumps(names), json.dumps(stored_config), version + 1, time.time())
+            )
+        return version + 1
+
+    def _touch(self, session_key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE session_state SET updated_at = ? WHERE session_key = ?", (time.time(), session_key))
+
+    def _delete(self, session_key: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM session_state WHERE session_key = ?", (session_key,)).rowcount > 0
+
+    def _expired(self, idle_seconds: float) -> List[SessionRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_key, collection_name, storage_keys, filenames, config, version, updated_at "
+                "FROM session_state WHERE updated_at < ?", (time.time() - idle_seconds,)
+            ).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    async def load(self, session_key: str) -> Optional[SessionRecord]:
+        return await asyncio.to_thread(self._load, session_key)
+
+    async def create(self, record: SessionRecord) -> SessionRecord:
+        return await asyncio.to_thread(self._create, record)
+
+    async def add_storage_keys(self, session_key: str, storage_keys: List[str], config: Dict[str, Any],
+                               filenames: Optional[Dict[str, str]] = None) -> int:
+        return await asyncio.to_thread(self._add_storage_keys, session_key, storage_keys, config, filenames)
+
+    async def touch(self, session_key: str) -> None:
+        now = time.monotonic()
+        if now - self._last_touch.get(session_key, 0.0) < TOUCH_INTERVAL_SECONDS:
+            return
+        self._last_touch[session_key] = now
+        await asyncio.to_thread(self._touch, session_key)
+
+    async def delete(self, session_key: str) -> bool:
+        self._last_touch.pop(session_key, None)
+        return await asyncio.to_thread(self._delete, session_key)
+
+    async def expired(self, idle_seconds: float) -> List[SessionRecord]:
+        return await asyncio.to_thread(self._expired, idle_seconds)
+
+
+def session_config(tutor: Any) -> Dict[str, Any]:
+    return {name: getattr(tutor.config, name) for name in SESSION_CONFIG_FIELDS if hasattr(tutor.config, name)}
+
+
+class TutorSessionState:
+    """
+    Keeps the tutors cached by this worker in line with the persisted session records.
+
+    A tutor is (re)hydrated lazily on first access, and again whenever another
+    worker has ingested files into the same session since.
+    """
+
+    def __init__(self, store: SessionStateStore, kind: str):
+        self.store = store
+        self.kind = kind
+        # Per-session restore lock and the number of requests holding or waiting for it;
+        # a lock is dropped only when nobody references it any more.
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+
+    def key(self, session_id: str) -> str:
+        return f"{self.kind}:{session_id}"
+
+    async def restore(self, session_id: str, tutor: Any) -> None:
+        session_key = self.key(session_id)
+        lock = self._locks.setdefault(session_key, asyncio.Lock())
+        self._lock_users[session_key] = self._lock_users.get(session_key, 0) + 1
+        try:
+            async with lock:
+                record = await self.store.load(session_key)
+                if record is None:
+                    record = await self.store.create(SessionRecord(
+                        session_key, tutor.config.qdrant_collection_name, config=session_config(tutor)
+                    ))
+                if tutor.session_state_version == record.version:
+                    await self.store.touch(session_key)
+                    return
+                if record.collection_name:
+                    tutor.config.qdrant_collection_name = record.collection_name
+                for name, value in record.config.items():
+                    setattr(tutor.config, name, value)
+                if record.storage_keys:
+                    start = time.perf_counter()
+                    await tutor.rehydrate_async(record.storage_keys, record.filenames)
+                    logger.info(f"Rehydrated {session_key} (version {record.version}) in {time.perf_counter() - start:.2f}s")
+                tutor.session_state_version = record.version
+                await self.store.touch(session_key)
+        finally:
+            self._lock_users[session_key] -= 1
+            if self._lock_users[session_key] == 0:
+                del self._lock_users[session_key]
+                del self._locks[session_key]
+
+    async def record_ingest(self, session_id: str, tutor: Any, storage_keys: List[str],
+                            filenames: Optional[Dict[str, str]] = None) -> None:
+        """Persists newly ingested files so other workers can rebuild the knowledge base."""
+        tutor.session_state_version = await self.store.add_storage_keys(
+            self.key(session_id), storage_keys, session_config(tutor), filenames
+        )
+
+    async def is_expired(self, session_id: str, idle_seconds: float) -> bool:
+        """True if no worker has used the session for `idle_seconds` (or it has no record)."""
+        record = await self.store.load(self.key(session_id))
+        return record is None or time.time() - record.updated_at > idle_seconds
+
+    async def forget(self, session_id: str) -> bool:
+        return await self.store.delete(self.key(session_id))
+
+
+async def purge_expired_sessions(store: SessionStateStore, idle_seconds: float,
+                                 delete_collection: Optional[Callable[[str], Awaitable[None]]] = None,
+                                 clear_history: Optional[Callable[[str], Awaitable[None]]] = None) -> int:
+    """
+    Deletes records of sessions no worker has used for `idle_seconds`. Only the
+    worker whose delete succeeds removes the collection and the chat history
+    (stored under the session key), so each is deleted once.
+    """
+    purged = 0
+    for record in await store.expired(idle_seconds):
+        if not await store.delete(record.session_key):
+            continue
+        purged += 1
+        if delete_collection and record.collection_name:
+            try:
+                await delete_collection(record.collection_name)
+            except Exception as e:
+                logger.error(f"Error deleting collection {record.collection_name} of {record.session_key}: {e}")
+        if clear_history:
+            try:
+                await clear_history(record.session_key)
+            except Exception as e:
+                logger.error(f"Error clearing chat history of {record.session_key}: {e}")
+    return purged
+
+
+def create_session_state_store() -> SessionStateStore:
+    """Builds the backend selected by SESSION_STATE_STORE ('memory' or 'sqlite')."""
+    backend = os.getenv("SESSION_STATE_STORE", "memory").lower()
+    if backend == "sqlite":
+        path = os.getenv("SESSION_STATE_DB_PATH", "sessions.db")
+        logger.info(f"Using SQLite session-state store at {path}")
+        return SQLiteSessionStateStore(path)
+    return InMemorySessionStateStore()
@@ -0,0 +1,181 @@
+import os
+import zlib
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+
+    def _dumps(obj: Dict[str, Any]) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # orjson is optional; the stdlib encoder produces the same wire format
+    import json
+
+    def _dumps(obj: Dict[str, Any]) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+logger = logging.getLogger(__name__)
+
+# The frontend renders a line containing this marker as an image, so it is never merged with other text.
+IMAGE_MARKER = "__IMAGE_RESPONSE__"
+HEARTBEAT_FRAME = b": ping\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Content-Type": "text/event-stream",
+    "X-Accel-Buffering": "no",  # for some proxies
+}
+
+DEFAULT_COALESCE_WINDOW = float(os.getenv("SSE_COALESCE_MS", "20")) / 1000
+DEFAULT_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "2048"))
+DEFAULT_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+GZIP_ENABLED = os.getenv("SSE_GZIP", "false").lower() == "true"
+
+
+def encode_event(obj: Dict[str, Any]) -> bytes:
+    """Encodes one event as a single SSE frame: one JSON object on one `data:` line."""
+    return b"data: " + _dumps(obj) + b"\n\n"
+
+
+def _is_text_chunk(event: Dict[str, Any]) -> bool:
+    return event.get("type") == "text_chunk" and IMAGE_MARKER not in event.get("content", "")
+
+
+_END = object()
+_timeout = getattr(asyncio, "timeout", None)  # Python 3.11+
+
+
+async def _pump(iterator: AsyncIterator[Dict[str, Any]], queue: asyncio.Queue) -> None:
+    """Moves events from the source into the queue, so timeouts never interrupt the source itself."""
+    try:
+        async for event in iterator:
+            await queue.put(event)
+    except asyncio.CancelledError:
+        # Only cancelled once the consumer has stopped reading, so nobody waits for _END.
+        raise
+    except Exception as e:
+        await queue.put(e)
+    # The queue may be full while a slow client catches up; waiting keeps the end marker from being lost.
+    await queue.put(_END)
+
+
+async def _get(queue: asyncio.Queue, timeout: Optional[float]):
+    """Next queued item, or None if `timeout` seconds pass first."""
+    if not queue.empty():
+        return queue.get_nowait()
+    try:
+        if _timeout is None:
+            return await asyncio.wait_for(queue.get(), timeout)
+        # asyncio.timeout only arms a timer, unlike wait_for which wraps the get in a new task.
+        async with _timeout(timeout):
+            return await queue.get()
+    except (TimeoutError, asyncio.TimeoutError):
+        return None
+
+
+async def coalesce_sse(
+    events: AsyncIterator[Dict[str, Any]],
+    coalesce_window: float = DEFAULT_COALESCE_WINDOW,
+    max_coalesce_bytes: int = DEFAULT_COALESCE_BYTES,
+    heartbeat_interval: Optional[float] = DEFAULT_HEARTBEAT_INTERVAL,
+) -> AsyncIterator[bytes]:
+    """
+    Turns a stream of event dicts into SSE frames.
+
+    Consecutive `text_chunk` events are merged into one event until
+    `coalesce_window` seconds have passed since the first of them or the merged
+    text reaches `max_coalesce_bytes`. Any other event flushes the pending text
+    first, so event order is preserved. A comment frame is sent when nothing has
+    been written for `heartbeat_interval` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    # Bounded, so a slow client still applies backpressure to the producer.
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+    producer = asyncio.ensure_future(_pump(iterator, queue))
+    buffer = []
+    buffered_bytes = 0
+    flush_at: Optional[float] = None
+
+    def take_text_frame() -> bytes:
+        nonlocal buffer, buffered_bytes, flush_at
+        frame = encode_event({"type": "text_chunk", "content": "".join(buffer)})
+        buffer, buffered_bytes, flush_at = [], 0, None
+        return frame
+
+    try:
+        while True:
+            timeout = max(flush_at - loop.time(), 0.0) if flush_at is not None else heartbeat_interval
+            event = await _get(queue, timeout)
+
+            if event is None:
+                # Timed out: either the coalescing window closed or the stream has been idle.
+                yield take_text_frame() if buffer else HEARTBEAT_FRAME
+                continue
+            if event is _END:
+                break
+            if isinstance(event, Exception):
+                raise event
+
+            if _is_text_chunk(event):
+                content = event.get("content", "")
+                if not content:
+                    continue
+                buffer.append(content)
+                buffered_bytes += len(content)
+                if flush_at is None:
+                    flush_at = loop.time() + coalesce_window
+                if buffered_bytes >= max_coalesce_bytes or loop.time() >= flush_at:
+                    yield take_text_frame()
+                continue
+
+            if buffer:
+                yield take_text_frame()
+            yield encode_event(event)
+
+        if buffer:
+            yield take_text_frame()
+    finally:
+        if not producer.done():
+            # Client went away: stop the source (this runs its cleanup, e.g. history recording).
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+
+
+async def _gzip_frames(frames: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip transport that sync-flushes after every frame so events are not held back."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for frame in frames:
+        yield compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def sse_response(
+    events: AsyncIterator[Dict[str, Any]],
+    request: Optional[Request] = None,
+    coalesce_window: float = DEFAULT_COALESCE_WINDOW,
+    max_coalesce_bytes: int = DEFAULT_COALESCE_BYTES,
+    heartbeat_interval: Optional[float] = DEFAULT_HEARTBEAT_INTERVAL,
+    gzip: Optional[bool] = None,
+) -> StreamingResponse:
+    """
+    Builds the StreamingResponse for an SSE endpoint from an async generator of event dicts.
+
+    Gzip is used when enabled (SSE_GZIP=true or gzip=True) and the client accepts it.
+    """
+    frames = coalesce_sse(events, coalesce_window, max_coalesce_bytes, heartbeat_interval)
+    headers = dict(SSE_HEADERS)
+    use_gzip = GZIP_ENABLED if gzip is None else gzip
+    if use_gzip and request is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        frames = _gzip_frames(frames)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(frames, headers=headers, media_type="text/event-stream")
@@ -4,6 +4,9 @@ import os
 from typing import List, Optional, Tuple, Union
 from botocore.exceptions import ClientError, EndpointConnectionError
 import hashlib
+import hmac
+import secrets
+import time
 from urllib.parse import urlparse
 import shutil
 from io import BytesIO
@@ -12,9 +15,85 @@ from dotenv import load_dotenv
 import logging
 import asyncio
 
+from content_cache import CONTENT_KEY_PREFIX, content_hash, content_key
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Locally stored files are served by the API under this route with an expiring HMAC signature.
+LOCAL_MEDIA_ROUTE = "/media"
+PUBLIC_API_BASE_URL = os.getenv("PUBLIC_API_BASE_URL", "http://localhost:8000").rstrip("/")
+# Fallback signing key when MEDIA_URL_SECRET is unset, shared by the workers of one host and kept across restarts.
+MEDIA_URL_SECRET_PATH = os.getenv("MEDIA_URL_SECRET_PATH", ".media_url_secret")
+
+
+def _runs_multiple_workers() -> bool:
+    return int(os.getenv("WEB_CONCURRENCY") or "1") > 1 or os.getenv("SESSION_STATE_STORE", "memory").lower() != "memory"
+
+
+def _persisted_media_url_secret(path: str) -> str:
+    """Reads the host's signing key, creating it first if needed (the first worker to link its file wins)."""
+    if not os.path.exists(path):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+    with open(path, "r") as f:
+        secret = f.read().strip()
+    if not secret:
+        raise ValueError(f"{path} is empty")
+    return secret
+
+
+def _load_media_url_secret() -> bytes:
+    """
+    The key signing local media URLs. Every worker must use the same one, or a URL
+    signed by one worker gets 403 from another (and links die on every restart).
+    """
+    secret = os.getenv("MEDIA_URL_SECRET")
+    if secret:
+        return secret.encode()
+    try:
+        secret = _persisted_media_url_secret(MEDIA_URL_SECRET_PATH)
+        logger.warning(f"MEDIA_URL_SECRET is not set; signing local media URLs with the key in {MEDIA_URL_SECRET_PATH}. "
+                       f"Set MEDIA_URL_SECRET when the API runs on more than one host.")
+        return secret.encode()
+    except (OSError, ValueError) as e:
+        if _runs_multiple_workers():
+            raise RuntimeError(
+                f"MEDIA_URL_SECRET is required with several workers or a shared session store "
+                f"(could not use {MEDIA_URL_SECRET_PATH}: {e})"
+            ) from e
+        logger.warning(f"MEDIA_URL_SECRET is not set and {MEDIA_URL_SECRET_PATH} is unusable ({e}); "
+                       f"local media URLs will stop working after a restart.")
+        return secrets.token_hex(32).encode()
+
+
+_MEDIA_URL_SECRET = _load_media_url_secret()
+
+
+def _local_media_signature(key: str, expires: int) -> str:
+    return hmac.new(_MEDIA_URL_SECRET, f"{key}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def local_media_url(key: str, expires_in: int = 3600) -> str:
+    """Signed, expiring URL for a file in local_storage, served by the API's media route."""
+    expires = int(time.time()) + expires_in
+    return f"{PUBLIC_API_BASE_URL}{LOCAL_MEDIA_ROUTE}/{key}?expires={expires}&signature={_local_media_signature(key, expires)}"
+
+
+def verify_local_media_signature(key: str, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_local_media_signature(key, expires), signature)
+
+
 class CloudflareR2Storage:
     def __init__(self):
         self.use_local_fallback = False
@@ -64,6 +143,61 @@ class CloudflareR2Storage:
         except Exception as e:
             return False, str(e)
 
+    def upload_generated_image(self, image_data: bytes, filename: str, content_type: str = "image/png", schedule_deletion_hours: int = 24) -> Tuple[bool, str]:
+        """Stores a generated image under generated/, in R2 or locally; returns (success, key or error)."""
+        key = f"generated/{filename}"
+        if not self.use_local_fallback and self.r2:
+            try:
+                expiration_ts = int(time.time()) + schedule_deletion_hours * 3600
+                # Expiry metadata is set on upload: schedule_deletion's metadata copy would reset the content type.
+                self.r2.upload_fileobj(
+                    BytesIO(image_data), self.bucket_name, key,
+                    ExtraArgs={"ContentType": content_type,
+                               "Metadata": {"expiration_time": str(expiration_ts), "auto_delete": "true"}}
+                )
+                return True, key
+            except Exception as e:
+                logger.error(f"R2 upload of generated image failed, storing locally: {e}")
+        try:
+            local_path = f"local_storage/{key}"
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, 'wb') as f:
+                f.write(image_data)
+            return True, key
+        except Exception as e:
+            return False, str(e)
+
+    async def upload_generated_image_async(self, image_data: bytes, filename: str, content_type: str = "image/png", schedule_deletion_hours: int = 24) -> Tuple[bool, str]:
+        """Asynchronous wrapper for upload_generated_image."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            self.upload_generated_image,
+            image_data,
+            filename,
+            content_type,
+            schedule_deletion_hours
+        )
+
+    def get_file_url(self, key: str, expires_in: int = 3600) -> Optional[str]:
+        """Short-lived URL for a stored file: a presigned R2 URL, or a signed local media URL."""
+        if os.path.exists(f"local_storage/{key}"):
+            return local_media_url(key, expires_in)
+        if self.use_local_fallback or not self.r2:
+            return None
+        try:
+            return self.r2.generate_presigned_url(
+                "get_object", Params={"Bucket": self.bucket_name, "Key": key}, ExpiresIn=expires_in
+            )
+        except Exception as e:
+            logger.error(f"Could not presign URL for {key}: {e}")
+            return None
+
+    async def get_file_url_async(self, key: str, expires_in: int = 3600) -> Optional[str]:
+        """Asynchronous wrapper for get_file_url."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_file_url, key, expires_in)
+
     def upload_file(self, file_data: bytes, filename: str, is_user_doc: bool = False, schedule_deletion_hours: int = 72) -> Tuple[bool, str]:
         folder = "user_docs" if is_user_doc else "kb"
         key = f"{folder}/{filename}"
@@ -98,6 +232,41 @@ class CloudflareR2Storage:
             schedule_deletion_hours
         )
 
+    def find_kb_content(self, digest: str) -> Optional[str]:
+        """Key of a stored knowledge-base file with this content hash, if any."""
+        prefix = f"kb/{CONTENT_KEY_PREFIX}/{digest}/"
+        if not self.use_local_fallback and self.r2:
+            try:
+                resp = self.r2.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix, MaxKeys=1)
+                if resp.get('Contents'):
+                    return resp['Contents'][0]['Key']
+            except Exception as e:
+                logger.error(f"Could not look up stored content {digest}: {e}")
+        # Also covers files that fell back to local storage while R2 was unreachable.
+        local_dir = f"local_storage/{prefix}"
+        if os.path.isdir(local_dir):
+            for name in os.listdir(local_dir):
+                return f"{prefix}{name}"
+        return None
+
+    def upload_kb_file(self, file_data: bytes, filename: str, schedule_deletion_hours: int = 72) -> Tuple[bool, str, bool]:
+        """
+        Stores a knowledge-base file under its content hash; returns (success, key or error, reused).
+        A file whose content is already stored is not uploaded again, only its expiry is extended.
+        """
+        digest = content_hash(file_data)
+        existing = self.find_kb_content(digest)
+        if existing:
+            self.schedule_deletion(existing, schedule_deletion_hours)
+            return True, existing, True
+        success, key = self.upload_file(file_data, content_key(digest, filename), False, schedule_deletion_hours)
+        return success, key, False
+
+    async def upload_kb_file_async(self, file_data: bytes, filename: str, schedule_deletion_hours: int = 72) -> Tuple[bool, str, bool]:
+        """Asynchronous wrapper for upload_kb_file."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.upload_kb_file, file_data, filename, schedule_deletion_hours)
+
     def get_file_content_bytes(self, key: str) -> Optional[bytes]:
         is_user = key.startswith("user_docs/")
         if self.use_local_fallback or not self.r2:
@@ -14,6 +14,7 @@ nest_asyncio.apply()
 
 # Import the AI tutor and its config
 from AI_tutor import AsyncRAGTutor, RAGTutorConfig
+from image_delivery import IMAGE_PROGRESS_MARKER
 
 # Configure logging
 logging.basicConfig(
@@ -304,6 +305,8 @@ async def get_response_stream_async(query: str, history: List[Dict[str, Any]], i
             uploaded_files=uploaded_files,
             teaching_data=teaching_data
         ):
+            if chunk.startswith(IMAGE_PROGRESS_MARKER):
+                continue
             yield chunk
     except Exception as e:
         logger.error(f"Error getting response stream: {e}", exc_info=True)
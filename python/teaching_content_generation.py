@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 # LangChain components
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
+from model_clients import OPENAI, get_model_registry
 
 # Import from your websearch module (using the new Perplexity search)
 from websearch_code import PerplexityWebSearchTool
@@ -204,10 +204,12 @@ async def run_generation_pipeline_async(config: dict):
     # --- LLM Initialization Block ---
     try:
         logger.info("Initializing local OpenAI LLM: gpt-4o")
-        llm = ChatOpenAI(
+        llm = get_model_registry().chat(
+            OPENAI,
             model="gpt-4o",
             temperature=0.5,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
+            streaming=False,
+            api_key=os.getenv("OPENAI_API_KEY")
         )
     except Exception as e:
         logger.error(f"Fatal: Could not initialize the OpenAI LLM. Error: {e}")
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Annotated, Any, Optional, TypedDict
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+
+from image_delivery import PROMPT_READY, RENDERING, UPLOADED, publish_generated_image
+from media_toolkit.image_generation_model import ImageGenerator
+
+logger = logging.getLogger(__name__)
+
+
+# Define the orchestrator state
+class OrchestratorState(TypedDict, total=False):
+    """State for the orchestrator agent, shared by the student and teacher tutors."""
+    messages: Annotated[list, add_messages]
+    action: Optional[str]
+    image_generation_params: Optional[dict]
+    student_details: Optional[dict]
+    teaching_data: Optional[dict]
+    history: Optional[list]  # Conversation history, used to pick the initial/follow-up prompt
+    image: Optional[str]  # Base64-encoded image attached to the question, if any
+
+
+# Define the action types
+class ActionType(str, Enum):
+    USE_LLM_WITH_TOOLS = "use_llm_with_tools"
+    GENERATE_IMAGE = "generate_image"
+
+
+def _tutor_from_config(config: RunnableConfig) -> Any:
+    """Returns the tutor instance that this run was started for."""
+    tutor = (config or {}).get("configurable", {}).get("tutor")
+    if tutor is None:
+        raise ValueError("The orchestrator graph must be run with config={'configurable': {'tutor': <tutor>}}.")
+    return tutor
+
+
+def tutor_run_config(tutor: Any, turn_info: Optional[dict] = None) -> RunnableConfig:
+    """
+    Builds the per-run config that binds the shared graph to one tutor session.
+    `turn_info`, if given, is filled by the LLM node with the tools called this turn.
+    """
+    return {"configurable": {"tutor": tutor, "turn_info": turn_info}}
+
+
+# Router node function to decide which path to take
+async def router_node(state: OrchestratorState, config: RunnableConfig) -> dict:
+    """Determine which action to take based on the user query."""
+    if state.get("action"):
+        # The fused rephrase-and-route stage already decided the action.
+        return {"action": state["action"], "image_generation_params": state.get("image_generation_params")}
+
+    tutor = _tutor_from_config(config)
+    last_message = state["messages"][-1]
+    route_start = time.perf_counter()
+    routing_decision = await tutor._route_query(last_message.content)
+    logger.info(f"Routing stage took {time.perf_counter() - route_start:.2f}s")
+
+    if routing_decision["action"] == ActionType.GENERATE_IMAGE:
+        return {"action": ActionType.GENERATE_IMAGE, "image_generation_params": routing_decision["parameters"]}
+    return {"action": ActionType.USE_LLM_WITH_TOOLS}
+
+
+# LLM with tools node function
+async def llm_with_tools_node(state: OrchestratorState, config: RunnableConfig) -> dict:
+    """Process the query with the tutor's LLM and tools, streaming chunks through the custom stream."""
+    tutor = _tutor_from_config(config)
+    last_message = state["messages"][-1]
+    formatted_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Each tutor declares which state key carries its profile (student_details / teaching_data).
+    profile_kwargs = {tutor.profile_state_key: state.get(tutor.profile_state_key)}
+
+    # Get the stream writer to send custom data
+    writer = get_stream_writer()
+    async for chunk in tutor._agent_executor_stream_async(
+        query=last_message.content,
+        formatted_time=formatted_time,
+        is_knowledge_base_ready=(tutor.ensemble_retriever is not None),
+        history=state.get("history", []),
+        image_base64=state.get("image"),
+        turn_info=config.get("configurable", {}).get("turn_info"),
+        **profile_kwargs
+    ):
+        writer(chunk)
+
+    # Return an empty AI message - the content has already been streamed
+    return {"messages": [AIMessage(content="")]}
+
+
+async def image_generator_node(state: OrchestratorState, config: RunnableConfig) -> dict:
+    """
+    Generate an image based on the parameters.
+
+    Progress is streamed as {"image_progress": {...}} chunks. The image itself is
+    uploaded to storage and streamed as a short-lived URL; the thumbnail travels
+    with the "uploaded" progress update.
+    """
+    writer = get_stream_writer()
+    try:
+        params = state.get("image_generation_params", {})
+        if not params:
+            writer("Error: Missing image generation parameters.")
+            return {"messages": [AIMessage(content="Error: Missing image generation parameters.")]}
+
+        tutor = _tutor_from_config(config)
+        image_generator = ImageGenerator()
+
+        # The OpenAI client is blocking, so both steps run in a worker thread.
+        prompt = await asyncio.to_thread(image_generator._rephrase_schema_to_prompt, params)
+        if not prompt:
+            writer("Failed to generate image. Please check parameters and try again.")
+            return {"messages": [AIMessage(content="Failed to generate image. Please check parameters and try again.")]}
+        writer({"image_progress": {"stage": PROMPT_READY, "message": "Image prompt ready."}})
+
+        writer({"image_progress": {"stage": RENDERING, "message": "Rendering the image..."}})
+        image_base64 = await asyncio.to_thread(image_generator.generate_image_from_prompt, prompt)
+
+        if image_base64:
+            published = await publish_generated_image(getattr(tutor, "storage_manager", None), image_base64)
+            if published:
+                writer({"image_progress": {
+                    "stage": UPLOADED, "message": "Image uploaded.",
+                    "url": published["url"], "thumbnail": published["thumbnail"], "expires_in": published["expires_in"],
+                }})
+                image_src = published["url"]
+            else:
+                logger.warning("Generated image could not be stored; sending it inline.")
+                image_src = f"data:image/png;base64,{image_base64}"
+            # Create a markdown image that can be rendered in the chat
+            image_md = f"![Generated Image]({image_src})"
+            # Stream the image; the flag marks it as an image response that shouldn't be stored in history
+            writer({"content": image_md, "exclude_from_history": True})
+            return {"messages": [AIMessage(content=image_md)]}
+        else:
+            writer("Failed to generate image. Please check parameters and try again.")
+            return {"messages": [AIMessage(content="Failed to generate image. Please check parameters and try again.")]}
+    except Exception as e:
+        logger.error(f"Error in image_generator_node: {e}")
+        writer(f"Error generating image: {str(e)}")
+        return {"messages": [AIMessage(content=f"Error generating image: {str(e)}")]}
+
+
+# Define the conditional edge function
+def route_by_action(state: OrchestratorState) -> str:
+    """Route to the next node based on the action determined by the router."""
+    if state.get("action") == ActionType.GENERATE_IMAGE:
+        return "image_generator"
+    return "llm_with_tools"
+
+
+def build_orchestrator_graph():
+    """Builds and compiles a new orchestrator graph. Prefer get_orchestrator_graph()."""
+    workflow = StateGraph(OrchestratorState)
+
+    workflow.add_node("router", router_node)
+    workflow.add_node("llm_with_tools", llm_with_tools_node)
+    workflow.add_node("image_generator", image_generator_node)
+
+    workflow.add_edge(START, "router")
+    workflow.add_conditional_edges("router", route_by_action)
+    workflow.add_edge("image_generator", END)
+    workflow.add_edge("llm_with_tools", END)
+
+    return workflow.compile()
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_orchestrator_graph():
+    """
+    Returns the process-wide compiled orchestrator graph, compiling it on first use.
+
+    The graph holds no session state: every run passes its tutor through
+    tutor_run_config(), so all sessions share this one object.
+    """
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = build_orchestrator_graph()
+                logger.info("LangGraph orchestrator workflow compiled (shared by all tutor sessions).")
+    return _graph
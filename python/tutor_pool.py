@@ -0,0 +1,92 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def pool_size_from_env(kind: str, default: int) -> int:
+    """Reads TUTOR_POOL_SIZE_<KIND> (e.g. TUTOR_POOL_SIZE_STUDENT); 0 disables the pool."""
+    return max(0, int(os.getenv(f"TUTOR_POOL_SIZE_{kind.upper()}", str(default))))
+
+
+class TutorPool(Generic[T]):
+    """
+    Background-maintained pool of ready, session-neutral tutor shells.
+
+    A new session takes a shell from the pool instead of paying for the tutor's
+    construction (LLM clients, tool binding, VectorStoreManager, graph) on its
+    first request. The pool is refilled in the background; shells are built in a
+    worker thread so the event loop keeps serving other sessions meanwhile.
+    """
+
+    def __init__(self, name: str, build: Callable[[], T], size: int,
+                 prepare: Optional[Callable[[T], Awaitable[Any]]] = None):
+        self.name = name
+        self.build = build
+        self.size = size
+        self.prepare = prepare
+        self._ready: Deque[T] = deque()
+        self._filling: Optional[asyncio.Task] = None
+        self.stats: Dict[str, float] = {"hits": 0, "misses": 0, "built": 0, "build_seconds": 0.0}
+
+    def take(self) -> T:
+        """Returns a ready shell, or builds one inline when the pool is empty (a miss)."""
+        if self._ready:
+            self.stats["hits"] += 1
+            shell = self._ready.popleft()
+        else:
+            self.stats["misses"] += 1
+            shell = self.build()
+        self.replenish()
+        return shell
+
+    def replenish(self) -> None:
+        """Starts a background refill unless one is already running or there is no event loop yet."""
+        if self.size <= 0 or len(self._ready) >= self.size:
+            return
+        if self._filling is not None and not self._filling.done():
+            return
+        try:
+            self._filling = asyncio.get_running_loop().create_task(self._fill())
+        except RuntimeError:
+            pass
+
+    async def _fill(self) -> None:
+        while len(self._ready) < self.size:
+            start = time.perf_counter()
+            try:
+                shell = await asyncio.to_thread(self.build)
+                if self.prepare is not None:
+                    await self.prepare(shell)
+            except Exception as e:
+                logger.error(f"Could not build a {self.name} shell for the warm pool: {e}")
+                return
+            self.stats["built"] += 1
+            self.stats["build_seconds"] += time.perf_counter() - start
+            self._ready.append(shell)
+        logger.info(f"{self.name} warm pool ready ({len(self._ready)}/{self.size})")
+
+    async def close(self, teardown: Optional[Callable[[T], Awaitable[Any]]] = None) -> None:
+        """Stops refilling and releases the idle shells."""
+        if self._filling is not None:
+            self._filling.cancel()
+        while self._ready:
+            shell = self._ready.popleft()
+            if teardown is not None:
+                await teardown(shell)
+
+    def metrics(self) -> Dict[str, Any]:
+        taken = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "ready": len(self._ready),
+            "size": self.size,
+            "hit_rate": round(self.stats["hits"] / taken, 4) if taken else 0.0,
+            "avg_build_seconds": round(self.stats["build_seconds"] / self.stats["built"], 3) if self.stats["built"] else 0.0,
+        }
@@ -8,9 +8,7 @@ from dotenv import load_dotenv
 # LangChain imports
 from langchain_core.messages import BaseMessage
 from langchain_core.tools import StructuredTool
-from langchain_perplexity import ChatPerplexity
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
+from model_clients import GOOGLE, OPENAI, PERPLEXITY, get_model_registry
 
 # LangGraph imports
 from langgraph.graph import StateGraph
@@ -62,17 +60,19 @@ class PerplexityWebSearchTool:
             raise ValueError("Perplexity API key is required. Set the PPLX_API_KEY environment variable.")
         
         try:
-            # Initialize the search tool with Perplexity chat model
-            self.chat_model = ChatPerplexity(
+            # Shared Perplexity chat model (one per model/temperature per process)
+            self.chat_model = get_model_registry().chat(
+                PERPLEXITY,
                 model=model,
                 temperature=temperature,
-                pplx_api_key=os.getenv("PPLX_API_KEY"),
                 streaming=False,
+                api_key=os.getenv("PPLX_API_KEY"),
             )
             
             # Convert the chat model to a structured tool for searching
             self.search_tool = StructuredTool.from_function(
                 func=self._search_func,
+                coroutine=self._asearch_func,
                 name="perplexity_search",
                 description="Search the web using Perplexity AI's API to find current and factual information",
                 args_schema=self._get_args_schema(),
@@ -103,7 +103,19 @@ class PerplexityWebSearchTool:
             Dictionary with search results
         """
         search_prompt = self._format_search_prompt(query)
-        response = self.chat_model.invoke(search_prompt)
+        with get_model_registry().sync_slot(PERPLEXITY):
+            response = self.chat_model.invoke(search_prompt)
+        
+        return {
+            "query": query,
+            "results": response.content,
+        }
+    
+    async def _asearch_func(self, query: str) -> Dict[str, Any]:
+        """Async variant of _search_func, used when the tool is awaited by an agent."""
+        search_prompt = self._format_search_prompt(query)
+        async with get_model_registry().async_slot(PERPLEXITY):
+            response = await self.chat_model.ainvoke(search_prompt)
         
         return {
             "query": query,
@@ -150,7 +162,8 @@ class PerplexityWebSearchTool:
             search_prompt = self._format_search_prompt(query)
             
             # Using 'ainvoke' for non-blocking I/O
-            response = await self.chat_model.ainvoke(search_prompt)
+            async with get_model_registry().async_slot(PERPLEXITY):
+                response = await self.chat_model.ainvoke(search_prompt)
             
             # Parse the response into search results format
             search_results = [{
@@ -214,10 +227,12 @@ def get_llm(model_name: str = "gpt-4o-mini", temperature: float = 0.5):
             raise ValueError("OpenAI API key is required for the fallback LLM.")
                 
         logger.info(f"Initializing OpenAI LLM: {model_name}")
-        return ChatOpenAI(
+        return get_model_registry().chat(
+            OPENAI,
             model=model_name,
             temperature=temperature,
-            openai_api_key=openai_api_key
+            streaming=False,
+            api_key=openai_api_key
             )
     except Exception as e:
         logger.warning(f"Could not initialize OpenAI LLM ({e}). Falling back to gemini-2.5-flash-lite")
@@ -227,10 +242,12 @@ def get_llm(model_name: str = "gpt-4o-mini", temperature: float = 0.5):
                 raise ValueError("GOOGLE_API_KEY environment variable not found.")
 
             logger.info(f"Initializing Google fallback LLM: gemini-2.5-flash-lite")
-            return ChatGoogleGenerativeAI(
+            return get_model_registry().chat(
+                GOOGLE,
                 model="gemini-2.5-flash-lite",
                 temperature=temperature,
-                google_api_key=google_api_key,
+                streaming=False,
+                api_key=google_api_key,
             )
         except Exception as e_google:
             logger.error(f"Fatal: Could not initialize fallback Google LLM. Error: {e_google}")